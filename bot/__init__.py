@@ -2,15 +2,32 @@ import sys
 
 import database.database   # we need it to initialize the package as soon as possible
 from .logging import logging_config
+
 from .bot import RedditBot
+from .bot import RateLimitedBot
 from .bot import DummyContext
 from .jobs.stream import check_posts
+from .jobs.stream import upload_workers
+from .connectionpool import build_requests
+from database.queries import posts
+from database.queries import reddit_request
+from reddit.sendstrategy import send_strategy
+from pyroutils import uploader
+from database.writebehind import write_behind
+from .notifier import notifier
 from config import config
 
 # from apscheduler.schedulers.background import BackgroundScheduler
 
 
-mainbot = RedditBot(token=config.telegram.token, workers=0)
+# connection pools sized on the stream job's upload workers, which are the threads that send most of the requests
+api_request, upload_request = build_requests(executor_workers=upload_workers())
+
+# all the requests to the bot API go through the shared rate limiter (see ratelimiter.py)
+mainbot = RedditBot(
+    bot=RateLimitedBot(token=config.telegram.token, request=api_request, upload_request=upload_request),
+    workers=0
+)
 
 # scheduler = BackgroundScheduler(daemon=True)
 
@@ -19,6 +36,14 @@ def main():
     # load_logging_config('logging.json')
 
     mainbot.import_handlers(r'bot/plugins/')
+
+    # so the first stream job doesn't need to query the posts table for every subreddit
+    posts.warm_cache()
+    # so choosing the least used reddit credentials doesn't need to query the reddit_requests table
+    reddit_request.warm_usage()
+    # what we learned about sending medias by url vs uploading them
+    send_strategy.warm()
+
     mainbot.job_queue.run_repeating(
         callback=check_posts,
         interval=config.jobs.stream.interval * 60,
@@ -31,7 +56,16 @@ def main():
     # scheduler.add_job(stream_job, id='stream', kwargs=dict(context=context))
     # scheduler.start()
 
-    mainbot.run(clean=True)
+    if config.pyrogram.enabled:
+        # the mtproto client is started once and kept connected, instead of connecting for every upload
+        uploader.start()
+
+    try:
+        mainbot.run(clean=True)
+    finally:
+        uploader.stop()
+        notifier.stop()
+        write_behind.stop()
 
 
 if __name__ == '__main__':
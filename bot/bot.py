@@ -7,6 +7,14 @@ from pathlib import Path
 # noinspection PyPackageRequirements
 from telegram.ext import Updater, CommandHandler, ConversationHandler
 from telegram import BotCommand, Update
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from .ratelimiter import rate_limiter
+from .ratelimiter import max_retries
+from .connectionpool import MonitoredRequest
+from .connectionpool import has_files
+from .connectionpool import request_timeout
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +30,50 @@ class DummyContext:
         self.job = DummyJob(job_name)
 
 
+class RateLimitedBot(Bot):
+    """Every request goes through the shared rate limiter. When Telegram replies with a flood wait, the limiter
+    pauses the affected bucket and the request is sent again.
+
+    Requests that upload files use their own connection pool (upload_request), so long uploads
+    do not take the connections needed by the short API calls"""
+
+    def __init__(self, *args, upload_request=None, **kwargs):
+        Bot.__init__(self, *args, **kwargs)
+        self.upload_request = upload_request or self.request
+
+    def _post(self, endpoint, data=None, timeout=None, api_kwargs=None):
+        if data is None:
+            data = {}
+
+        if api_kwargs:
+            data.update(api_kwargs)
+
+        chat_id = data.get('chat_id', None)
+        files = has_files(data)
+        request = self.upload_request if files else self.request
+        timeout = request_timeout(endpoint, files, timeout)
+
+        attempt = 0
+        while True:
+            rate_limiter.acquire(endpoint, chat_id)
+            try:
+                return request.post('{}/{}'.format(self.base_url, endpoint), data=data, timeout=timeout)
+            except RetryAfter as e:
+                if attempt >= max_retries:
+                    raise e
+
+                attempt += 1
+                rate_limiter.retry_after(endpoint, chat_id, e.retry_after)
+
+    def requests_stats(self, reset=False) -> dict:
+        stats = dict()
+        for request in (self.request, self.upload_request):
+            if isinstance(request, MonitoredRequest) and request.name not in stats:
+                stats[request.name] = request.stats(reset=reset)
+
+        return stats
+
+
 class RedditBot(Updater):
     # COMMANDS_LIST_DETECTED = []
     # COMMANDS_LIST = []
@@ -0,0 +1,117 @@
+import logging
+import threading
+
+from telegram import InputFile
+from telegram import InputMedia
+from telegram.utils.request import Request
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# methods that send a media: when the media is sent by url/file_id, Telegram may still need some time to fetch it
+MEDIA_METHODS = ('sendphoto', 'sendvideo', 'sendanimation', 'senddocument', 'sendaudio', 'sendmediagroup')
+
+
+def has_files(data) -> bool:
+    """Whether the request's data contains files that have to be uploaded"""
+
+    for key, val in (data or {}).items():
+        if isinstance(val, InputFile):
+            return True
+        elif key == 'media':
+            medias = val if isinstance(val, (list, tuple)) else [val]
+            if any(isinstance(media, InputMedia) and isinstance(media.media, InputFile) for media in medias):
+                return True
+
+    return False
+
+
+class MonitoredRequest(Request):
+    """A Request that keeps track of how many requests are using its connection pool at the same time.
+
+    urllib3 doesn't block when all the pool's connections are busy: it opens a new connection, and then throws it
+    away once the request is done. "saturated" counts the requests that had to do so"""
+
+    def __init__(self, name, *args, **kwargs):
+        Request.__init__(self, *args, **kwargs)
+        self.name = name
+        self._stats_lock = threading.Lock()
+        self._in_flight = 0
+        self._requests = 0
+        self._saturated = 0
+        self._max_in_flight = 0
+
+    def post(self, *args, **kwargs):
+        with self._stats_lock:
+            self._in_flight += 1
+            self._requests += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+            if self._in_flight > self.con_pool_size:
+                self._saturated += 1
+
+        try:
+            return Request.post(self, *args, **kwargs)
+        finally:
+            with self._stats_lock:
+                self._in_flight -= 1
+
+    def stats(self, reset=False) -> dict:
+        with self._stats_lock:
+            stats = dict(
+                pool_size=self.con_pool_size,
+                requests=self._requests,
+                max_in_flight=self._max_in_flight,
+                saturated=self._saturated
+            )
+
+            if reset:
+                self._requests = 0
+                self._saturated = 0
+                self._max_in_flight = self._in_flight
+
+        if stats['saturated']:
+            logger.warning('%s connection pool: %d requests found all the %d connections busy', self.name,
+                           stats['saturated'], stats['pool_size'])
+
+        return stats
+
+
+request_config = config.telegram.get('request', {})
+
+
+def build_requests(executor_workers: int) -> tuple:
+    """Return the Request used for the short API calls and the one used for the uploads. Their pools are sized on
+    the number of threads that send requests at the same time, so every thread can keep its connection alive"""
+
+    connect_timeout = request_config.get('connect_timeout', 5.)
+
+    api_request = MonitoredRequest(
+        'api',
+        # the stream job's upload workers (text posts), plus the dispatcher's workers, the updater and the other jobs
+        con_pool_size=request_config.get('api_pool_size', executor_workers + config.telegram.workers + 2),
+        connect_timeout=connect_timeout,
+        read_timeout=request_config.get('read_timeout', 10.)
+    )
+    upload_request = MonitoredRequest(
+        'uploads',
+        con_pool_size=request_config.get('upload_pool_size', executor_workers),
+        connect_timeout=connect_timeout,
+        read_timeout=request_config.get('upload_timeout', 360.)
+    )
+
+    return api_request, upload_request
+
+
+def request_timeout(endpoint, files, timeout=None):
+    """The read timeout of a request: the per-method timeouts from the config take precedence"""
+
+    methods_timeouts = request_config.get('timeouts', {})
+    if endpoint in methods_timeouts:
+        return methods_timeouts[endpoint]
+    elif files:
+        return request_config.get('upload_timeout', 360.)
+    elif endpoint.lower() in MEDIA_METHODS:
+        return max(timeout or 0, request_config.get('media_timeout', 120.))
+
+    return timeout
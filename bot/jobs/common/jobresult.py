@@ -1,9 +1,18 @@
+from collections import Counter
+from collections import defaultdict
+
+
 class JobResult:
-    def __init__(self, posted_messages=0, posted_bytes=0.0, canceled=False, submissions_max_index=0):
+    def __init__(self, posted_messages=0, posted_bytes=0.0, canceled=False, submissions_max_index=0,
+                 media_cache_hits=0, media_cache_misses=0):
         self.posted_messages = posted_messages
         self.posted_bytes = posted_bytes
         self.canceled = canceled
         self.submissions_max_index = submissions_max_index
+        self.media_cache_hits = media_cache_hits
+        self.media_cache_misses = media_cache_misses
+        self.resource_waits = defaultdict(float)  # resource name -> seconds spent waiting for a free slot
+        self.send_paths = Counter()  # how the medias have been sent (by url, by uploading them...) -> count
 
     def inc_messages(self, posted_messages=1):
         self.posted_messages += posted_messages
@@ -15,6 +24,23 @@ class JobResult:
         self.posted_messages += posted_messages
         self.posted_bytes += posted_bytes
 
+    def register_media_cache_lookup(self, hit):
+        if hit is None:
+            # the media was not cacheable
+            return
+
+        if hit:
+            self.media_cache_hits += 1
+        else:
+            self.media_cache_misses += 1
+
+    def add_resource_waits(self, resource_waits: dict):
+        for name, seconds in resource_waits.items():
+            self.resource_waits[name] += seconds
+
+    def add_send_paths(self, send_paths):
+        self.send_paths.update(send_paths)
+
     def save_submission_max_index(self, submissions_max_index):
         if submissions_max_index > self.submissions_max_index:
             self.submissions_max_index = submissions_max_index
@@ -25,12 +51,31 @@ class JobResult:
     def sum(self, job_result):
         self.posted_messages += job_result.posted_messages
         self.posted_bytes += job_result.posted_bytes
+        self.media_cache_hits += job_result.media_cache_hits
+        self.media_cache_misses += job_result.media_cache_misses
+        self.add_resource_waits(job_result.resource_waits)
+        self.add_send_paths(job_result.send_paths)
 
     def __add__(self, other):
-        return JobResult(
+        job_result = JobResult(
             posted_messages=self.posted_messages + other.posted_messages,
-            posted_bytes=self.posted_bytes + other.posted_bytes
+            posted_bytes=self.posted_bytes + other.posted_bytes,
+            media_cache_hits=self.media_cache_hits + other.media_cache_hits,
+            media_cache_misses=self.media_cache_misses + other.media_cache_misses
         )
+        job_result.add_resource_waits(self.resource_waits)
+        job_result.add_resource_waits(other.resource_waits)
+        job_result.add_send_paths(self.send_paths)
+        job_result.add_send_paths(other.send_paths)
+
+        return job_result
+
+    def resource_waits_string(self):
+        return ', '.join('{}: {}s'.format(name, round(seconds, 1)) for name, seconds in sorted(self.resource_waits.items())) or '-'
+
+    def send_paths_string(self):
+        return ', '.join('{}: {}'.format(path, count) for path, count in sorted(self.send_paths.items())) or '-'
 
     def __repr__(self):
-        return '<JobResult(messages={}, bytes={})>'.format(self.posted_messages, self.posted_bytes)
+        return '<JobResult(messages={}, bytes={}, media cache hits/misses: {}/{})>'.format(
+            self.posted_messages, self.posted_bytes, self.media_cache_hits, self.media_cache_misses)
@@ -0,0 +1,140 @@
+import logging
+import queue
+import threading
+import time
+
+logger = logging.getLogger('job')
+
+_STOP = object()
+
+
+class Stage:
+    """A pool of worker threads consuming a bounded queue.
+
+    Every item is passed to func(item) and then to the next stage (or to the output queue, for the last stage).
+    When the next stage's queue is full, the workers of this stage wait for a free slot: a slow stage slows down
+    the stages before it instead of piling up work in memory. Items are always forwarded, even when func raises
+    (on_error is called instead), so every item put in the first stage comes out of the last one exactly once"""
+
+    def __init__(self, name, func, workers=1, queue_size=0, on_error=None):
+        self.name = name
+        self._func = func
+        self._on_error = on_error
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [
+            threading.Thread(target=self._worker, name='{}_{}'.format(name, i), daemon=True)
+            for i in range(max(workers, 1))
+        ]
+        self._next = None  # Stage or queue.Queue
+
+        self._stats_lock = threading.Lock()
+        self._processed = 0
+        self._failed = 0
+        self._busy_seconds = 0.0
+        self._blocked_seconds = 0.0  # time spent waiting for a free slot in the next stage's queue
+        self._max_queue_size = 0
+        self._exited_workers = 0
+
+    def pipe(self, next_stage):
+        self._next = next_stage
+        return next_stage
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def put(self, item):
+        self._queue.put(item)
+        with self._stats_lock:
+            self._max_queue_size = max(self._max_queue_size, self._queue.qsize())
+
+    def close(self):
+        """Stop the workers once the queue has been consumed, then close the next stage"""
+
+        for _ in self._threads:
+            self._queue.put(_STOP)
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._worker_exited()
+                return
+
+            start = time.perf_counter()
+            failed = False
+            # noinspection PyBroadException
+            try:
+                self._func(item)
+            except Exception as e:
+                failed = True
+                if self._on_error:
+                    self._on_error(self, item, e)
+                else:
+                    logger.error('pipeline stage %s: error while processing %s', self.name, item, exc_info=True)
+
+            busy = time.perf_counter() - start
+
+            start = time.perf_counter()
+            self._next.put(item)
+            blocked = time.perf_counter() - start
+
+            with self._stats_lock:
+                self._processed += 1
+                self._failed += int(failed)
+                self._busy_seconds += busy
+                self._blocked_seconds += blocked
+
+    def _worker_exited(self):
+        with self._stats_lock:
+            self._exited_workers += 1
+            last_worker = self._exited_workers == len(self._threads)
+
+        if last_worker and isinstance(self._next, Stage):
+            self._next.close()
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(
+                workers=len(self._threads),
+                processed=self._processed,
+                failed=self._failed,
+                busy_seconds=round(self._busy_seconds, 2),
+                blocked_seconds=round(self._blocked_seconds, 2),
+                max_queue_size=self._max_queue_size
+            )
+
+
+class Pipeline:
+    """Stages chained together. Items put in the pipeline come out, once processed by all the stages, from
+    get_result()"""
+
+    def __init__(self, *stages: Stage):
+        self.stages = stages
+        self._results = queue.Queue()
+
+        for stage, next_stage in zip(stages, stages[1:]):
+            stage.pipe(next_stage)
+        stages[-1].pipe(self._results)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def put(self, item):
+        """Blocks while the first stage's queue is full"""
+
+        self.stages[0].put(item)
+
+    def close(self):
+        """No more items will be put in the pipeline: the stages stop one after the other once they are done"""
+
+        self.stages[0].close()
+
+    def get_result(self, timeout=None):
+        """Raises queue.Empty if no item comes out of the pipeline within timeout seconds"""
+
+        return self._results.get(timeout=timeout)
+
+    def stats(self) -> dict:
+        return {stage.name: stage.stats() for stage in self.stages}
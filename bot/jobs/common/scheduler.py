@@ -0,0 +1,236 @@
+import datetime
+import heapq
+import logging
+import threading
+
+from playhouse.signals import post_save, post_delete
+
+from database.models import Subreddit
+from database.models import Channel
+from utilities import u
+from config import config
+
+logger = logging.getLogger('job')
+
+NOT_VALUES = (None, False)
+
+# the only columns we need to calculate when a subreddit will be due
+SCHEDULE_FIELDS = (
+    Subreddit.id,
+    Subreddit.max_frequency,
+    Subreddit.quiet_hours_cooldown_factor,
+    Subreddit.quiet_hours_start,
+    Subreddit.quiet_hours_end,
+    Subreddit.last_post_datetime
+)
+
+
+def is_quiet_hour(quiet_hours_start, quiet_hours_end, hour):
+    """Same rules as stream.its_quiet_hours(), without the logging and for an arbitrary hour"""
+
+    if quiet_hours_start in NOT_VALUES or quiet_hours_end in NOT_VALUES:
+        return False
+
+    if quiet_hours_start >= quiet_hours_end:
+        return hour >= quiet_hours_start or hour <= quiet_hours_end
+    else:
+        return quiet_hours_start <= hour <= quiet_hours_end
+
+
+def next_eligible_datetime(subreddit: Subreddit, now: datetime.datetime) -> [datetime.datetime, None]:
+    """Return the first datetime (UTC, >= now) at which stream.is_time_to_process() would return True for the
+    subreddit, or None if the subreddit will never be processed with its current configuration (eg. quiet hours
+    covering the whole day and a quiet hours cooldown factor of 0)"""
+
+    if not subreddit.last_post_datetime:
+        return now
+
+    normal_deadline = subreddit.last_post_datetime + datetime.timedelta(minutes=int(subreddit.max_frequency))
+
+    has_quiet_hours = subreddit.quiet_hours_start not in NOT_VALUES and subreddit.quiet_hours_end not in NOT_VALUES
+    if subreddit.quiet_hours_cooldown_factor == 1 or not has_quiet_hours:
+        return max(now, normal_deadline)
+
+    quiet_deadline = None
+    if subreddit.quiet_hours_cooldown_factor != 0:
+        quiet_minutes = int(subreddit.max_frequency * subreddit.quiet_hours_cooldown_factor)
+        quiet_deadline = subreddit.last_post_datetime + datetime.timedelta(minutes=quiet_minutes)
+
+    def due_at(dt):
+        if is_quiet_hour(subreddit.quiet_hours_start, subreddit.quiet_hours_end, dt.hour):
+            return quiet_deadline is not None and dt >= quiet_deadline
+
+        return dt >= normal_deadline
+
+    deadlines = [d for d in (normal_deadline, quiet_deadline) if d is not None]
+    start = max(now, min(deadlines))
+
+    # whether we are in the quiet hours or not only changes on the hour, so the first due datetime is either one of
+    # the two deadlines or an hour boundary. After the last deadline, one day of boundaries covers every hour
+    candidates = {max(now, d) for d in deadlines}
+    boundary = start.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+    last_boundary = max(start, max(deadlines)) + datetime.timedelta(hours=25)
+    while boundary <= last_boundary:
+        candidates.add(boundary)
+        boundary += datetime.timedelta(hours=1)
+
+    for candidate in sorted(candidates):
+        if due_at(candidate):
+            return candidate
+
+    return None
+
+
+class SubredditScheduler:
+    """Keeps the enabled subreddits in a priority queue ordered by the datetime they will be due next, so a stream
+    tick only needs to load the subreddits that are actually due.
+
+    The schedule is updated incrementally: saving a Subreddit/Channel marks the row as dirty (see the signal
+    receivers at the bottom of this module), and dirty rows are re-read with a single query on the next tick.
+    A full re-sync is executed every full_sync_hours, to catch changes that bypass Model.save()"""
+
+    def __init__(self, full_sync_hours=24):
+        self._lock = threading.Lock()
+        self._heap = list()  # (due datetime, subreddit id)
+        self._deadlines = dict()  # subreddit id -> due datetime of the valid heap entry
+        self._dirty_subreddits = set()
+        self._dirty_channels = set()
+        self._last_full_sync = None
+        self._full_sync_interval = datetime.timedelta(hours=full_sync_hours)
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def mark_dirty(self, subreddit_id):
+        with self._lock:
+            self._dirty_subreddits.add(subreddit_id)
+
+    def mark_channel_dirty(self, channel_id):
+        with self._lock:
+            self._dirty_channels.add(channel_id)
+
+    def invalidate(self):
+        """Force a full re-sync on the next tick"""
+
+        with self._lock:
+            self._last_full_sync = None
+
+    @staticmethod
+    def _eligible_subreddits(*where):
+        return (
+            Subreddit.select(*SCHEDULE_FIELDS)
+            .join(Channel)
+            .where(Subreddit.enabled == True, Subreddit.channel.is_null(False), Channel.enabled == True, *where)
+        )
+
+    def _push(self, subreddit, now):
+        due = next_eligible_datetime(subreddit, now)
+        if due is None:
+            self._deadlines.pop(subreddit.id, None)
+            return
+
+        self._deadlines[subreddit.id] = due
+        heapq.heappush(self._heap, (due, subreddit.id))
+
+    def _full_sync(self, now):
+        self._heap = list()
+        self._deadlines = dict()
+        self._dirty_subreddits = set()
+        self._dirty_channels = set()
+
+        for subreddit in self._eligible_subreddits():
+            self._push(subreddit, now)
+
+        self._last_full_sync = now
+        logger.info('scheduler: full sync completed (scheduled subreddits: %d)', len(self._deadlines))
+
+    def _incremental_sync(self, now):
+        dirty_ids = self._dirty_subreddits
+        if self._dirty_channels:
+            query = Subreddit.select(Subreddit.id).where(Subreddit.channel << list(self._dirty_channels))
+            dirty_ids |= {subreddit.id for subreddit in query}
+
+        self._dirty_subreddits = set()
+        self._dirty_channels = set()
+
+        if not dirty_ids:
+            return
+
+        # rows that are not returned by the query have been disabled/deleted: we just drop them from the schedule
+        for subreddit_id in dirty_ids:
+            self._deadlines.pop(subreddit_id, None)
+
+        for subreddit in self._eligible_subreddits(Subreddit.id << list(dirty_ids)):
+            self._push(subreddit, now)
+
+        logger.info('scheduler: re-scheduled %d dirty subreddits', len(dirty_ids))
+
+    def sync(self, now=None):
+        now = now or u.now()
+
+        with self._lock:
+            if not self._last_full_sync or now - self._last_full_sync >= self._full_sync_interval:
+                self._full_sync(now)
+            else:
+                self._incremental_sync(now)
+
+            if len(self._heap) > 2 * len(self._deadlines) + 64:
+                # too many stale entries: rebuild the heap from the valid deadlines
+                self._heap = [(due, subreddit_id) for subreddit_id, due in self._deadlines.items()]
+                heapq.heapify(self._heap)
+
+    def pop_due(self, now=None) -> list:
+        """Remove from the schedule and return the ids of the subreddits that are due. They must be
+        re-scheduled with reschedule() once processed"""
+
+        now = now or u.now()
+
+        due_ids = list()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                due, subreddit_id = heapq.heappop(self._heap)
+                if self._deadlines.get(subreddit_id) != due:
+                    continue  # stale entry
+
+                del self._deadlines[subreddit_id]
+                due_ids.append(subreddit_id)
+
+        return due_ids
+
+    def reschedule(self, subreddits, now=None):
+        now = now or u.now()
+
+        with self._lock:
+            for subreddit in subreddits:
+                if subreddit.enabled:
+                    self._push(subreddit, now)
+
+    def next_due(self) -> [datetime.datetime, None]:
+        with self._lock:
+            if not self._deadlines:
+                return None
+
+            return min(self._deadlines.values())
+
+
+scheduler = SubredditScheduler(full_sync_hours=config.jobs.stream.get('scheduler_full_sync_hours', 24))
+
+
+@post_save(sender=Subreddit)
+def on_subreddit_saved(_, instance, created):
+    scheduler.mark_dirty(instance.id)
+
+
+@post_delete(sender=Subreddit)
+def on_subreddit_deleted(_, instance):
+    scheduler.mark_dirty(instance.id)
+
+
+@post_save(sender=Channel)
+def on_channel_saved(_, instance, created):
+    scheduler.mark_channel_dirty(instance.channel_id)
+
+
+@post_delete(sender=Channel)
+def on_channel_deleted(_, instance):
+    scheduler.mark_channel_dirty(instance.channel_id)
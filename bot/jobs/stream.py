@@ -2,38 +2,56 @@ import logging
 import logging.config
 import time
 import os
-from concurrent.futures import ThreadPoolExecutor
-from concurrent.futures import Future
-from concurrent.futures import TimeoutError
+import queue
+import threading
 
-from telegram import ParseMode, Bot, Message
+from telegram import Bot
 from telegram.error import BadRequest
 from telegram.error import TelegramError
 from telegram.ext import CallbackContext
+from peewee import JOIN
 
 from .common.task import Task
-from .common.threadpoolexecutor import MonitoredThreadPoolExecutor
+from .common.pipeline import Pipeline
+from .common.pipeline import Stage
 from .common.jobresult import JobResult
-from bot.logging import SubredditLogNoAdapter
-from bot import botutils
+from .common.scheduler import scheduler
+from bot.logging import get_subreddit_logger
+from bot.notifier import notifier
+from bot.bot import RateLimitedBot
 from utilities import u
 from utilities import d
+from utilities import resources
 from database.models import Subreddit, Job, Channel
-from database.models import Post
+from database.models import Style
+from database.snapshots import SubredditSnapshot
 from database.models import InitialTopPost
 from database.models import RedditRequest
 from database.queries import settings
 from database.queries import reddit_request
+from database.queries import posts
 from database import db
-from reddit import Reddit
+from database.writebehind import write_behind
 from reddit import creds
+from reddit import reddit_pool
 from reddit import Sender
+from reddit import filters
+from reddit import quotas
+from reddit.quotas import clients_quotas
+from reddit.templates import SubredditValues
+from reddit.downloaders import download_manager
+from reddit.downloaders import media_probes
+from reddit.downloaders.probes import submission_probe_urls
+from reddit.sendstrategy import send_strategy
 from config import config, reddit as reddit_config
 
 logger = logging.getLogger('job')
 
 NOT_VALUES = (None, False)
 
+HARVEST_TICK = 5  # max seconds the harvesting loop waits for a result before checking the deadline/the jobs lock
+LOCK_CHECK_INTERVAL = 10
+
 
 def its_quiet_hours(subreddit: Subreddit):
     now = u.now()
@@ -104,67 +122,99 @@ def get_default_reddit_instance():
     account = creds.default_account
     client = account.default_client
 
-    reddit = Reddit(**account.creds_dict(), **client.creds_dict())
+    reddit = reddit_pool.acquire(account, client)
 
     return reddit, account.username, client.name
 
 
 def get_reddit_instance(subreddit):
+    """Returns a pooled praw instance: it must be given back with reddit_pool.release() once we are done with it"""
+
     usage_mode = settings.get_accounts_usage_mode()
     if usage_mode:
         subreddit.logger.debug('current usage mode: %s', usage_mode)
 
+    # (account, client) candidates, in order of preference
     if subreddit.reddit_client and creds.client_exists(subreddit.reddit_client):
         subreddit.logger.info('using subreddit client: %s', subreddit.reddit_client)
 
         client = creds.get_client_by_name(subreddit.reddit_client)
         account = creds.get_client_parent_account(subreddit.reddit_client)
+        candidates = [(account, client)]
     elif subreddit.reddit_account and creds.account_exists(subreddit.reddit_account):
         subreddit.logger.info('using subreddit account with least stressed client: %s', subreddit.reddit_account)
         account = creds.get_account_by_name(subreddit.reddit_account)
 
-        client_name = reddit_request.least_stressed('client', account.client_names_list)[0]
-        client = creds.get_client_by_name(client_name)
+        candidates = account_candidates(account)
     elif usage_mode == 1 or (not usage_mode and reddit_config.general.prefer_default_account):
         # use the least used client of the default account
         subreddit.logger.info('using the default account and its least used client')
 
-        account = creds.default_account
-        client_name = reddit_request.least_stressed('client', account.client_names_list)[0]
-        client = creds.get_client_by_name(client_name)
+        candidates = account_candidates(creds.default_account)
     elif usage_mode == 2 or (not usage_mode and reddit_config.general.prefer_least_used_account):
         subreddit.logger.info('using the least used account and its least used client')
 
-        account_name = reddit_request.least_stressed('account', creds.account_names_list)[0]
-        account = creds.get_account_by_name(account_name)
-        client_name = reddit_request.least_stressed('client', account.client_names_list)[0]
-        client = creds.get_client_by_name(client_name)
+        candidates = list()
+        for account_name in reddit_request.least_stressed('account', creds.account_names_list):
+            candidates.extend(account_candidates(creds.get_account_by_name(account_name)))
     elif usage_mode == 3 or (not usage_mode and reddit_config.general.prefer_least_used_client):
         subreddit.logger.info('using the least used client and its account')
 
-        client_name = reddit_request.least_stressed('client', valid_names=creds.client_names_list)[0]
-        client = creds.get_client_by_name(client_name)
-        account = creds.get_client_parent_account(client_name)
+        candidates = [
+            (creds.get_client_parent_account(client_name), creds.get_client_by_name(client_name))
+            for client_name in reddit_request.least_stressed('client', valid_names=creds.client_names_list)
+        ]
     else:
         raise RuntimeError('uncatched scenario (usage_mode: {}, {})'.format(usage_mode, reddit_config.general))
 
-    reddit = Reddit(**account.creds_dict(), **client.creds_dict())
+    if not quotas.enabled():
+        account, client = candidates[0]
+    else:
+        # route the subreddit to the candidate with more requests left before hitting Reddit's rate limit
+        (account, client), wait = clients_quotas.pick([((a.username, c.name), (a, c)) for a, c in candidates])
+        if wait:
+            subreddit.logger.warning('client %s is running out of requests: waiting %.1f seconds', client.name, wait)
+            time.sleep(wait)
+
+    # the listing, plus the comments of the submissions we might post
+    expected_requests = 1 + (subreddit.number_of_posts or 1)
+
+    reddit = reddit_pool.acquire(account, client, expected_requests=expected_requests)
 
     return reddit, account.username, client.name
 
 
+def account_candidates(account) -> list:
+    return [
+        (account, account.get_client_by_name(client_name))
+        for client_name in reddit_request.least_stressed('client', account.client_names_list)
+    ]
+
+
 def fetch_submissions(subreddit: Subreddit, reddit):
     subreddit.logger.info('fetching submissions (sorting: %s, is_multireddit: %s)', subreddit.sorting, str(subreddit.is_multireddit))
 
     limit = subreddit.limit or Subreddit.limit.default
     sorting = subreddit.sorting.lower()
 
-    for position, submission in reddit.iter_submissions(subreddit.name, multireddit_owner=subreddit.multireddit_owner, sorting=sorting, limit=limit):
+    # the whole listing is fetched anyway with one request, so we materialize it first: this way we can check which
+    # submissions have already been posted with a single lookup instead of one query per submission
+    listing = list(reddit.iter_submissions(subreddit.name, multireddit_owner=subreddit.multireddit_owner, sorting=sorting, limit=limit))
+
+    submission_ids = [submission.id for _, submission in listing]
+    posted_ids = posts.already_posted_ids(subreddit, [submission for _, submission in listing])
+
+    initial_top_post_ids = set()
+    if sorting in ('month', 'all'):
+        not_posted_ids = [submission_id for submission_id in submission_ids if submission_id not in posted_ids]
+        initial_top_post_ids = InitialTopPost.initial_top_post_ids(subreddit.name, not_posted_ids, sorting)
+
+    for position, submission in listing:
         subreddit.logger.info('checking submission: %s (%s...)...', submission.id, submission.title[:64])
-        if Post.already_posted(subreddit, submission.id):
+        if submission.id in posted_ids:
             subreddit.logger.info('...submission %s has already been posted', submission.id)
             continue
-        elif subreddit.sorting.lower() in ('month', 'all') and InitialTopPost.is_initial_top_post(subreddit.name, submission.id, sorting):
+        elif submission.id in initial_top_post_ids:
             subreddit.logger.info('...subreddit has sorting "%s" and submission %s is among the initial top posts',
                                   sorting, submission.id)
             continue
@@ -172,51 +222,97 @@ def fetch_submissions(subreddit: Subreddit, reddit):
             subreddit.logger.info('...submission %s has NOT been posted yet, we will post this one if it passes checks',
                                   submission.id)
 
-            # this is when we first send the request to fetch the comments: accessing a submission property
-            # makes praw populate its attributes, and to do that it sends a request to the 'comments' endpoint
-            if not hasattr(submission, 'current_position'):
-                submission.current_position = position  # "position" starts from 1 and not 0
-
-            yield submission
+            yield position, submission
 
 
 class SubredditTask(Task):
-    # noinspection DuplicatedCode
-    @d.time_subreddit_processing(job_name='stream')
-    def __call__(self, subreddit: Subreddit, bot: Bot) -> JobResult:
+    """The processing of a subreddit, split in the steps executed by the stages of the stream pipeline:
+    collect() -> prepare() -> upload() -> register()"""
 
+    def __init__(self, subreddit: Subreddit, bot: Bot):
+        Task.__init__(self)
+        self.subreddit = subreddit
+        self.bot = bot
+        self.job_result = JobResult()
+        self.senders = list()
+        self.posted_senders = list()  # senders to register in the database
+        self.error = None
+
+        self._reddit = None
+        self._job_row = None
+
+    def __repr__(self):
+        return '<SubredditTask {}>'.format(self.subreddit.r_name_with_id)
+
+    def _interrupted(self):
         if self.interrupt_request:
-            subreddit.logger.warning('received interrupt request: aborting subreddit processing')
-            return JobResult()
+            self.subreddit.logger.warning('received interrupt request: aborting subreddit processing')
+            return True
+
+        return False
+
+    def collect(self):
+        """Fetch the submissions and build the senders of the submissions to post"""
+
+        subreddit = self.subreddit
+
+        self._job_row = d.subreddit_job_start(subreddit, job_name='stream')
+
+        if self._interrupted():
+            return
 
         reddit, account_name, client_name = get_reddit_instance(subreddit)
         subreddit.logger.info('using account: %s, client: %s', account_name, client_name)
 
+        # submissions are lazy objects bound to the praw instance: we can give it back (see finish()) only once
+        # we are done with them
+        self._reddit = reddit
+
         # one reddit.iter_submissions() -> one request
         reddit_request.save_request(subreddit, account_name, client_name, description='submissions')
 
-        job_result = JobResult()
+        job_result = self.job_result
 
-        senders = list()
         comments_requests_count = 0  # we keep track of how many requests to fetch the comments we are going to send
-        non_posted_submissions = 0
-        for submission in fetch_submissions(subreddit, reddit):
-            comments_requests_count += 1  # we send it when we create the submission's 'current_position' attribute
-            non_posted_submissions += 1
 
+        # the filters that only need the listing data are compiled once and tested against all the non-posted
+        # submissions, so we build a Sender (which is expensive and might send requests to detect the submission
+        # type) only for the submissions that passed them
+        filter_plan = filters.FilterPlan(subreddit)
+        subreddit_values = SubredditValues(subreddit)  # placeholder values shared by all the senders
+        non_posted = list(fetch_submissions(subreddit, reddit))
+        non_posted_submissions = len(non_posted)
+        passed_indices = set(filter_plan.surviving_indices([submission for _, submission in non_posted], subreddit.logger))
+
+        # probe the medias of the submissions that will likely be posted all at once, the handlers will find them cached
+        candidates = [submission for i, (_, submission) in enumerate(non_posted) if i in passed_indices]
+        media_probes.prefetch([
+            url for submission in candidates[:subreddit.number_of_posts * 2] for url in submission_probe_urls(submission)
+        ])
+
+        for i, (position, submission) in enumerate(non_posted):
             # we save this so we can understand how far in the frontpage we usually look through (max frontpage depth)
             # the method will increase it only if needed
-            job_result.save_submission_max_index(submission.current_position)
+            job_result.save_submission_max_index(position)
 
-            if self.interrupt_request:
-                subreddit.logger.warning('received interrupt request: aborting subreddit processing')
-                return job_result
+            if self._interrupted():
+                return
 
-            sender = Sender(bot, subreddit, submission)
-            if sender.test_filters():
+            if i not in passed_indices:
+                subreddit.logger.info('submission did NOT pass filters, continuing to next one...')
+                continue
+
+            # this is when we first send the request to fetch the comments: accessing a submission property
+            # makes praw populate its attributes, and to do that it sends a request to the 'comments' endpoint
+            comments_requests_count += 1
+            if not hasattr(submission, 'current_position'):
+                submission.current_position = position  # "position" starts from 1 and not 0
+
+            sender = Sender(self.bot, subreddit, submission, subreddit_values=subreddit_values)
+            if sender.test_filters(payload_filters=False):
                 subreddit.logger.info('submission %s ("%s") passed filters', submission.id, submission.title[:24])
-                senders.append(sender)
-                if len(senders) >= subreddit.number_of_posts:
+                self.senders.append(sender)
+                if len(self.senders) >= subreddit.number_of_posts:
                     subreddit.logger.info('we collected enough posts to post (number_of_posts: %d)', subreddit.number_of_posts)
                     break
             else:
@@ -227,7 +323,7 @@ class SubredditTask(Task):
                 sender = None  # avoid to use a Sender that did not pass the filters
                 continue
 
-        logger.debug("senders: %d, non_posted_submissions: %d", len(senders), non_posted_submissions)
+        logger.debug("senders: %d, non_posted_submissions: %d", len(self.senders), non_posted_submissions)
 
         if non_posted_submissions == 0:
             # if we haven't found any submission that hasn't been posted yet, but we went through the whole frontpage,
@@ -244,7 +340,7 @@ class SubredditTask(Task):
             if subreddit.sorting == "hot" and subreddit.limit < Subreddit.limit.default:
                 subreddit.logger.warning("subreddit's limit is lower than default, might want to adjust that")
 
-                warning_hashtag = '#mirrorbot_warning_{}'.format(bot.username)
+                warning_hashtag = '#mirrorbot_warning_{}'.format(self.bot.username)
                 text = '{} - {}: unable to fetch enough submissions to post (subreddit limit: {}, default limit: {}, non-posted submissions available from the frontpage: {}, number of posts: {})'.format(
                     warning_hashtag,
                     subreddit.r_name_with_id,
@@ -254,29 +350,61 @@ class SubredditTask(Task):
                     subreddit.number_of_posts
                 )
 
-                botutils.log(text=text, parse_mode=ParseMode.HTML)
+                notifier.notify(warning_hashtag, text, key=subreddit.id)
+
+        # we are done sending requests to Reddit: let the next subreddits know how many requests this client has left
+        reddit_pool.observe(reddit)
 
-        if not senders:
+        if not self.senders:
             subreddit.logger.info('no (valid) submission returned for %s, continuing to next subreddit/channel...',
                                   subreddit.r_name)
-            return job_result
+            return
 
         # for each submission fetched, we have executed an additional request to fetch the comments
         reddit_request.save_request(subreddit, account_name, client_name, weight=comments_requests_count, description='comments')
 
-        subreddit.logger.info('we collected %d/%d submissions to post', len(senders), subreddit.number_of_posts)
+        subreddit.logger.info('we collected %d/%d submissions to post', len(self.senders), subreddit.number_of_posts)
+
+    def prepare(self):
+        """Download and process the medias of the senders (eg. download and merge vreddits)"""
+
+        if self.error:
+            return
+
+        with resources.recording_waits() as waits:
+            for sender in self.senders:
+                if self._interrupted():
+                    break
+
+                sender.prepare()
+
+        self.job_result.add_resource_waits(waits)
 
-        for sender in senders:
-            if self.interrupt_request:
-                subreddit.logger.warning('received cancel request: aborting subreddit processing')
-                return job_result
+    def upload(self):
+        if self.error:
+            return
+
+        with resources.recording_waits() as waits:
+            self._upload()
+
+        self.job_result.add_resource_waits(waits)
+
+    def _upload(self):
+        subreddit = self.subreddit
+        bot = self.bot
+
+        for sender in self.senders:
+            if self._interrupted():
+                return
 
             subreddit.logger.info('submission url: %s', sender.submission.url)
             subreddit.logger.info('submission title: %s', sender.submission.title)
 
             try:
-                time.sleep(config.jobs.posts_cooldown)  # sleep some seconds before posting
+                # no need to wait before posting: the bot's requests are throttled by the shared rate limiter
                 sent_messages = sender.post()
+                self.job_result.register_media_cache_lookup(sender.media_cache_hit)
+                self.job_result.add_send_paths(sender.send_paths)
             except (BadRequest, TelegramError) as e:
                 error_description = str(e)
                 error_hashtag = '#mirrorbot_error_{}_posting'.format(bot.username)
@@ -290,20 +418,22 @@ class SubredditTask(Task):
                     error_desc=u.escape(error_description)
                 )
 
-                log_message: Message = botutils.log(text=error_text, parse_mode=ParseMode.HTML)
                 error_description = error_description.lower()
                 if "can't parse entities" in error_description:
                     # also post the text that caused the error
-                    log_message.reply_text(sender.debug_text_to_post, parse_mode=None, disable_web_page_preview=True)
+                    notifier.notify(error_hashtag, error_text, key=subreddit.id, reply_text=sender.debug_text_to_post)
                 elif "bot was kicked from the channel chat" in error_description:
                     with db.atomic():
                         # directly disable the channel, not just the subreddit
-                        subreddit.channel.disable()
+                        Channel.get_by_id(subreddit.channel_id).disable()
 
-                    log_message.reply_text(f'Channel "{subreddit.channel.title}" disabled (#channel_disabled)\n'
-                                           f'Link: {subreddit.channel.get_invite_link(default="-")}', disable_web_page_preview=True)
+                    notifier.notify(error_hashtag, error_text, key=subreddit.id,
+                                    reply_text=f'Channel "{subreddit.channel.title}" disabled (#channel_disabled)\n'
+                                               f'Link: {subreddit.channel.get_invite_link(default="-")}')
 
-                    return job_result  # we don't need to process other Sender instances
+                    return  # we don't need to process other Sender instances
+                else:
+                    notifier.notify(error_hashtag, error_text, key=subreddit.id)
 
                 continue
             except Exception as e:
@@ -320,19 +450,47 @@ class SubredditTask(Task):
                         subreddit.name
                     )
                 else:
-                    sender.register_post(test=subreddit.test)
+                    self.posted_senders.append(sender)
 
-                    subreddit.logger.info('updating Subreddit last post datetime...')
-                    subreddit.last_post_datetime = u.now()
+                    # saved in the database by register()
+                    subreddit = self.subreddit = subreddit.replace(last_post_datetime=u.now())
 
-                    with db.atomic():
-                        subreddit.save()
-
-                job_result.increment(posted_messages=1, posted_bytes=sender.uploaded_bytes)
+                self.job_result.increment(posted_messages=1, posted_bytes=sender.uploaded_bytes)
 
             # time.sleep(1)
 
-        return job_result
+    def register(self):
+        """Save the posted submissions and the subreddit's last post datetime. Always executed, so it also
+        releases the task's resources"""
+
+        subreddit = self.subreddit
+
+        try:
+            for sender in self.posted_senders:
+                sender.register_post(test=subreddit.test)
+
+            if self.posted_senders:
+                subreddit.logger.info('updating Subreddit last post datetime...')
+                write_behind.execute(
+                    Subreddit.update(last_post_datetime=subreddit.last_post_datetime).where(Subreddit.id == subreddit.id)
+                )
+        finally:
+            self.finish()
+
+    def finish(self):
+        for sender in self.senders:
+            sender.discard()
+
+        # the task is kept alive until its result is harvested: release the submissions as soon as possible
+        self.senders = list()
+        self.posted_senders = list()
+
+        if self._reddit is not None:
+            reddit_pool.release(self._reddit)
+            self._reddit = None
+
+        if self._job_row is not None:
+            d.subreddit_job_end(self._job_row, self.subreddit, self.job_result)
 
 
 def is_time_to_process(subreddit: Subreddit):
@@ -347,6 +505,26 @@ def is_time_to_process(subreddit: Subreddit):
     return True
 
 
+def upload_workers() -> int:
+    return config.jobs.stream.get('upload_workers', (os.cpu_count() or 1) * 2)
+
+
+def build_pipeline(on_error) -> Pipeline:
+    """Stages of the stream job: the listings keep being fetched while medias are downloaded/processed
+    and uploaded by their own workers. Registration is done by a single worker"""
+
+    stream_config = config.jobs.stream
+    cpu_count = os.cpu_count() or 1
+    queue_size = stream_config.get('pipeline_queue_size', 8)
+
+    return Pipeline(
+        Stage('fetch', SubredditTask.collect, workers=stream_config.get('fetch_workers', cpu_count * 2), queue_size=queue_size, on_error=on_error),
+        Stage('prepare', SubredditTask.prepare, workers=stream_config.get('prepare_workers', cpu_count), queue_size=queue_size, on_error=on_error),
+        Stage('upload', SubredditTask.upload, workers=upload_workers(), queue_size=queue_size, on_error=on_error),
+        Stage('register', SubredditTask.register, workers=1, queue_size=queue_size, on_error=on_error)
+    )
+
+
 @d.logerrors
 @d.log_start_end_dt
 # @db.atomic('EXCLUSIVE')  # http://docs.peewee-orm.com/en/latest/peewee/database.html#set-locking-mode-for-transaction
@@ -357,23 +535,45 @@ def check_posts(context: CallbackContext, jobs_log_row: Job = None) -> JobResult
 
     bot = context.bot
 
+    # only the subreddits that are due are loaded from the database (see common/scheduler.py)
+    scheduler.sync()
+    due_subreddits_ids = scheduler.pop_due()
+    logger.info('due subreddits: %d/%d', len(due_subreddits_ids), len(due_subreddits_ids) + len(scheduler))
+
+    if not due_subreddits_ids:
+        logger.info('no subreddit to process, exiting job (next one due: %s)', scheduler.next_due())
+        return JobResult()
+
+    # subreddits, channels and styles are loaded with one query, and the tasks receive read-only snapshots of them:
+    # the worker threads never run lazy queries nor share ORM instances
     with db.atomic():
-        subreddits = (
-            Subreddit.select()
+        rows = list(
+            Subreddit.select(Subreddit, Channel, Style)
             .join(Channel)
-            .where(Subreddit.enabled == True, Subreddit.channel.is_null(False), Channel.enabled == True)
+            .switch(Subreddit)
+            .join(Style, JOIN.LEFT_OUTER)
+            .where(Subreddit.id << due_subreddits_ids, Subreddit.enabled == True, Subreddit.channel.is_null(False), Channel.enabled == True)
         )
 
-    subreddits_to_process = list()
-    for subreddit in subreddits:
-        if not subreddit.style:
-            subreddit.set_default_style()
+    default_style = None
+    no_style_ids = [row.id for row in rows if not row.style_id]
+    if no_style_ids:
+        default_style = Style.get_default()
+        logger.info('setting the default style to %d subreddits', len(no_style_ids))
+        Subreddit.update(style=default_style).where(Subreddit.id << no_style_ids).execute()
 
-        subreddit.logger = SubredditLogNoAdapter(subreddit)
-        # subreddit.logger.set_subreddit(subreddit)
+    subreddits_to_process = list()
+    not_due_subreddits = list()
+    for row in rows:
+        subreddit = SubredditSnapshot.from_row(row, style=default_style)
+        subreddit = subreddit.replace(logger=get_subreddit_logger(subreddit))
 
         if is_time_to_process(subreddit):
             subreddits_to_process.append(subreddit)
+        else:
+            not_due_subreddits.append(subreddit)
+
+    scheduler.reschedule(not_due_subreddits)
 
     if not subreddits_to_process:
         logger.info('no subreddit to process, exiting job')
@@ -385,66 +585,120 @@ def check_posts(context: CallbackContext, jobs_log_row: Job = None) -> JobResult
     jobs_log_row.subreddits_count = num_collected_subreddits
     jobs_log_row.save()
 
-    max_workers = (os.cpu_count() or 1) * 2
-    logger.info('max_workers: %d', max_workers)
-
     executor_timeout = config.jobs.stream.interval * 60
+    error_hashtag = '#mirrorbot_error_{}'.format(context.bot.username)
 
     stream_job_result = JobResult()
 
-    with MonitoredThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures: [(SubredditTask, Future)] = list()
-        for i, subreddit in enumerate(subreddits_to_process):
-            logger.info('%d/%d submitting %s...', i+1, num_collected_subreddits, subreddit.r_name_with_id)
-            # future: Future = executor.submit(process_submissions, subreddit, bot)
-            subreddit_task = SubredditTask()  # see https://stackoverflow.com/a/6514268
-            future: Future = executor.submit(subreddit_task, subreddit, bot)
-            future.subreddit = subreddit
-            futures.append((subreddit_task, future))
+    def on_task_error(stage: Stage, task: SubredditTask, exception):
+        task.subreddit.logger.error('error while processing subreddit r/%s (stage: %s): %s', task.subreddit.name,
+                                    stage.name, str(exception), exc_info=True)
+        task.error = exception
 
-        logger.info('harvesting results...')
-        for subreddit_task, future in futures:
-            if settings.jobs_locked():
-                logger.info('jobs have been locked, terminating subreddit tasks processing now and returning')
-                stream_job_result.canceled = True
-                return stream_job_result
-
-            error_hashtag = '#mirrorbot_error_{}'.format(context.bot.username)
+    pipeline = build_pipeline(on_task_error)
+    pipeline.start()
 
-            # noinspection PyBroadException
-            try:
-                logger.info('waiting result for %s (id: %d)...', future.subreddit.name, future.subreddit.id)
+    subreddit_tasks = dict()
+    try:
+        pending_tasks = dict()
+        for subreddit in subreddits_to_process:
+            subreddit_task = SubredditTask(subreddit, bot)
+            pending_tasks[subreddit.id] = subreddit_task
+            subreddit_tasks[subreddit.id] = subreddit_task
 
-                subreddit_job_result = future.result(timeout=executor_timeout)
-                stream_job_result += subreddit_job_result
+        submitted_tasks = set()
 
-                logger.info('still %d active pools', executor.get_pool_usage())
-            except TimeoutError:
-                subreddit_task.request_interrupt()
+        def submit_tasks():
+            try:
+                for i, task in enumerate(subreddit_tasks.values()):
+                    logger.info('%d/%d submitting %s...', i+1, num_collected_subreddits, task.subreddit.r_name_with_id)
+                    pipeline.put(task)  # blocks while the first stage's queue is full
+                    submitted_tasks.add(task.subreddit.id)
+            finally:
+                # the stages' workers exit once they are done
+                pipeline.close()
+
+        # the tasks are submitted by another thread, so the deadline and the jobs lock are checked while the first
+        # stage's queue is full. Tasks interrupted before being submitted go through the stages without doing anything
+        deadline = time.monotonic() + executor_timeout
+        submitter = threading.Thread(target=submit_tasks, name='stream_submitter', daemon=True)
+        submitter.start()
 
-                # future.cancel() doesn't work apparently, the callback can't be stopped. We can only request
-                # its interruption. future.cancelled() will be False even after calling future.cancel()
-                future.cancel()
+        logger.info('harvesting results...')
+        timed_out = False
+        # the jobs lock and the job's progress are checked/saved periodically, not once per harvested task
+        next_lock_check = 0
+        progress_save_interval = config.jobs.stream.get('progress_save_interval', 15)
+        next_progress_save = time.monotonic() + progress_save_interval
+        while pending_tasks:
+            now = time.monotonic()
+
+            if not submitter.is_alive():
+                # the tasks that have not been submitted (the submitter failed) will never come out of the pipeline
+                for subreddit_id in [i for i in pending_tasks if i not in submitted_tasks]:
+                    pending_tasks.pop(subreddit_id)
+                if not pending_tasks:
+                    break
 
-                logger.error('r/%s: processing took more than the job interval (cancelled: %s)', future.subreddit.name, future.cancelled())
+            if not stream_job_result.canceled and now >= next_lock_check:
+                next_lock_check = now + LOCK_CHECK_INTERVAL
+                if settings.jobs_locked():
+                    logger.info('jobs have been locked, terminating subreddit tasks processing now')
+                    stream_job_result.canceled = True
+                    for subreddit_task in pending_tasks.values():
+                        subreddit_task.request_interrupt()
+
+            if now >= next_progress_save:
+                next_progress_save = now + progress_save_interval
+                write_behind.save(jobs_log_row)
+
+            if not timed_out and now > deadline:
+                # the tasks can't be killed, we can only request their interruption
+                timed_out = True
+                for subreddit_task in pending_tasks.values():
+                    subreddit_task.request_interrupt()
+                    logger.error('r/%s: processing took more than the job interval', subreddit_task.subreddit.name)
+
+                text = '{} - pipeline timeout - {} seconds ({} subreddits interrupted)'.format(error_hashtag, executor_timeout, len(pending_tasks))
+                notifier.notify(error_hashtag, text, key='pipeline_timeout')
+
+            # wake up in time to interrupt the tasks as soon as the deadline is reached
+            timeout = HARVEST_TICK if timed_out else max(0.1, min(HARVEST_TICK, deadline - now))
+            try:
+                subreddit_task: SubredditTask = pipeline.get_result(timeout=timeout)
+            except queue.Empty:
+                continue
 
-                text = '{} - pool executor timeout - {} seconds'.format(error_hashtag, executor_timeout)
-                botutils.log(text=text, parse_mode=ParseMode.HTML)
-            except Exception:
-                error_description = str(future.exception())
-                future.subreddit.logger.error('error while processing subreddit r/%s: %s', future.subreddit.name, error_description, exc_info=True)
+            pending_tasks.pop(subreddit_task.subreddit.id)
+            stream_job_result.sum(subreddit_task.job_result)
 
+            if subreddit_task.error:
                 text = '{hashtag} - {sub_name} ({config_deeplink}) - <code>{error_desc}</code>'.format(
                     hashtag=error_hashtag,
-                    sub_name=future.subreddit.r_name_with_id,
-                    config_deeplink=future.subreddit.html_deeplink(context.bot.username, "config"),
-                    error_desc=u.escape(error_description)
+                    sub_name=subreddit_task.subreddit.r_name_with_id,
+                    config_deeplink=subreddit_task.subreddit.html_deeplink(context.bot.username, "config"),
+                    error_desc=u.escape(str(subreddit_task.error))
                 )
-                botutils.log(text=text, parse_mode=ParseMode.HTML)
+                notifier.notify(error_hashtag, text, key=subreddit_task.subreddit.id)
 
             jobs_log_row.subreddits_progress += 1
-            jobs_log_row.save()
 
-        # time.sleep(1)
+        write_behind.save(jobs_log_row)
+
+        logger.info('pipeline stats: %s', pipeline.stats())
+        if isinstance(bot, RateLimitedBot):
+            logger.info('bot API connection pools: %s', bot.requests_stats(reset=True))
+        logger.info('database writer lock: %s', db.lock_stats(reset=True))
+        logger.info('log chat notifier: %s', notifier.stats())
+        logger.info('downloads by host: %s', download_manager.stats(reset=True))
+        logger.info('media probes cache: %s', media_probes.stats())
+        logger.info('send strategies: %s', send_strategy.stats())
+    finally:
+        # the tasks replace their subreddit's snapshot when they post (new last_post_datetime): put them back in the
+        # schedule using the most recent ones
+        scheduler.reschedule([
+            subreddit_tasks[subreddit.id].subreddit if subreddit.id in subreddit_tasks else subreddit
+            for subreddit in subreddits_to_process
+        ])
 
     return stream_job_result
@@ -1,5 +1,9 @@
+import atexit
 import json
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+from collections import OrderedDict
+from logging.handlers import RotatingFileHandler, QueueHandler, QueueListener
 import logging.config
 import os
 import pytz
@@ -32,201 +36,129 @@ def load_logging_config(config_file='logging.json', set_rome_timezone=bool(confi
 logging_config = load_logging_config()
 
 
-def get_subreddit_logger(subreddit, dir_path='logs/subreddits/'):
-    file_path = os.path.join(dir_path, subreddit.name + '.log')
+class SubredditFilesHandler(logging.Handler):
+    """Writes the records of each subreddit to its own rotating file, in logs/subreddits/{name}_{id}/.
 
-    extra = {'sub_id': subreddit.id, 'sub_name': subreddit.name}
+    At most max_open_files files are open at the same time: when a record of another subreddit comes in, the least
+    recently used file is closed. Only used by the listener thread"""
 
-    logger = logging.getLogger('subreddit')
-    fh = logging.handlers.RotatingFileHandler(
-        filename=file_path,
-        maxBytes=1048576,
-        backupCount=20,
-        encoding="utf8"
-    )
-    fh.setFormatter(logging.Formatter(logging_config['formatters']['subreddit']['format']))
-    fh.setLevel(logging_config['loggers']['subreddit']['level'])
-    logger.addHandler(fh)
-
-    logger = logging.LoggerAdapter(logger, extra)
-
-    return logger
+    def __init__(self, dir_path='logs/subreddits/', max_open_files=64, level=logging.NOTSET):
+        super().__init__(level)
+        self._dir_path = dir_path
+        self._max_open_files = max(max_open_files, 1)
+        self._handlers = OrderedDict()  # subreddit id -> RotatingFileHandler
 
+    def _get_handler(self, sub_id, sub_name):
+        handler = self._handlers.get(sub_id, None)
+        if handler is not None:
+            self._handlers.move_to_end(sub_id)
+            return handler
 
-class SubredditLog:
-    def __init__(self, dir_path='logs/subreddits/'):
-        self.subreddit_name = None
-        self.subreddit_id = None
-        self._dir_path = dir_path
-        self._file_path = None
-        self._extra = None
-        self._formatter_name = 'subreddit'
-        self._logger: [logging.Logger, logging.LoggerAdapter] = logging.getLogger('subreddit')
-        self._generic_logger = logging.getLogger(__name__)
+        dir_path = os.path.join(self._dir_path, '{}_{}'.format(sub_name, sub_id))
+        os.makedirs(dir_path, exist_ok=True)
 
-        self._rotating_file_handler_kwargs = dict(
+        handler = RotatingFileHandler(
+            filename=os.path.join(dir_path, '{}_{}.log'.format(sub_name, sub_id)),
             maxBytes=1048576,
             backupCount=20,
             encoding="utf8"
         )
+        handler.setFormatter(self.formatter)
 
-    @property
-    def logger(self):
-        return self._logger
-
-    def remove_file_handlers(self):
-        if not self._logger:
-            return
-
-        if isinstance(self._logger, logging.LoggerAdapter):
-            for handler in self._logger.logger.handlers:
-                if isinstance(handler, (logging.handlers.RotatingFileHandler, logging.FileHandler)):
-                    self._logger.logger.removeHandler(handler)
-                    self._generic_logger.debug('removed handler %s', handler)
-        else:
-            for handler in self._logger.handlers:
-                if isinstance(handler, (logging.handlers.RotatingFileHandler, logging.FileHandler)):
-                    self._logger.removeHandler(handler)
-                    self._generic_logger.debug('removed handler %s', handler)
-
-    def add_handler(self, handler):
-        if isinstance(self._logger, logging.LoggerAdapter):
-            self._logger.logger.addHandler(handler)
-            self._logger = logging.LoggerAdapter(self._logger.logger, self._extra)  # remember to set the Adapter's extras
-            self._generic_logger.debug('added handler to LoggerAdapter.logger %s', handler)
-        elif isinstance(self._logger, logging.Logger):
-            self._logger.addHandler(handler)
-            self._logger = logging.LoggerAdapter(self._logger, self._extra)
-            self._generic_logger.debug('added handler to Logger %s', handler)
-
-    def set_subreddit(self, subreddit):
-        self._generic_logger.debug('setting subreddit: %s', subreddit.name)
-
-        self.subreddit_id = subreddit.id
-        self.subreddit_name = subreddit.name
-        self._file_path = os.path.join(self._dir_path, '{s.subreddit_name}_{s.subreddit_id}.log'.format(s=self))
-        self._extra = {'sub_id': subreddit.id, 'sub_name': subreddit.name}
-
-        self._generic_logger.debug('extra: %s', self._extra)
-
-        if not self._logger:
-            self._logger = logging.getLogger('subreddit')
-
-        # remove every file handler, because we are going to add a new one
-        self.remove_file_handlers()
-
-        file_handler = logging.handlers.RotatingFileHandler(
-            filename=self._file_path,
-            **self._rotating_file_handler_kwargs
-        )
-        file_handler.setFormatter(logging.Formatter(logging_config['formatters'][self._formatter_name]['format']))
-        file_handler.setLevel(logging_config['loggers']['subreddit']['level'])
-
-        self.add_handler(file_handler)
+        self._handlers[sub_id] = handler
+        while len(self._handlers) > self._max_open_files:
+            _, evicted = self._handlers.popitem(last=False)
+            evicted.close()
 
-        return self._logger  # return it, just in case
-
-    def debug(self, *args, **kwargs):
-        return self._logger.debug(*args, **kwargs)
-
-    def info(self, *args, **kwargs):
-        return self._logger.info(*args, **kwargs)
+        return handler
 
-    def warning(self, *args, **kwargs):
-        return self._logger.warning(*args, **kwargs)
+    def emit(self, record):
+        sub_id = getattr(record, 'sub_id', None)
+        if sub_id is None:
+            # not tied to a subreddit: console only
+            return
 
-    def error(self, *args, **kwargs):
-        return self._logger.warning(*args, **kwargs)
+        try:
+            handler = self._get_handler(sub_id, record.sub_name)
+        except Exception:
+            self.handleError(record)
+            return
 
+        handler.emit(record)
 
-class SubredditLogNoAdapter(logging.Logger):
-    def __init__(self, subreddit=None, dir_path='logs/subreddits/'):
-        super(SubredditLogNoAdapter, self).__init__('subreddit')
+    def open_files(self):
+        return len(self._handlers)
 
-        # NOT NEEDED ANYMORE
-        # WE ADD BOTH THE FILE AND STREAM HANDLER MANUALLY LATER, AND ONLY TAKE
-        # THE FORMATTER AND LOGGING LEVEL FROM logging.json
-        # copy the logging.json's logger handlers (one SreamHandler) to this logger
-        # self.handlers = logging.getLogger('subreddit').handlers
+    def close(self):
+        self.acquire()
+        try:
+            while self._handlers:
+                _, handler = self._handlers.popitem()
+                handler.close()
+        finally:
+            self.release()
 
-        self.subreddit_name = None
-        self.subreddit_id = None
-        self._dir_path = dir_path
-        self._file_path = None
-        self._formatter_name = 'subreddit'
-        self.init_time_str = datetime.datetime.now().strftime("%Y%m%d_%H%M")
-        self._extra = dict()
-        self._generic_logger = logging.getLogger(__name__)
+        super().close()
 
-        self._rotating_file_handler_kwargs = dict(
-            maxBytes=1048576,
-            backupCount=20,
-            encoding="utf8"
-        )
 
-        self.add_handler(self.get_console_handler())
+def _subreddit_handler(handler):
+    handler.setFormatter(logging.Formatter(logging_config['formatters']['subreddit']['format']))
+    handler.setLevel(logging_config['loggers']['subreddit']['level'])
 
-        if subreddit:
-            self.set_subreddit(subreddit)
+    return handler
 
-    def remove_handlers(self, file_handlers_only=False):
-        for handler in self.handlers:
-            if not file_handlers_only or isinstance(handler, (logging.handlers.RotatingFileHandler, logging.FileHandler)):
-                self.removeHandler(handler)
-                self._generic_logger.debug('removed handler %s', handler)
 
-    def add_handler(self, handler):
-        self.addHandler(handler)
-        self._generic_logger.debug('added handler to Logger: %s', handler)
+# the subreddits' loggers only put their records in this queue: the console/files I/O happens in the listener thread
+subreddit_log_queue = queue.Queue(-1)
+subreddit_queue_handler = QueueHandler(subreddit_log_queue)
+subreddit_files_handler = _subreddit_handler(SubredditFilesHandler(
+    max_open_files=config.get('logging', {}).get('subreddit_max_open_files', 64)
+))
+subreddit_listener = QueueListener(
+    subreddit_log_queue,
+    _subreddit_handler(logging.StreamHandler()),
+    subreddit_files_handler,
+    respect_handler_level=True
+)
+subreddit_listener.start()
+atexit.register(subreddit_listener.stop)
 
-    def get_file_handler(self):
-        handler = logging.handlers.RotatingFileHandler(
-            filename=self._file_path,
-            **self._rotating_file_handler_kwargs
-        )
-        handler.setFormatter(logging.Formatter(logging_config['formatters'][self._formatter_name]['format']))
-        handler.setLevel(logging_config['loggers']['subreddit']['level'])
 
-        return handler
+class SubredditLogger(logging.Logger):
+    """Logger whose records are tagged with the subreddit's id and name. Records below the level are dropped
+    before being formatted, the others are handed to the listener thread"""
 
-    def get_console_handler(self):
-        handler = logging.StreamHandler()
-        handler.setFormatter(logging.Formatter(logging_config['formatters'][self._formatter_name]['format']))
-        handler.setLevel(logging_config['loggers']['subreddit']['level'])
+    def __init__(self, sub_id=None, sub_name=None):
+        super(SubredditLogger, self).__init__('subreddit', logging_config['loggers']['subreddit']['level'])
 
-        return handler
+        self.propagate = False
+        self.subreddit_id = sub_id
+        self.subreddit_name = sub_name
+        self._extra = {'sub_id': sub_id, 'sub_name': sub_name}
 
-    def set_subreddit(self, subreddit):
-        self._generic_logger.debug('setting subreddit: %s', subreddit.name)
+        self.addHandler(subreddit_queue_handler)
 
-        self.subreddit_id = subreddit.id
-        self.subreddit_name = subreddit.name
-        self._dir_path = os.path.join(self._dir_path, '{}_{}'.format(subreddit.name, subreddit.id))
-        self._ensure_dir(self._dir_path)
-        self._file_path = os.path.join(
-            self._dir_path,
-            '{s.subreddit_name}_{s.subreddit_id}_{s.init_time_str}.log'.format(s=self)
-        )
+    def makeRecord(self, *args, **kwargs):
+        record = super().makeRecord(*args, **kwargs)
+        for key, value in self._extra.items():
+            record.__dict__.setdefault(key, value)
 
-        self._extra = {'sub_id': subreddit.id, 'sub_name': subreddit.name}
+        return record
 
-        # remove every file handler, because we are going to add a new one
-        self.remove_handlers(file_handlers_only=True)
 
-        self.add_handler(self.get_file_handler())
+_subreddit_loggers = dict()  # subreddit id -> SubredditLogger
+_subreddit_loggers_lock = threading.Lock()
 
-        return self  # return it, just in case
 
-    def _log(self, *args, **kwargs):
-        if self._extra:
-            kwargs["extra"] = self._extra
+def get_subreddit_logger(subreddit) -> SubredditLogger:
+    """The same logger is returned every time for the same subreddit"""
 
-        super()._log(*args, **kwargs)  # noqa
+    with _subreddit_loggers_lock:
+        logger = _subreddit_loggers.get(subreddit.id, None)
+        if logger is None or logger.subreddit_name != subreddit.name:
+            logger = _subreddit_loggers[subreddit.id] = SubredditLogger(subreddit.id, subreddit.name)
 
-    @staticmethod
-    def _ensure_dir(dir_path):
-        if not os.path.isdir(dir_path):
-            os.mkdir(dir_path)
+        return logger
 
 
-slogger = SubredditLogNoAdapter()
+slogger = SubredditLogger()
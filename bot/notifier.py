@@ -0,0 +1,213 @@
+import logging
+import threading
+import time
+
+from telegram import ParseMode
+from telegram.error import TelegramError, RetryAfter
+
+from bot import botutils
+from config import config
+
+logger = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 4096
+MAX_REPLY_TEXTS = 3  # for each event, only the most recent reply texts are sent
+
+
+class Event:
+    __slots__ = ['text', 'count', 'reply_texts', 'dropped_replies', 'first_seen', 'due']
+
+    def __init__(self, text, first_seen, due):
+        self.text = text  # the most recent text
+        self.count = 0
+        self.reply_texts = list()
+        self.dropped_replies = 0
+        self.first_seen = first_seen
+        self.due = due
+
+    def add_reply_text(self, reply_text):
+        self.reply_texts.append(reply_text)
+        if len(self.reply_texts) > MAX_REPLY_TEXTS:
+            self.reply_texts.pop(0)
+            self.dropped_replies += 1
+
+    def digest_text(self):
+        text = self.text
+        if self.count > 1:
+            text = '{} <i>(x{} in the last {} seconds)</i>'.format(text, self.count, round(time.time() - self.first_seen))
+        if self.dropped_replies:
+            text = '{} <i>({} older replies not sent)</i>'.format(text, self.dropped_replies)
+
+        return text
+
+
+class LogChatNotifier:
+    """Sends warnings and errors to the log chat from its own thread, so the threads reporting them never wait for
+    the bot API.
+
+    Events with the same hashtag and key (usually the subreddit's id) are merged: an event is sent delay seconds
+    after it has been reported, and once sent, the same (hashtag, key) is sent again at most once every window
+    seconds, with the number of times it has been reported in the meantime. Events that are due at the same time
+    are joined in the same message, and at most max_messages_per_minute messages are sent"""
+
+    def __init__(self, delay=5, window=300, max_messages_per_minute=10, enabled=True):
+        self._delay = delay
+        self._window = window
+        self._send_interval = 60. / max(max_messages_per_minute, 1)
+        self.enabled = enabled
+
+        self._condition = threading.Condition()
+        self._events = dict()  # (hashtag, key) -> Event
+        self._last_sent = dict()  # (hashtag, key) -> time.time() of the last message that contained the event
+        self._last_message = 0.
+        self._thread = None
+        self._stopping = False
+
+        self.reported = 0
+        self.sent_messages = 0
+
+    def start(self):
+        with self._condition:
+            if self._thread:
+                return
+
+            self._stopping = False
+            self._thread = threading.Thread(target=self._worker, name='log_notifier', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Send the pending events and stop the thread"""
+
+        with self._condition:
+            thread, self._thread = self._thread, None
+            self._stopping = True
+            self._condition.notify()
+
+        if thread:
+            thread.join()
+
+    def notify(self, hashtag, text, key=None, reply_text=None):
+        """text must be formatted as HTML. reply_text (plain text) is sent in reply to the message containing
+        the event"""
+
+        if not self.enabled:
+            message = botutils.log(text=text, parse_mode=ParseMode.HTML)
+            if message and reply_text:
+                message.reply_text(reply_text, parse_mode=None, disable_web_page_preview=True)
+            return
+
+        self.start()
+
+        now = time.time()
+        event_key = (hashtag, key)
+        with self._condition:
+            event = self._events.get(event_key, None)
+            if event is None:
+                due = max(now + self._delay, self._last_sent.get(event_key, 0.) + self._window)
+                event = self._events[event_key] = Event(text, now, due)
+
+            event.text = text
+            event.count += 1
+            if reply_text:
+                event.add_reply_text(reply_text)
+
+            self.reported += 1
+            self._condition.notify()
+
+    def _pop_due_events(self, now, flush=False) -> list:
+        due_events = [(event_key, event) for event_key, event in self._events.items() if flush or event.due <= now]
+        due_events.sort(key=lambda item: item[1].due)
+        for event_key, _ in due_events:
+            self._events.pop(event_key)
+            self._last_sent[event_key] = now
+
+        # forget the events whose window is over
+        for event_key in [k for k, sent in self._last_sent.items() if sent + self._window < now]:
+            self._last_sent.pop(event_key)
+
+        return [event for _, event in due_events]
+
+    @staticmethod
+    def _digests(events) -> list:
+        """Join the events' texts in as few messages as possible. Return a list of (text, [reply texts])"""
+
+        digests = list()
+        text, reply_texts = '', list()
+        for event in events:
+            event_text = event.digest_text()[:MAX_MESSAGE_LENGTH]
+            if text and len(text) + len(event_text) + 2 > MAX_MESSAGE_LENGTH:
+                digests.append((text, reply_texts))
+                text, reply_texts = '', list()
+
+            text = '{}\n\n{}'.format(text, event_text) if text else event_text
+            reply_texts.extend(event.reply_texts)
+
+        if text:
+            digests.append((text, reply_texts))
+
+        return digests
+
+    def _send_throttled(self, send_method, *args, **kwargs):
+        """Wait for our turn and send the message. Return None if it couldn't be sent"""
+
+        wait = self._last_message + self._send_interval - time.time()
+        if wait > 0 and not self._stopping:
+            time.sleep(wait)
+
+        try:
+            return send_method(*args, **kwargs)
+        except RetryAfter as e:
+            logger.warning('flood wait while sending a message to the log chat, dropping it: %s', str(e))
+        except TelegramError as e:
+            logger.error('error while sending a message to the log chat: %s', str(e), exc_info=True)
+        finally:
+            self._last_message = time.time()
+            self.sent_messages += 1
+
+    def _send(self, text, reply_texts):
+        message = self._send_throttled(botutils.log, text=text, parse_mode=ParseMode.HTML, disable_web_page_preview=True)
+        for reply_text in (reply_texts if message else []):
+            # replies are throttled like any other message
+            self._send_throttled(message.reply_text, reply_text[:MAX_MESSAGE_LENGTH], parse_mode=None, disable_web_page_preview=True)
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while True:
+                    now = time.time()
+                    if self._stopping:
+                        events = self._pop_due_events(now, flush=True)
+                        break
+
+                    events = self._pop_due_events(now)
+                    if events:
+                        break
+
+                    next_due = min((event.due for event in self._events.values()), default=None)
+                    self._condition.wait(timeout=next_due - now if next_due else None)
+
+                stopping = self._stopping
+
+            for text, reply_texts in self._digests(events):
+                # noinspection PyBroadException
+                try:
+                    self._send(text, reply_texts)
+                except Exception:
+                    logger.error('error while sending a message to the log chat', exc_info=True)
+
+            if stopping:
+                return
+
+    def stats(self) -> dict:
+        with self._condition:
+            return dict(reported=self.reported, sent_messages=self.sent_messages, pending=len(self._events))
+
+
+notifier_config = config.telegram.get('notifier', {})
+
+notifier = LogChatNotifier(
+    delay=notifier_config.get('delay', 5),
+    window=notifier_config.get('window', 300),
+    max_messages_per_minute=notifier_config.get('max_messages_per_minute', 10),
+    enabled=notifier_config.get('enabled', True)
+)
@@ -13,6 +13,7 @@ from database.models import Job
 from database.models import SubredditJob
 from database.models import RedditRequest
 from database.queries import settings
+from database.queries import posts
 from database.queries.channels import get_channels
 from utilities import u
 from utilities import d
@@ -97,6 +98,8 @@ def cleandb_command(update, _):
         reddit_request=RedditRequest.delete_old(days),
     )
 
+    posts.invalidate_cache()  # deleted Post rows might still be in the cache
+
     import sqlite3
     conn = sqlite3.connect(config.sqlite.filename, isolation_level=None)
     conn.execute("VACUUM")
@@ -6,6 +6,7 @@ from telegram.ext import ConversationHandler, CallbackContext
 
 from bot.conversation import Status
 from bot.markups import Keyboard
+from bot.jobs.common.scheduler import scheduler
 from database.models import Subreddit
 from utilities import u
 from utilities import d
@@ -64,6 +65,7 @@ def subconfig_on_origin_subreddit_selected(update: Update, _, subreddit=None):
 
     logger.debug('cloning r/%s to r/%s...', origin_sub.name, subreddit.name)
     Subreddit.update(**origin_dict).where(Subreddit.id == subreddit.id).execute()
+    scheduler.mark_dirty(subreddit.id)  # Model.update() doesn't send the post_save signal
 
     text = '/r/{origin_sub} (channel: {origin_channel}) settings cloned to /r/{dest_sub} (channel: {dest_channel})'.format(
         origin_sub=origin_sub.name,
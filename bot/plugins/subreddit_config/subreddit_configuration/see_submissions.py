@@ -6,9 +6,10 @@ import time
 from telegram import Update
 
 from bot.conversation import Status
-from database.models import Subreddit, Post
+from database.models import Subreddit
 from database.queries import reddit_request
-from reddit import Reddit, creds
+from database.queries import posts
+from reddit import creds, reddit_pool
 from utilities import d
 from utilities import u
 
@@ -29,7 +30,6 @@ def subconfig_on_submissions_command(update: Update, _, subreddit: Subreddit):
 
     account = creds.default_account
     client = account.default_client
-    reddit = Reddit(**account.creds_dict(), **client.creds_dict())
 
     update.message.reply_text('Fetching submissions ({} from {}, account: {}, client: {})...'.format(
         limit,
@@ -41,26 +41,30 @@ def subconfig_on_submissions_command(update: Update, _, subreddit: Subreddit):
     reddit_request.save_request(subreddit, account.username, client.name, description='submissions')
 
     lines = list()
-    for position, submission in reddit.iter_submissions(subreddit.name, multireddit_owner=subreddit.multireddit_owner,
-                                                        sorting=sorting, limit=limit):
-        created_utc_dt = datetime.datetime.utcfromtimestamp(submission.created_utc)
-        elapsed_seconds = (u.now() - created_utc_dt).total_seconds()
-        elapsed_smart_compact = u.elapsed_smart_compact(elapsed_seconds)
-
-        if Post.already_posted(subreddit, submission.id):
-            posted = 'X'
-        else:
-            posted = ' '
-
-        lines.append(BASE_STRING.format(
-            i=position,
-            id=submission.id,
-            title=submission.title[:60],
-            score=submission.score,
-            elapsed=elapsed_smart_compact,
-            posted=posted,
-            shortlink=submission.shortlink
-        ))
+    with reddit_pool.instance(account, client) as reddit:
+        listing = list(reddit.iter_submissions(subreddit.name, multireddit_owner=subreddit.multireddit_owner,
+                                               sorting=sorting, limit=limit))
+        posted_ids = posts.already_posted_ids(subreddit, [submission for _, submission in listing])
+
+        for position, submission in listing:
+            created_utc_dt = datetime.datetime.utcfromtimestamp(submission.created_utc)
+            elapsed_seconds = (u.now() - created_utc_dt).total_seconds()
+            elapsed_smart_compact = u.elapsed_smart_compact(elapsed_seconds)
+
+            if submission.id in posted_ids:
+                posted = 'X'
+            else:
+                posted = ' '
+
+            lines.append(BASE_STRING.format(
+                i=position,
+                id=submission.id,
+                title=submission.title[:60],
+                score=submission.score,
+                elapsed=elapsed_smart_compact,
+                posted=posted,
+                shortlink=submission.shortlink
+            ))
 
     reddit_request.save_request(subreddit, account.username, client.name, description='comments', weight=limit)
 
@@ -6,7 +6,7 @@ from bot.conversation import Status
 from database.models import Subreddit
 from database.models import InitialTopPost
 from database.queries import reddit_request
-from reddit import Reddit, creds
+from reddit import creds, reddit_pool
 from utilities import d
 
 logger = logging.getLogger('handler')
@@ -21,7 +21,6 @@ def subconfig_on_savetop_command(update: Update, _, subreddit: Subreddit):
 
     account = creds.default_account
     client = account.default_client
-    reddit = Reddit(**account.creds_dict(), **client.creds_dict())
 
     if subreddit.sorting not in ('month', 'all'):
         update.message.reply_text('This subreddit\'s sorting is not "month" or "all"')
@@ -30,13 +29,14 @@ def subconfig_on_savetop_command(update: Update, _, subreddit: Subreddit):
     reddit_request.save_request(subreddit, account.username, client.name, description='submissions')
 
     duplicates = 0
-    for submission in reddit.iter_top(name=subreddit.name, limit=subreddit.limit, period=subreddit.sorting):
-        if InitialTopPost.is_initial_top_post(subreddit.name, submission.id, subreddit.sorting):
-            duplicates += 1
-            continue
-
-        itp = InitialTopPost(submission_id=submission.id, subreddit_name=subreddit.name, sorting=subreddit.sorting)
-        itp.save()
+    with reddit_pool.instance(account, client) as reddit:
+        for submission in reddit.iter_top(name=subreddit.name, limit=subreddit.limit, period=subreddit.sorting):
+            if InitialTopPost.is_initial_top_post(subreddit.name, submission.id, subreddit.sorting):
+                duplicates += 1
+                continue
+
+            itp = InitialTopPost(submission_id=submission.id, subreddit_name=subreddit.name, sorting=subreddit.sorting)
+            itp.save()
 
     update.message.reply_html('/r/{s.name}: saved {saved}/{s.limit} top posts ("{s.sorting}")'.format(
         s=subreddit,
@@ -6,7 +6,7 @@ from telegram.error import TelegramError
 from telegram.error import BadRequest
 
 from bot import mainbot
-from bot.logging import slogger
+from bot.logging import get_subreddit_logger
 from utilities import d
 from database.models import Subreddit
 from reddit import Sender
@@ -25,9 +25,9 @@ def on_placeholders_command(update, context):
 
     sender = None
     subreddit = Subreddit.select().where(Subreddit.channel.is_null(False)).get()
-    slogger.set_subreddit(subreddit)
+    subreddit_logger = get_subreddit_logger(subreddit)
     for position, submission in reddit.iter_submissions(subreddit.name, limit=1):
-        sender = Sender(context.bot, subreddit, submission, slogger)
+        sender = Sender(context.bot, subreddit, submission, subreddit_logger)
         break
     
     placeholders = list()
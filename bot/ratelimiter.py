@@ -0,0 +1,129 @@
+import logging
+import threading
+import time
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+# the API methods that send/edit a message: they count for the global and the per-chat limits
+MESSAGE_METHODS_PREFIXES = ('send', 'forward', 'copy', 'edit')
+
+
+class TokenBucket:
+    """Thread-safe token bucket. Tokens are reserved in advance (the balance can go negative), so concurrent
+    callers are served in order and just sleep for their turn, without busy-waiting"""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate  # tokens per second
+        self.capacity = max(capacity, 1)
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0
+
+    def reserve(self) -> float:
+        """Take a token and return how many seconds the caller has to wait before using it"""
+
+        with self._lock:
+            now = time.monotonic()
+            # _last is in the future while the bucket is paused
+            self._tokens = min(self.capacity, self._tokens + max(0, now - self._last) * self.rate)
+            self._last = max(now, self._last)
+
+            self._tokens -= 1
+            wait = 0 if self._tokens >= 0 else -self._tokens / self.rate
+
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            # the requests sent during the pause have been rejected: start again with an empty bucket
+            self._tokens = min(self._tokens, 0)
+            self._last = self._paused_until
+
+
+class RateLimiter:
+    """Shared limits for the requests sent to Telegram by all the threads: a global bucket for the messages sent
+    to any chat, one bucket per chat, and optional per-method buckets"""
+
+    def __init__(self, global_per_second=25, chat_per_minute=20, chat_burst=3, private_chat_per_second=1,
+                 methods_per_minute=None, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_per_second, capacity=global_per_second)
+        self._chat_per_minute = chat_per_minute
+        self._chat_burst = chat_burst
+        self._private_chat_per_second = private_chat_per_second
+        self._chats = dict()
+        self._methods = {
+            method.lower(): TokenBucket(per_minute / 60, capacity=1)
+            for method, per_minute in (methods_per_minute or {}).items()
+        }
+
+    def _chat_bucket(self, chat_id) -> TokenBucket:
+        with self._lock:
+            if chat_id not in self._chats:
+                if isinstance(chat_id, int) and chat_id > 0:
+                    # private chats (eg. the admins): Telegram allows about one message per second
+                    self._chats[chat_id] = TokenBucket(self._private_chat_per_second, capacity=self._chat_burst)
+                else:
+                    # channels and groups (negative ids or @usernames)
+                    self._chats[chat_id] = TokenBucket(self._chat_per_minute / 60, capacity=self._chat_burst)
+
+            return self._chats[chat_id]
+
+    def _buckets(self, method, chat_id) -> list:
+        method = method.lower()
+
+        buckets = list()
+        if method.startswith(MESSAGE_METHODS_PREFIXES):
+            buckets.append(self._global)
+            if chat_id is not None:
+                buckets.append(self._chat_bucket(chat_id))
+
+        if method in self._methods:
+            buckets.append(self._methods[method])
+
+        return buckets
+
+    def acquire(self, method, chat_id=None):
+        if not self.enabled:
+            return
+
+        buckets = self._buckets(method, chat_id)
+        if not buckets:
+            return
+
+        wait = max(bucket.reserve() for bucket in buckets)
+        if wait > 0:
+            logger.debug('rate limiter: %s to %s has to wait %.2f seconds', method, chat_id, wait)
+            time.sleep(wait)
+
+    def retry_after(self, method, chat_id, seconds):
+        """Telegram asked us to wait: pause only the bucket the limit refers to (the chat's one if the request was
+        sent to a chat, otherwise the method's one)"""
+
+        logger.warning('rate limiter: flood wait of %s seconds for %s (chat: %s)', seconds, method, chat_id)
+
+        if chat_id is not None:
+            self._chat_bucket(chat_id).pause(seconds)
+        elif method.lower() in self._methods:
+            self._methods[method.lower()].pause(seconds)
+        else:
+            self._global.pause(seconds)
+
+
+rate_limiter_config = config.telegram.get('rate_limiter', {})
+
+rate_limiter = RateLimiter(
+    enabled=rate_limiter_config.get('enabled', True),
+    global_per_second=rate_limiter_config.get('global_per_second', 25),
+    chat_per_minute=rate_limiter_config.get('chat_per_minute', 20),
+    chat_burst=rate_limiter_config.get('chat_burst', 3),
+    private_chat_per_second=rate_limiter_config.get('private_chat_per_second', 1),
+    methods_per_minute=rate_limiter_config.get('methods', None)
+)
+
+max_retries = rate_limiter_config.get('max_retries', 2)
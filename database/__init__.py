@@ -1,12 +1,121 @@
+import logging
+import threading
+import time
+
 from playhouse.sqlite_ext import SqliteExtDatabase
 
 from config import config
 
+logger = logging.getLogger(__name__)
+
+# statements that need SQLite's write lock
+WRITE_STATEMENTS = ('INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'CREATE', 'DROP', 'ALTER', 'BEGIN IMMEDIATE', 'BEGIN EXCLUSIVE')
+
+
+class BotDatabase(SqliteExtDatabase):
+    """Every thread reads through its own connection (peewee's connections are thread-local, and in WAL mode
+    readers never wait for the writer), but only one thread at a time can write: the others wait on an in-process
+    lock instead of polling SQLite until it stops returning "database is locked".
+
+    The writer lock is acquired by the first write statement (or by "BEGIN IMMEDIATE") and held until the
+    statement/the transaction ends. Transactions are IMMEDIATE by default, so they take it when they start: a
+    DEFERRED transaction that reads before writing would fail with "database is locked" if another thread committed
+    in the meantime. Time spent waiting for it is measured, see lock_stats()"""
+
+    def __init__(self, *args, **kwargs):
+        SqliteExtDatabase.__init__(self, *args, **kwargs)
+        self._writer_lock = threading.Lock()
+        self._writer_local = threading.local()
+
+        self._stats_lock = threading.Lock()
+        self._lock_waits = 0
+        self._lock_wait_seconds = 0.0
+        self._max_lock_wait = 0.0
+
+    def _holds_writer_lock(self):
+        return getattr(self._writer_local, 'holds_lock', False)
+
+    def _acquire_writer_lock(self):
+        start = time.perf_counter()
+        self._writer_lock.acquire()
+        waited = time.perf_counter() - start
+
+        self._writer_local.holds_lock = True
+
+        with self._stats_lock:
+            self._lock_waits += 1
+            self._lock_wait_seconds += waited
+            self._max_lock_wait = max(self._max_lock_wait, waited)
+
+        if waited > 1:
+            logger.debug('waited %.2f seconds for the database writer lock', waited)
+
+    def _release_writer_lock(self):
+        if self._holds_writer_lock():
+            self._writer_local.holds_lock = False
+            self._writer_lock.release()
+
+    def execute_sql(self, sql, params=None, commit=None):
+        if self._holds_writer_lock() or not sql.lstrip().upper().startswith(WRITE_STATEMENTS):
+            return SqliteExtDatabase.execute_sql(self, sql, params)
+
+        self._acquire_writer_lock()
+        begins_transaction = sql.lstrip().upper().startswith('BEGIN')
+        try:
+            return SqliteExtDatabase.execute_sql(self, sql, params)
+        except Exception:
+            if begins_transaction:
+                self._release_writer_lock()
+            raise
+        finally:
+            if not begins_transaction and not self.in_transaction():
+                # autocommit statement: it's already committed
+                self._release_writer_lock()
+            # inside a transaction (peewee runs BEGIN before registering it), the lock is released on commit/rollback
+
+    def transaction(self, lock_type='IMMEDIATE'):
+        # atomic() blocks use it too, when they are not nested
+        return SqliteExtDatabase.transaction(self, lock_type=lock_type)
+
+    def commit(self):
+        try:
+            return SqliteExtDatabase.commit(self)
+        finally:
+            self._release_writer_lock()
+
+    def rollback(self):
+        try:
+            return SqliteExtDatabase.rollback(self)
+        finally:
+            self._release_writer_lock()
+
+    def lock_stats(self, reset=False) -> dict:
+        with self._stats_lock:
+            stats = dict(
+                writes=self._lock_waits,
+                wait_seconds=round(self._lock_wait_seconds, 2),
+                max_wait_seconds=round(self._max_lock_wait, 2)
+            )
+
+            if reset:
+                self._lock_waits = 0
+                self._lock_wait_seconds = 0.0
+                self._max_lock_wait = 0.0
+
+        return stats
+
+
 # we disable foreign keys costraints for now, as the database FK costraints are kinda messed up, and to fix them
 # we have to create the tables again (since FK costraint (ON DELETE and so on) are set during tables creation
 # and can't be updated afterwards)
 # for reference: https://stackoverflow.com/q/1884818/13350541
-db = SqliteExtDatabase(config.sqlite.filename, pragmas={'journal_mode': 'wal', 'foreign_keys': 0})
+db = BotDatabase(
+    config.sqlite.filename,
+    pragmas={'journal_mode': 'wal', 'foreign_keys': 0},
+    # other processes (eg. migrations, manual queries) might hold the write lock: SQLite waits up to busy_timeout
+    # seconds before raising "database is locked"
+    timeout=config.sqlite.get('busy_timeout', 30)
+)
 
 
 @db.func()
@@ -12,6 +12,7 @@ from .initial_top_post import InitialTopPost
 from .style import Style
 from .setting import Setting
 from .flair import Flair
+from .send_strategy import SendStrategy
 
 from database import db
 
@@ -32,5 +33,6 @@ def create_tables():
             InitialTopPost,
             Style,
             Setting,
-            Flair
+            Flair,
+            SendStrategy
         ])
@@ -1,12 +1,14 @@
 import datetime
 
 import peewee
+from playhouse import signals
 from playhouse.shortcuts import model_to_dict
 
 from database import db
 
 
-class Channel(peewee.Model):
+# signals.Model: saving/deleting a row notifies the stream scheduler (bot/jobs/common/scheduler.py)
+class Channel(signals.Model):
     channel_id = peewee.IntegerField(primary_key=True, index=True)
     title = peewee.CharField(null=False)
     username = peewee.CharField(null=True)
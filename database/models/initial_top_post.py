@@ -41,6 +41,19 @@ class InitialTopPost(peewee.Model):
         except peewee.DoesNotExist:
             return False
 
+    @classmethod
+    def initial_top_post_ids(cls, subreddit_name, submission_ids, sorting) -> set:
+        if not submission_ids:
+            return set()
+
+        query = cls.select(cls.submission_id).where(
+            cls.subreddit_name == subreddit_name,
+            cls.submission_id << list(submission_ids),
+            cls.sorting == sorting
+        )
+
+        return {row.submission_id for row in query}
+
     @classmethod
     def to_dict(cls):
         return model_to_dict(cls)
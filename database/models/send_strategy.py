@@ -0,0 +1,30 @@
+import datetime
+
+import peewee
+
+from database import db
+
+
+class SendStrategy(peewee.Model):
+    """How sending medias of a domain by url or by uploading them went, for each handler type (see
+    reddit/sendstrategy.py). Counters and latencies are exponentially decayed averages"""
+
+    id = peewee.IntegerField(primary_key=True)
+    domain = peewee.CharField(null=False)
+    handler = peewee.CharField(null=False)
+    path = peewee.CharField(null=False)  # "url" or "upload"
+    successes = peewee.FloatField(default=0.0)
+    failures = peewee.FloatField(default=0.0)
+    success_seconds = peewee.FloatField(default=0.0)
+    failure_seconds = peewee.FloatField(default=0.0)
+    updated_utc = peewee.DateTimeField(default=datetime.datetime.utcnow)
+
+    class Meta:
+        table_name = 'send_strategies'
+        database = db
+        indexes = (
+            (('domain', 'handler', 'path'), True),
+        )
+
+    def __repr__(self):
+        return '<SendStrategy row {}: {} {} {}>'.format(self.id, self.domain, self.handler, self.path)
@@ -3,6 +3,7 @@ import json
 from typing import TypeVar, Type, Union
 
 import peewee
+from playhouse import signals
 from playhouse.shortcuts import model_to_dict
 
 from database import db
@@ -22,7 +23,8 @@ DATETIME_ORMATS = [
 S = TypeVar('S', bound='Subreddit')
 
 
-class Subreddit(peewee.Model):
+# signals.Model: saving/deleting a row notifies the stream scheduler (bot/jobs/common/scheduler.py)
+class Subreddit(signals.Model):
     id = peewee.AutoField()
     subreddit_id = peewee.CharField(index=True)
     name = peewee.CharField(null=False, default=0)
@@ -1,24 +1,27 @@
 import peewee
 
 from ..models import Flair
+from ..writebehind import write_behind
 from utilities import u
 
 
 def save_flair(subreddit, flair):
+    """The flair is saved in background by the write-behind writer"""
+
+    write_behind.call(_save_flair, subreddit, flair)
+
+
+def _save_flair(subreddit, flair):
     flair_lower = flair.lower()
     subreddit_name_lower = subreddit.lower()
 
-    created = False
     try:
         flair = Flair.get(Flair.subreddit_name == subreddit_name_lower, Flair.flair == flair_lower)
         flair.last_seen_utc = u.now(utc=True)  # update last seen datetime
     except peewee.DoesNotExist:
         flair = Flair(subreddit_name=subreddit_name_lower, flair=flair_lower)
-        created = True
-
-    flair.save()
 
-    return created
+    return flair.save()  # number of rows saved
 
 
 def get_flairs(subreddit_name):
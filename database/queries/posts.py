@@ -0,0 +1,148 @@
+import datetime
+import logging
+import threading
+from collections import defaultdict
+
+from ..models import Post
+from utilities import u
+from config import config
+
+logger = logging.getLogger(__name__)
+
+
+class PostedSubmissionsCache:
+    """In-memory copy of the (subreddit id, submission id) pairs in the posts table, limited to the posts sent in
+    the last window_days days.
+
+    Once warmed, the cache is authoritative for the submissions created after the start of the window: Post rows are
+    only created by Sender.register_post(), which also adds the submission to the cache, and a submission can't have
+    been posted before it was created. Older submissions have to be looked up in the database.
+    It has to be invalidated when rows are deleted from the posts table (it will be warmed again on the next lookup)"""
+
+    def __init__(self, window_days=14):
+        self._window = datetime.timedelta(days=window_days)
+        self._lock = threading.Lock()
+        self._posted = defaultdict(dict)  # subreddit id -> {submission id: posted_at}
+        self._since = None  # start of the window, None until warmed
+        self._trimmed_at = None
+
+    @property
+    def is_warm(self):
+        return self._since is not None
+
+    def warm(self):
+        since = u.now() - self._window
+        posted = defaultdict(dict)
+        rows_count = 0
+        query = (
+            Post.select(Post.subreddit, Post.submission_id, Post.posted_at)
+            .where((Post.posted_at >= since) | (Post.posted_at.is_null()))
+            .tuples()
+        )
+        for subreddit_id, submission_id, posted_at in query:
+            posted[subreddit_id][submission_id] = posted_at or since
+            rows_count += 1
+
+        with self._lock:
+            # keep what has been added while we were reading the table
+            for subreddit_id, submissions in self._posted.items():
+                posted[subreddit_id].update(submissions)
+
+            self._posted = posted
+            self._since = since
+            self._trimmed_at = since
+
+        logger.info('posted submissions cache warmed: %d rows, %d subreddits', rows_count, len(posted))
+
+    def invalidate(self):
+        with self._lock:
+            self._posted = defaultdict(dict)
+            self._since = None
+
+    def add(self, subreddit_id, submission_id):
+        # also recorded while the cache is not warm: warm() merges it with the rows read from the table
+        with self._lock:
+            self._posted[subreddit_id][submission_id] = u.now()
+
+    def _trim(self, now):
+        """Forget the posts that are out of the window. Done at most once an hour"""
+
+        if self._since is None or now - self._trimmed_at < datetime.timedelta(hours=1):
+            return
+
+        since = now - self._window
+        for subreddit_id in list(self._posted.keys()):
+            submissions = self._posted[subreddit_id]
+            for submission_id in [s_id for s_id, posted_at in submissions.items() if posted_at < since]:
+                submissions.pop(submission_id)
+
+            if not submissions:
+                self._posted.pop(subreddit_id)
+
+        self._since = since
+        self._trimmed_at = now
+
+    def posted_ids(self, subreddit_id, submissions) -> tuple:
+        """Return (ids of the posted submissions, ids of the submissions the cache can't tell about because they
+        were created before the start of the window)"""
+
+        with self._lock:
+            self._trim(u.now())
+
+            since_timestamp = self._since.replace(tzinfo=datetime.timezone.utc).timestamp()
+            posted = self._posted.get(subreddit_id, {})
+            posted_ids, unknown_ids = set(), list()
+            for submission in submissions:
+                if submission.id in posted:
+                    posted_ids.add(submission.id)
+                elif submission.created_utc < since_timestamp:
+                    unknown_ids.append(submission.id)
+
+        return posted_ids, unknown_ids
+
+
+cache = PostedSubmissionsCache(window_days=config.jobs.get('posted_submissions_cache_days', 14))
+
+
+def cache_enabled():
+    return config.jobs.get('posted_submissions_cache', True)
+
+
+def warm_cache():
+    if cache_enabled():
+        cache.warm()
+
+
+def invalidate_cache():
+    cache.invalidate()
+
+
+def _query_posted_ids(subreddit, submission_ids) -> set:
+    if not submission_ids:
+        return set()
+
+    query = Post.select(Post.submission_id).where(Post.subreddit == subreddit, Post.submission_id << list(submission_ids))
+
+    return {post.submission_id for post in query}
+
+
+def already_posted_ids(subreddit, submissions) -> set:
+    """Return the ids, among the passed submissions, of the submissions that have already been posted for
+    the subreddit"""
+
+    if not submissions:
+        return set()
+
+    if cache_enabled():
+        if not cache.is_warm:
+            cache.warm()
+
+        posted_ids, unknown_ids = cache.posted_ids(subreddit.id, submissions)
+
+        return posted_ids | _query_posted_ids(subreddit, unknown_ids)
+
+    return _query_posted_ids(subreddit, [submission.id for submission in submissions])
+
+
+def register_posted(subreddit, submission_id):
+    cache.add(subreddit.id, submission_id)
@@ -1,10 +1,136 @@
 import datetime
-
-from peewee import fn
+import logging
+import threading
+from collections import Counter
+from collections import deque
 
 from ..models import RedditRequest
+from ..writebehind import write_behind
 from config import reddit
 
+logger = logging.getLogger(__name__)
+
+
+class RequestsUsage:
+    """In-memory, rolling copy of the weights of the requests sent in the last window_hours, per (account, client)
+    pair. Requests are added to time buckets of bucket_minutes: when a bucket falls out of the window, its weights
+    are subtracted from the totals, so usage queries only have to go through the pairs, not the requests.
+
+    Once warmed, it's authoritative for the stream job: requests are saved through save_request(), which also adds
+    them here"""
+
+    def __init__(self, window_hours=48, bucket_minutes=10):
+        self._lock = threading.Lock()
+        self._window = datetime.timedelta(hours=window_hours)
+        self._bucket_size = datetime.timedelta(minutes=bucket_minutes)
+        self._buckets = deque()  # (bucket start, weights Counter, requests Counter), oldest first. Counter keys: (account, client)
+        self._totals = Counter()  # (account, client) -> weight
+        self._requests = Counter()  # (account, client) -> number of requests
+        self._warm = False
+
+    @property
+    def is_warm(self):
+        return self._warm
+
+    def _bucket_start(self, dt):
+        seconds = self._bucket_size.total_seconds()
+        return datetime.datetime.utcfromtimestamp((dt.replace(tzinfo=datetime.timezone.utc).timestamp() // seconds) * seconds)
+
+    def _expire(self, now):
+        oldest_valid = self._bucket_start(now - self._window)
+        while self._buckets and self._buckets[0][0] < oldest_valid:
+            _, weights, requests = self._buckets.popleft()
+            self._totals.subtract(weights)
+            self._requests.subtract(requests)
+
+        # drop the pairs that have not been used in the window
+        self._totals += Counter()
+        self._requests += Counter()
+
+    def _add(self, account_name, client_name, weight, dt):
+        bucket_start = self._bucket_start(dt)
+
+        # requests are added (roughly) in chronological order: the right bucket is almost always the last one
+        position = len(self._buckets)
+        while position > 0 and self._buckets[position - 1][0] > bucket_start:
+            position -= 1
+
+        if position > 0 and self._buckets[position - 1][0] == bucket_start:
+            _, weights, requests = self._buckets[position - 1]
+        else:
+            # no bucket for this time yet (it might fall between two existing buckets)
+            weights, requests = Counter(), Counter()
+            self._buckets.insert(position, (bucket_start, weights, requests))
+
+        weights[(account_name, client_name)] += weight
+        requests[(account_name, client_name)] += 1
+
+        self._totals[(account_name, client_name)] += weight
+        self._requests[(account_name, client_name)] += 1
+
+    def warm(self):
+        now = datetime.datetime.utcnow()
+        query = (
+            RedditRequest.select(RedditRequest.account_name, RedditRequest.client_name, RedditRequest.weight, RedditRequest.request_datetime_utc)
+            .where(RedditRequest.request_datetime_utc > now - self._window)
+            .order_by(RedditRequest.request_datetime_utc)
+            .tuples()
+        )
+
+        with self._lock:
+            self._buckets = deque()
+            self._totals = Counter()
+            self._requests = Counter()
+
+            rows_count = 0
+            for account_name, client_name, weight, request_dt in query:
+                self._add(account_name, client_name, 1 if weight is None else weight, request_dt)
+                rows_count += 1
+
+            self._warm = True
+
+        logger.info('reddit requests usage warmed: %d rows, %d account/client pairs', rows_count, len(self._totals))
+
+    def add(self, account_name, client_name, weight=1, dt=None):
+        with self._lock:
+            if self._warm:
+                self._add(account_name, client_name, weight, dt or datetime.datetime.utcnow())
+
+    def totals(self, creds_type) -> Counter:
+        """Weights of the requests sent in the window by each account or client"""
+
+        if creds_type not in ('account', 'client'):
+            raise ValueError
+
+        with self._lock:
+            self._expire(datetime.datetime.utcnow())
+
+            totals = Counter()
+            for (account_name, client_name), weight in self._totals.items():
+                totals[account_name if creds_type == 'account' else client_name] += weight
+
+        return totals
+
+    def pairs_usage(self) -> list:
+        """Number of requests sent in the window by each (account, client) pair, most used first"""
+
+        with self._lock:
+            self._expire(datetime.datetime.utcnow())
+
+            rows = [
+                dict(account_name=account_name, client_name=client_name, count=count)
+                for (account_name, client_name), count in self._requests.items()
+            ]
+
+        return sorted(rows, key=lambda row: row['count'], reverse=True)
+
+
+usage = RequestsUsage(window_hours=reddit.general.stress_threshold_hours)
+
+
+def warm_usage():
+    usage.warm()
+
 
 def delete_old(days=14):
     query = RedditRequest.delete().where(RedditRequest.request_datetime_utc < (datetime.datetime.utcnow() - datetime.timedelta(days=days)))
@@ -16,7 +142,7 @@ def save_request(subreddit, account_name, client_name, weight=1, description=Non
         dt = datetime.datetime.utcnow()
 
     reddit_request = RedditRequest(
-        subreddit=subreddit,
+        subreddit=subreddit.id,  # works with both Subreddit rows and snapshots
         subreddit_name=subreddit.name,
         account_name=account_name,
         client_name=client_name,
@@ -24,57 +150,28 @@ def save_request(subreddit, account_name, client_name, weight=1, description=Non
         weight=weight,
         request_datetime_utc=dt
     )
-    reddit_request.save()
-
-
-def least_stressed(creds_type, valid_names, hours=None) -> list:
-    """Will return a list of clients names
-    If valid_names contains clients that have never been used as per the database, then these clients will be returned
-    Else, it will return a list of clients from the least used to the most used one"""
-    if not hours:
-        hours = reddit.general.stress_threshold_hours
-
-    delta = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
-
-    if creds_type == 'account':
-        group_by = RedditRequest.account_name
-    elif creds_type == 'client':
-        group_by = RedditRequest.client_name
-    else:
-        raise ValueError
-
-    query = (
-        RedditRequest.select(group_by.alias('name'), fn.SUM(RedditRequest.weight.is_null(1)).alias('count'))
-        .where(RedditRequest.request_datetime_utc > delta, group_by << valid_names)
-        .group_by(group_by)
-        .order_by(fn.Count(RedditRequest.id))  # ascending by default
-    )
+    write_behind.save(reddit_request)
+    usage.add(account_name, client_name, weight=weight, dt=dt)
 
-    # if valid_names contains a name that we haven't used yet (not in the db), use that one
-    # if there are no items in the db, the full list will be used
-    db_items = [item.name for item in query]
-    unused_config_items = list(set(valid_names) - set(db_items))
-    if unused_config_items:
-        return unused_config_items
 
-    return [row.name for row in query]  # first element -> less usage
+def least_stressed(creds_type, valid_names) -> list:
+    """Will return the list of valid_names from the least used to the most used one in the last
+    stress_threshold_hours. Names that have never been used come first, in their original order"""
 
+    if not usage.is_warm:
+        usage.warm()
 
-def creds_usage(valid_accouns=None, valid_clients=None, hours=None):
-    if not hours:
-        hours = reddit.general.stress_threshold_hours
+    totals = usage.totals(creds_type)
 
-    delta = datetime.datetime.utcnow() - datetime.timedelta(hours=hours)
+    return sorted(valid_names, key=lambda name: totals[name])  # stable sort, first element -> less usage
 
-    query = (
-        RedditRequest.select(RedditRequest.account_name, RedditRequest.client_name, fn.Count(RedditRequest.id).alias('count'))
-        .where(
-            RedditRequest.request_datetime_utc > delta,
-            ((RedditRequest.account_name << valid_accouns if valid_accouns else True) | (RedditRequest.account_name.is_null())),
-            RedditRequest.client_name << valid_clients if valid_clients else True
-        )
-        .group_by(RedditRequest.account_name, RedditRequest.client_name)
-        .order_by(fn.Count(RedditRequest.id).desc())  # ascending by default
-    ).dicts()
 
-    return [row for row in query]
+def creds_usage(valid_accouns=None, valid_clients=None):
+    if not usage.is_warm:
+        usage.warm()
+
+    return [
+        row for row in usage.pairs_usage()
+        if (not valid_accouns or row['account_name'] in valid_accouns or row['account_name'] is None)
+        and (not valid_clients or row['client_name'] in valid_clients)
+    ]
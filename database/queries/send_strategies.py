@@ -0,0 +1,29 @@
+import datetime
+
+from ..models import SendStrategy
+from ..writebehind import write_behind
+
+
+def load_all() -> list:
+    return [row for row in SendStrategy.select()]
+
+
+def save(domain, handler, path, successes, failures, success_seconds, failure_seconds):
+    """The row is upserted in background by the write-behind writer"""
+
+    query = SendStrategy.insert(
+        domain=domain,
+        handler=handler,
+        path=path,
+        successes=successes,
+        failures=failures,
+        success_seconds=success_seconds,
+        failure_seconds=failure_seconds,
+        updated_utc=datetime.datetime.utcnow()
+    ).on_conflict(
+        conflict_target=[SendStrategy.domain, SendStrategy.handler, SendStrategy.path],
+        preserve=[SendStrategy.successes, SendStrategy.failures, SendStrategy.success_seconds,
+                  SendStrategy.failure_seconds, SendStrategy.updated_utc]
+    )
+
+    write_behind.execute(query)
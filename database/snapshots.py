@@ -0,0 +1,101 @@
+from .models import Subreddit
+from .models import Channel
+from .models import Style
+
+
+class Snapshot:
+    """Read-only copy of a row's column values, with no reference to the database.
+
+    Snapshots can be shared between threads and never run a query: foreign keys are resolved when the snapshot is
+    built. Use replace() to get a modified copy"""
+
+    __slots__ = ()
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            object.__setattr__(self, name, values.get(name, None))
+
+    def __setattr__(self, key, value):
+        raise AttributeError('{} is read-only, use replace()'.format(type(self).__name__))
+
+    def __delattr__(self, key):
+        raise AttributeError('{} is read-only'.format(type(self).__name__))
+
+    def replace(self, **changes):
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+
+        return type(self)(**values)
+
+    @staticmethod
+    def _row_values(row) -> dict:
+        # __data__ contains the columns' values: FKs are just the related row's id
+        return dict(row.__data__)
+
+
+class ChannelSnapshot(Snapshot):
+    __slots__ = tuple(Channel._meta.sorted_field_names)
+
+    link = Channel.link
+    get_invite_link = Channel.get_invite_link
+
+    def __repr__(self):
+        return '<ChannelSnapshot {}: {}>'.format(self.channel_id, self.title)
+
+    @classmethod
+    def from_row(cls, row: Channel):
+        return cls(**cls._row_values(row))
+
+
+class StyleSnapshot(Snapshot):
+    __slots__ = tuple(Style._meta.sorted_field_names)
+
+    def __repr__(self):
+        return '<StyleSnapshot {}: {}>'.format(self.style_id, self.name)
+
+    @classmethod
+    def from_row(cls, row: Style):
+        return cls(**cls._row_values(row))
+
+
+class SubredditSnapshot(Snapshot):
+    # "channel" and "style" are snapshots too, their ids are available as channel_id/style_id like for the model
+    __slots__ = tuple(Subreddit._meta.sorted_field_names) + ('channel_id', 'style_id', 'logger')
+
+    # read-only properties/methods borrowed from the model
+    channel_title = Subreddit.channel_title
+    channel_username = Subreddit.channel_username
+    get_channel_invite_link = Subreddit.get_channel_invite_link
+    channel_link = Subreddit.channel_link
+    prefix = Subreddit.prefix
+    prefix_with_slashes = Subreddit.prefix_with_slashes
+    r_name = Subreddit.r_name
+    subreddit_link = Subreddit.subreddit_link
+    r_inline_link = Subreddit.r_inline_link
+    sorting_pretty = Subreddit.sorting_pretty
+    r_name_with_id = Subreddit.r_name_with_id
+    ch_title = Subreddit.ch_title
+    is_enabled = Subreddit.is_enabled
+    deeplink = Subreddit.deeplink
+    html_deeplink = Subreddit.html_deeplink
+    template_has_hashtag = Subreddit.template_has_hashtag
+    get_users_blacklist = Subreddit.get_users_blacklist
+
+    def __repr__(self):
+        return '<SubredditSnapshot {}: {}>'.format(self.id, self.name)
+
+    @classmethod
+    def from_row(cls, row: Subreddit, style: Style = None, logger=None):
+        """The row must have been selected together with its Channel (and Style), otherwise building the snapshot
+        runs a query for each of them. style is used when the row doesn't have one"""
+
+        values = cls._row_values(row)
+        values['channel_id'] = values.get('channel', None)
+        values['channel'] = ChannelSnapshot.from_row(row.channel) if row.channel else None
+
+        style = row.style or style
+        values['style'] = StyleSnapshot.from_row(style) if style else None
+        values['style_id'] = style.style_id if style else None
+        values['logger'] = logger
+
+        return cls(**values)
@@ -0,0 +1,183 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+
+import peewee
+
+from database import db
+from config import config
+
+logger = logging.getLogger(__name__)
+
+_FLUSH = object()
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """A single background thread that writes telemetry rows (requests, jobs, flairs...) in batches: the
+    operations queued in the last flush_interval seconds (or max_batch operations) are executed in one
+    transaction, instead of one commit each from every thread.
+
+    Operations are executed in the same order they are queued. Only use it for rows nobody needs to read back
+    immediately. When disabled, operations are executed right away by the calling thread"""
+
+    def __init__(self, flush_interval=0.5, max_batch=200, enabled=True):
+        self.enabled = enabled
+        self._flush_interval = flush_interval
+        self._max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.written = 0
+        self.failed = 0
+        self.unchanged = 0
+        self.batches = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._writer, name='db_write_behind', daemon=True)
+                self._thread.start()
+
+    def call(self, func, *args, **kwargs):
+        # operations might read before writing (eg. flairs): the write lock is taken when the transaction starts,
+        # otherwise a commit from another connection between the read and the write makes the write fail
+        if not self.enabled:
+            with db.atomic('IMMEDIATE'):
+                return func(*args, **kwargs)
+
+        self._start()
+        self._queue.put((func, args, kwargs))
+
+    def save(self, model_instance):
+        self.call(model_instance.save)
+
+    def execute(self, query):
+        self.call(query.execute)
+
+    def flush(self, timeout=None):
+        """Block until all the operations queued so far have been written"""
+
+        if not self.enabled or self._thread is None:
+            return
+
+        done = threading.Event()
+        self._queue.put((_FLUSH, done))
+        done.wait(timeout)
+
+    def stop(self):
+        """Write everything is still queued and stop the writer thread"""
+
+        if self._thread is None:
+            return
+
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+        logger.info('write-behind writer stopped (rows written: %d, failed: %d, unchanged: %d, batches: %d)',
+                    self.written, self.failed, self.unchanged, self.batches)
+
+    @staticmethod
+    def _saved_instances(batch) -> list:
+        """(instance, primary key) of the model instances saved by the batch, before the batch is executed"""
+
+        instances = dict()
+        for func, _, _ in batch:
+            instance = getattr(func, '__self__', None)
+            if isinstance(instance, peewee.Model) and id(instance) not in instances:
+                instances[id(instance)] = (instance, instance._pk)
+
+        return list(instances.values())
+
+    def _write(self, batch):
+        saved_instances = self._saved_instances(batch)
+        try:
+            with db.atomic('IMMEDIATE'):
+                for func, args, kwargs in batch:
+                    func(*args, **kwargs)
+        except Exception as e:
+            # the whole transaction has been rolled back: run the operations one by one so only the broken ones are lost
+            logger.warning('error while writing a batch of %d operations (%s): executing them one by one', len(batch), str(e))
+
+            # the instances inserted by the batch keep the rolled back primary key: saving them again would update
+            # a row that doesn't exist
+            for instance, pk in saved_instances:
+                instance._pk = pk
+
+            for func, args, kwargs in batch:
+                # noinspection PyBroadException
+                try:
+                    with db.atomic('IMMEDIATE'):
+                        result = func(*args, **kwargs)
+                except Exception:
+                    logger.error('write-behind operation %s failed', func, exc_info=True)
+                    self.failed += 1
+                else:
+                    if result == 0:
+                        # an update that didn't match any row
+                        logger.warning('write-behind operation %s did not change any row', func)
+                        self.unchanged += 1
+                    else:
+                        self.written += 1
+        else:
+            self.written += len(batch)
+
+        self.batches += 1
+
+    def _writer(self):
+        stop = False
+        while not stop:
+            batch = list()
+            flush_events = list()
+
+            item = self._queue.get()
+            deadline = time.monotonic() + self._flush_interval
+            while True:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, tuple) and item[0] is _FLUSH:
+                    flush_events.append(item[1])
+                else:
+                    batch.append(item)
+
+                if stop or flush_events or len(batch) >= self._max_batch:
+                    break
+
+                try:
+                    item = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+
+            if stop:
+                # drain the operations queued after the stop request
+                while True:
+                    try:
+                        item = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+
+                    if isinstance(item, tuple) and item[0] is _FLUSH:
+                        flush_events.append(item[1])
+                    elif item is not _STOP:
+                        batch.append(item)
+
+            if batch:
+                self._write(batch)
+
+            for event in flush_events:
+                event.set()
+
+
+sqlite_config = config.sqlite
+
+write_behind = WriteBehindQueue(
+    flush_interval=sqlite_config.get('write_behind_interval_ms', 500) / 1000,
+    max_batch=sqlite_config.get('write_behind_max_rows', 200),
+    enabled=sqlite_config.get('write_behind', True)
+)
+
+atexit.register(write_behind.stop)
@@ -1 +1,4 @@
 from .pyroutils import PyroClient
+from .pyroutils import mtproto
+from .uploader import UploadCanceled
+from .uploader import uploader
@@ -1,16 +1,58 @@
 import logging
+import threading
 
 from pyrogram import Client
 
 from reddit.downloaders import FileTooBig
+from config import config
 
 logger = logging.getLogger(__name__)
 
 
 class PyroClient(Client):
+    def __init__(self, *args, **kwargs):
+        Client.__init__(self, *args, **kwargs)
+        self._start_lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the client if it is not connected yet (or anymore). Safe to call from multiple threads"""
+
+        with self._start_lock:
+            if not self.is_connected:
+                logger.info('starting mtproto client...')
+                self.start()
+
+    def reconnect(self):
+        logger.warning('restarting mtproto client...')
+
+        with self._start_lock:
+            if self.is_connected:
+                try:
+                    self.stop()
+                except ConnectionError:
+                    pass
+
+            self.start()
+
+    def stop_safe(self):
+        with self._start_lock:
+            if self.is_connected:
+                logger.info('stopping mtproto client...')
+                self.stop()
+
     def upload_video(self, chat_id, file_path, *args, **kwargs):
         try:
             return self.send_video(chat_id, file_path, *args, **kwargs)
         except ValueError:
             logger.warning('file size is too big for pyrogram')
             raise FileTooBig
+
+
+mtproto = PyroClient(
+    config.pyrogram.session_name,
+    bot_token=config.telegram.token,
+    api_id=config.pyrogram.api_id,
+    api_hash=config.pyrogram.api_hash,
+    workers=config.pyrogram.workers,
+    no_updates=True
+)
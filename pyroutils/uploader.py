@@ -0,0 +1,204 @@
+import logging
+import queue
+import threading
+import time
+
+from .pyroutils import PyroClient
+from .pyroutils import mtproto
+from config import config
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class UploadCanceled(Exception):
+    pass
+
+
+class UploadJob:
+    """A video waiting to be uploaded (or being uploaded) by one of the Uploader's workers.
+
+    progress_callback(job) is called from the worker thread every time a chunk has been uploaded"""
+
+    def __init__(self, chat_id, file_path, args, kwargs, progress_callback=None):
+        self.chat_id = chat_id
+        self.file_path = file_path
+        self.args = args
+        self.kwargs = kwargs
+        self.progress_callback = progress_callback
+
+        self.uploaded_bytes = 0
+        self.total_bytes = 0
+        self.submitted = time.perf_counter()
+        self.started = None
+        self.ended = None
+        self.canceled = False
+
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def __repr__(self):
+        return '<UploadJob {} to {} ({}/{} bytes)>'.format(self.file_path, self.chat_id, self.uploaded_bytes, self.total_bytes)
+
+    @property
+    def queued_seconds(self):
+        return (self.started or time.perf_counter()) - self.submitted
+
+    @property
+    def throughput(self):
+        """Uploaded bytes per second"""
+
+        if not self.started:
+            return 0
+
+        elapsed = (self.ended or time.perf_counter()) - self.started
+
+        return self.uploaded_bytes / elapsed if elapsed > 0 else 0
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def cancel(self):
+        """The upload is stopped at the next uploaded chunk (or never started, if it's still queued)"""
+
+        self.canceled = True
+
+    def _progress(self, current, total):
+        self.uploaded_bytes = current
+        self.total_bytes = total
+
+        if self.canceled:
+            raise PyroClient.StopTransmission
+
+        if self.progress_callback:
+            self.progress_callback(self)
+
+    def _finish(self, result=None, exception=None):
+        self.ended = time.perf_counter()
+        self._result = result
+        self._exception = exception
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """Wait for the upload to end and return the sent message. Raises the upload's exception,
+        or UploadCanceled if the upload has been canceled"""
+
+        if not self._done.wait(timeout):
+            raise TimeoutError('upload still running after {} seconds'.format(timeout))
+
+        if self._exception:
+            raise self._exception
+
+        return self._result
+
+
+class Uploader:
+    """Uploads videos through a long lived mtproto client, using a fixed number of worker threads consuming a
+    queue. The client is started once and restarted only when its connection breaks"""
+
+    def __init__(self, client: PyroClient, workers=2, max_retries=1):
+        self.client = client
+        self._workers_count = max(workers, 1)
+        self._max_retries = max_retries
+        self._queue = queue.Queue()
+        self._threads = list()
+        self._lock = threading.Lock()
+        self._active_jobs = set()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+
+            self.client.ensure_started()
+
+            for i in range(self._workers_count):
+                thread = threading.Thread(target=self._worker, name='mtproto_upload_{}'.format(i), daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+        logger.info('mtproto uploader started with %d workers', self._workers_count)
+
+    def stop(self):
+        """Cancel the running and queued uploads, stop the workers and then the client"""
+
+        with self._lock:
+            threads, self._threads = self._threads, list()
+            for job in self._active_jobs:
+                job.cancel()
+
+        for _ in threads:
+            self._queue.put(_STOP)
+
+        for thread in threads:
+            thread.join()
+
+        self.client.stop_safe()
+
+    def submit(self, chat_id, file_path, *args, progress_callback=None, **kwargs) -> UploadJob:
+        # workers are started lazily if nobody called start() (eg. when the stream job is run from a command)
+        self.start()
+
+        job = UploadJob(chat_id, file_path, args, kwargs, progress_callback=progress_callback)
+        with self._lock:
+            self._active_jobs.add(job)
+        self._queue.put(job)
+
+        return job
+
+    def upload(self, chat_id, file_path, *args, progress_callback=None, **kwargs):
+        """Submit the upload and wait for it to end"""
+
+        return self.submit(chat_id, file_path, *args, progress_callback=progress_callback, **kwargs).wait()
+
+    def _upload(self, job: UploadJob):
+        retries = 0
+        while True:
+            try:
+                self.client.ensure_started()
+                return self.client.upload_video(job.chat_id, job.file_path, *job.args, progress=job._progress, **job.kwargs)
+            except (ConnectionError, OSError) as e:
+                if retries >= self._max_retries or job.canceled:
+                    raise
+
+                retries += 1
+                logger.warning('mtproto upload of %s failed because of a connection error (%s), retrying...', job.file_path, str(e))
+                self.client.reconnect()
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is _STOP:
+                return
+
+            if job.canceled:
+                job._finish(exception=UploadCanceled())
+            else:
+                job.started = time.perf_counter()
+                # noinspection PyBroadException
+                try:
+                    sent_message = self._upload(job)
+                except Exception as e:
+                    job._finish(exception=e)
+                else:
+                    if job.canceled:
+                        # send_video() returns None when the transmission is stopped
+                        job._finish(exception=UploadCanceled())
+                    else:
+                        job._finish(result=sent_message)
+                        logger.info(
+                            'mtproto upload of %s ended (queued for %.1f s, %.1f s to upload, %.1f KB/s)',
+                            job.file_path,
+                            job.queued_seconds,
+                            job.ended - job.started,
+                            job.throughput / 1024
+                        )
+
+            with self._lock:
+                self._active_jobs.discard(job)
+
+
+uploader = Uploader(mtproto, workers=config.pyrogram.get('upload_workers', 2))
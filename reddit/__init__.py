@@ -2,7 +2,9 @@ from .sender import Sender
 from .sortings import Sorting
 from .reddit import Reddit
 from .credentials import Credentials
+from .pool import RedditPool
 from config import reddit
 
 
 creds = Credentials(reddit)
+reddit_pool = RedditPool()
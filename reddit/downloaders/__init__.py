@@ -1,3 +1,5 @@
+from .manager import download_manager
+from .probes import media_probes
 from .generic import Downloader
 from .generic import FileTooBig
 from .imgur import Imgur
@@ -1,3 +1,4 @@
+import logging
 import os
 import random
 
@@ -5,6 +6,10 @@ import requests
 
 from const import MaxSize
 from utilities import u
+from .manager import download_manager
+from .probes import media_probes
+
+logger = logging.getLogger(__name__)
 
 
 class FileTooBig(Exception):
@@ -26,9 +31,7 @@ class Downloader:
         if self._thumbnail_url == 'nsfw':
             self._thumbnail_url = 'https://t3.ftcdn.net/jpg/01/77/29/28/240_F_177292812_asUGEDiieLfHjKx9DxTBI50vsS9iZwi0.jpg '
 
-        headers = requests.head(url).headers
-        if 'content-length' in headers:
-            self._size = int(headers.get('content-length', 0))
+        self._size = media_probes.probe(url).content_length
 
     @property
     def url(self):
@@ -79,7 +82,7 @@ class Downloader:
     def download(self):
         self.check_size()
 
-        u.download_file_stream(self._url, self._file_path)
+        download_manager.download(self._url, self._file_path)
 
         # get the size if we weren't able to do that via headers
         if not self._size:
@@ -93,10 +96,14 @@ class Downloader:
         if not self._thumbnail_url:
             return None
 
-        self._thumbnail_path = u.download_file(
-            self._thumbnail_url,
-            file_path=os.path.join('downloads', 'thumb_{}.jpg'.format(self._identifier))
-        )
+        file_path = os.path.join('downloads', 'thumb_{}.jpg'.format(self._identifier))
+        try:
+            download_manager.download(self._thumbnail_url, file_path)
+            self._thumbnail_path = file_path
+        except (requests.RequestException, OSError) as e:
+            logger.info('execption while downloading thumb: %s', str(e), exc_info=True)
+            self._thumbnail_path = None
+
         if resize:
             self._thumbnail_path = u.resize_thumbnail(self._thumbnail_path)
 
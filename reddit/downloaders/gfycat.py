@@ -1,8 +1,8 @@
 import re
 
-import requests
-
 from reddit.downloaders import Downloader
+from .manager import download_manager
+from .probes import media_probes
 
 GFYCAT_API = 'https://api.gfycat.com/v1/gfycats/'
 
@@ -12,17 +12,21 @@ class GfycatDownloader(Downloader):
         Downloader.__init__(self, url, *args, **kwargs)
 
         video_id = re.search(r'gfycat.com/(?:detail/)?(\w*)', url).group(1)
-        r = requests.get(GFYCAT_API + video_id)
-        if r.status_code != 200:
+        r_json = media_probes.cached(('gfycat', video_id), lambda: self._get_gfycat(video_id))
+        if r_json is None:
             self._url = '{}.mp4'.format(url)
         else:
-            r_json = r.json()
             self._url = r_json['gfyItem']['mp4Url']
             self._width = r_json['gfyItem']['width']
             self._height = r_json['gfyItem']['height']
             self._thumbnail_url = r_json['gfyItem']['thumb100PosterUrl']
             self._duration = int(r_json['gfyItem']['numFrames'] / r_json['gfyItem']['frameRate'])
 
+    @staticmethod
+    def _get_gfycat(video_id):
+        r = download_manager.get(GFYCAT_API + video_id)
+        return r.json() if r.status_code == 200 else None
+
     @property
     def sizes(self):
         return self._width, self._height
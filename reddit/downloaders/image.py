@@ -1,14 +1,17 @@
+import logging
 import os
 import tempfile
 
 import requests
 
-from bot.logging import slogger
+from .manager import download_manager
+from .probes import media_probes
 
 
 class ImageDownloader:
-    def __init__(self, image_url, use_stream=False, use_tempfile=True, file_name=None):
+    def __init__(self, image_url, use_stream=False, use_tempfile=True, file_name=None, logger=None):
         self._url = image_url
+        self.log = logger or logging.getLogger(__name__)  # usually the subreddit's logger
         self._use_stream = use_stream
         self._tempfile_downloaded = None
         self._use_tempfile = use_tempfile
@@ -43,8 +46,7 @@ class ImageDownloader:
     @property
     def size(self):
         if self._size is None:
-            r = requests.get(self._url)
-            self._size = int(r.headers.get('content-length', 0))
+            self._size = media_probes.probe(self._url).content_length
 
         return self._size
 
@@ -63,40 +65,21 @@ class ImageDownloader:
 
     def _download(self, raise_exception=False) -> bool:
         try:
-            dloaded_file = requests.get(self._url)
-
             if self._use_tempfile:
-                self._tempfile_downloaded.write(dloaded_file.content)
+                self._size = download_manager.download(self._url, file_obj=self._tempfile_downloaded)
             else:
-                with open(self._file_path, 'wb') as f:
-                    f.write(dloaded_file.content)
+                self._size = download_manager.download(self._url, self._file_path)
         except Exception as e:
             if raise_exception:
                 raise e
             else:
-                slogger.info('execption while downloading url %s: %s', self._url, str(e), exc_info=True)
+                self.log.info('execption while downloading url %s: %s', self._url, str(e), exc_info=True)
                 return False
 
         return True
 
-    # noinspection PyUnreachableCode
-    def _download_stream(self, chunk_size=1024):
-        raise NotImplementedError
-
-        # https://stackoverflow.com/a/16696317
-
-        # if not file_name:
-        #     file_name = self._url.split('/')[-1]
-
-        response = requests.get(self._url, stream=True)
-
-        self.set_size_from_headers(response)
-
-        with open(self._file_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=chunk_size):
-                if chunk:  # filter out keep-alive new chunks
-                    f.write(chunk)
-                    # f.flush() commented by recommendation from J.F.Sebastian
+    def _download_stream(self, chunk_size=None):
+        self._size = download_manager.download(self._url, self._file_path, chunk_size=chunk_size)
 
         return self._file_path
 
@@ -105,9 +88,9 @@ class ImageDownloader:
             try:
                 os.remove(self._file_path)
             except Exception as e:
-                slogger.error('error while trying to delete downloaded file %s: %s', self._file_path, str(e))
+                self.log.error('error while trying to delete downloaded file %s: %s', self._file_path, str(e))
         elif self._use_tempfile:
             try:
                 self._tempfile_downloaded.close()
             except Exception as e:
-                slogger.error('error while trying to close downloaded tempfile: %s', str(e))
+                self.log.error('error while trying to close downloaded tempfile: %s', str(e))
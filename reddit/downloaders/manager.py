@@ -0,0 +1,179 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from config import config
+from utilities.resources import downloads
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class HostStats:
+    __slots__ = ['requests', 'errors', 'bytes', 'latency_seconds', 'transfer_seconds']
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency_seconds = 0.  # time spent waiting for the response's headers
+        self.transfer_seconds = 0.  # time spent reading the response's body
+
+    def as_dict(self):
+        return dict(
+            requests=self.requests,
+            errors=self.errors,
+            bytes=self.bytes,
+            avg_latency=round(self.latency_seconds / self.requests, 3) if self.requests else 0,
+            kbps=round(self.bytes / 1024 / self.transfer_seconds) if self.transfer_seconds else 0
+        )
+
+
+class DownloadManager:
+    """All the media downloads go through here: one keep-alive session for each host (shared by all the threads),
+    retries with exponential backoff (error statuses are retried by the session, connection errors by download())
+    and bodies streamed to disk in chunks of chunk_size bytes, so memory usage doesn't depend on the size of the file"""
+
+    def __init__(self, chunk_size=256 * 1024, pool_size=8, retries=3, backoff=0.5, connect_timeout=5, read_timeout=30):
+        self._chunk_size = chunk_size
+        self._pool_size = pool_size
+        self._retries = retries
+        self._backoff = backoff
+        self._timeout = (connect_timeout, read_timeout)
+
+        self._lock = threading.Lock()
+        self._sessions = dict()  # host -> requests.Session
+        self._stats = defaultdict(HostStats)  # host -> HostStats
+
+    def _session(self, host) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(host, None)
+            if session is None:
+                # the adapter only retries the error statuses: connection errors and broken bodies are retried by
+                # download(), so the two layers don't multiply the attempts
+                retry = Retry(
+                    total=self._retries,
+                    connect=0,
+                    read=0,
+                    other=0,
+                    status=self._retries,
+                    backoff_factor=self._backoff,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=('HEAD', 'GET'),
+                    raise_on_status=False
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size, max_retries=retry)
+
+                session = self._sessions[host] = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+
+            return session
+
+    def _record(self, host, latency=0., transfer=0., size=0, error=False):
+        with self._lock:
+            stats = self._stats[host]
+            stats.requests += 1
+            stats.errors += int(error)
+            stats.bytes += size
+            stats.latency_seconds += latency
+            stats.transfer_seconds += transfer
+
+    def request(self, method, url, stream=False, **kwargs) -> requests.Response:
+        """Send a request using the host's session. The caller must close the response when stream is True"""
+
+        host = urlparse(url).netloc.lower()
+        kwargs.setdefault('timeout', self._timeout)
+
+        start = time.perf_counter()
+        try:
+            response = self._session(host).request(method, url, stream=stream, **kwargs)
+        except requests.RequestException:
+            self._record(host, latency=time.perf_counter() - start, error=True)
+            raise
+
+        latency = time.perf_counter() - start
+        if stream:
+            self._record(host, latency=latency, error=not response.ok)
+        else:
+            self._record(host, latency=latency, size=len(response.content), error=not response.ok)
+
+        return response
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def download(self, url, file_path=None, file_obj=None, chunk_size=None) -> int:
+        """Stream the body of the url to file_path (or to the binary file object file_obj). Connection errors
+        while reading the body are retried from the start. Return the number of bytes written"""
+
+        if not file_path and not file_obj:
+            raise ValueError('file_path or file_obj is required')
+
+        host = urlparse(url).netloc.lower()
+        chunk_size = chunk_size or self._chunk_size
+
+        with downloads.slot():
+            for attempt in range(self._retries + 1):
+                try:
+                    return self._download(host, url, file_path, file_obj, chunk_size)
+                except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                    if attempt == self._retries:
+                        raise
+
+                    wait = self._backoff * 2 ** attempt
+                    logger.warning('error while downloading %s (%s), retrying in %.1f seconds...', url, str(e), wait)
+                    time.sleep(wait)
+
+    def _download(self, host, url, file_path, file_obj, chunk_size) -> int:
+        with self.request('GET', url, stream=True) as response:
+            response.raise_for_status()
+
+            start = time.perf_counter()
+            written = 0
+            output = open(file_path, 'wb') if file_path else file_obj
+            try:
+                if file_obj:
+                    file_obj.seek(0)
+                    file_obj.truncate()
+
+                for chunk in response.iter_content(chunk_size=chunk_size):
+                    if chunk:  # filter out keep-alive new chunks
+                        output.write(chunk)
+                        written += len(chunk)
+            finally:
+                if file_path:
+                    output.close()
+
+                with self._lock:
+                    self._stats[host].bytes += written
+                    self._stats[host].transfer_seconds += time.perf_counter() - start
+
+        return written
+
+    def stats(self, reset=False) -> dict:
+        with self._lock:
+            stats = {host: host_stats.as_dict() for host, host_stats in self._stats.items()}
+            if reset:
+                self._stats.clear()
+
+        return stats
+
+
+downloads_config = config.get('downloads', {})
+
+download_manager = DownloadManager(
+    chunk_size=downloads_config.get('chunk_size_kb', 256) * 1024,
+    pool_size=downloads_config.get('pool_size', 8),
+    retries=downloads_config.get('retries', 3),
+    backoff=downloads_config.get('backoff', 0.5),
+    connect_timeout=downloads_config.get('connect_timeout', 5),
+    read_timeout=downloads_config.get('read_timeout', 30)
+)
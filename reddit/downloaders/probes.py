@@ -0,0 +1,185 @@
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from config import config
+from .manager import download_manager
+
+logger = logging.getLogger(__name__)
+
+# answers that tell the url can't be downloaded: anything else (connection errors, 5xx, 429...) might work on
+# the next attempt, so it's not cached
+DEFINITE_ERRORS = (401, 403, 404, 410)
+
+
+class Probe:
+    __slots__ = ['url', 'ok', 'status', 'content_type', 'content_length', 'expires']
+
+    def __init__(self, url, ok, status=None, content_type=None, content_length=0, expires=0.):
+        self.url = url
+        self.ok = ok  # whether the url can be downloaded
+        self.status = status  # None: connection error
+        self.content_type = content_type
+        self.content_length = content_length  # 0 if unknown
+        self.expires = expires
+
+    def __repr__(self):
+        return '<Probe {} ({}, {}, {} bytes)>'.format(self.url, self.status, self.content_type, self.content_length)
+
+
+class MediaProbes:
+    """Cached HEAD requests: whether a media url is reachable, its content type and size.
+
+    Urls that can't be downloaded (DEFINITE_ERRORS) are cached too, for negative_ttl seconds. prefetch() probes a batch of urls concurrently, so
+    the handlers built afterwards find their probes in the cache. cached() does the same for any other metadata
+    lookup (eg. API requests), exceptions included (connection errors excluded)"""
+
+    def __init__(self, ttl=600, negative_ttl=120, max_entries=5000, workers=8):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires, result, exception)
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._max_entries = max_entries
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='media_probe')
+        self.hits = 0
+        self.misses = 0
+
+    def _get(self, key):
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry
+
+    def _store(self, key, result, exception=None, negative=False):
+        expires = time.time() + (self._negative_ttl if negative else self._ttl)
+        with self._lock:
+            self._entries[key] = (expires, result, exception)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def cached(self, key, func):
+        """Return func()'s result, cached under key. If func raises, the exception is cached for negative_ttl
+        seconds (unless it's a connection error) and raised again"""
+
+        entry = self._get(key)
+        if entry is not None:
+            _, result, exception = entry
+            if exception is not None:
+                raise exception
+
+            return result
+
+        try:
+            result = func()
+        except (requests.ConnectionError, requests.Timeout):
+            raise
+        except Exception as e:
+            self._store(key, None, exception=e, negative=True)
+            raise
+
+        self._store(key, result)
+
+        return result
+
+    def probe(self, url) -> Probe:
+        entry = self._get(('probe', url))
+        if entry is not None:
+            return entry[1]
+
+        result = self._probe(url)
+        if result.ok:
+            self._store(('probe', url), result)
+        elif result.status in DEFINITE_ERRORS:
+            self._store(('probe', url), result, negative=True)
+
+        return result
+
+    @staticmethod
+    def _probe(url) -> Probe:
+        try:
+            response = download_manager.request('HEAD', url, allow_redirects=True)
+            if response.status_code in (405, 501) or (response.ok and not response.headers.get('content-length')):
+                # HEAD not supported, or no size: read the headers of a GET and drop the connection
+                with download_manager.request('GET', url, stream=True) as get_response:
+                    response = get_response
+        except requests.RequestException as e:
+            logger.warning('unable to probe %s: %s', url, str(e))
+            return Probe(url, False)
+
+        try:
+            content_length = int(response.headers.get('content-length', 0))
+        except ValueError:
+            content_length = 0
+
+        return Probe(url, response.ok, response.status_code, response.headers.get('content-type', None), content_length)
+
+    def prefetch(self, urls, timeout=None):
+        """Probe the urls that are not cached concurrently, and wait for them"""
+
+        urls = [url for url in set(urls) if url and ('probe', url) not in self]
+        if not urls:
+            return
+
+        futures = [self._executor.submit(self.probe, url) for url in urls]
+        for future in futures:
+            # noinspection PyBroadException
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                logger.warning('error while prefetching a probe', exc_info=True)
+
+    def __contains__(self, key):
+        with self._lock:
+            entry = self._entries.get(key, None)
+            return entry is not None and entry[0] >= time.time()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(entries=len(self._entries), hits=self.hits, misses=self.misses)
+
+
+def submission_probe_urls(submission) -> list:
+    """The urls the submission's handler will need to probe"""
+
+    urls = list()
+    url = getattr(submission, 'url', '') or ''
+    if url.lower().endswith('.mp4'):
+        urls.append(url)
+
+    media = getattr(submission, 'media', None)
+    if getattr(submission, 'is_video', False) and media and 'reddit_video' in media:
+        fallback_url = media['reddit_video'].get('fallback_url', None)
+        if fallback_url and not media['reddit_video'].get('is_gif', False):
+            urls.append(dash_audio_url(fallback_url))
+
+    return urls
+
+
+def dash_audio_url(fallback_url):
+    # https://old.reddit.com/r/redditdev/comments/jpdley/praw_to_download_a_video_with_audio/jy1257y/
+    return re.sub(r'/DASH_.*$', '/DASH_AUDIO_128.mp4', fallback_url)
+
+
+probes_config = config.get('downloads', {})
+
+media_probes = MediaProbes(
+    ttl=probes_config.get('probes_ttl', 600),
+    negative_ttl=probes_config.get('probes_negative_ttl', 120),
+    workers=probes_config.get('probe_workers', 8)
+)
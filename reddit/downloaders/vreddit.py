@@ -1,27 +1,187 @@
+import logging
 import os
 import re
 import subprocess
-import urllib.request
-import urllib.error
+import threading
+import xml.etree.ElementTree as ElementTree
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
 
 from reddit.downloaders import Downloader
+from .manager import download_manager
+from .probes import media_probes
+from .probes import dash_audio_url
 from utilities import u
+from utilities.resources import transcoding
 from config import config
 
+logger = logging.getLogger(__name__)
 
 TIME_FORMAT = '%d/%m/%Y %H:%M:%S'
-FFMPEG_COMMAND_ARGS = ' -i {video} -i {audio} -c:v copy -c:a aac -strict experimental {output} -y'
+MERGE_TIMEOUT = 180
+FFMPEG_OUTPUT_LINES = 200  # last lines of ffmpeg's output kept in memory, saved to logs/ffmpeg only when merging fails
+
+# v.redd.it video renditions, from the best one. The <n> of DASH_<n> is the shorter side of the video (the width of
+# vertical videos)
+DASH_SIZES = (1080, 720, 480, 360, 240, 220, 96)
+DASH_AUDIO_BITRATE = 128 * 1000  # DASH_AUDIO_128, used when the manifest can't be read
+SIZE_ESTIMATE_MARGIN = 1.05  # bitrate x duration is an average, leave some room for the container and peaks
+
+# audio codecs that can be copied as they are in an mp4 container
+MP4_AUDIO_CODECS = ('aac', 'mp3', 'alac', 'opus')
 
 if os.name == 'nt':  # windows: we expect ffmpeg to be in the main directory of the project
-    FFMPEG_COMMAND = config.ffmpeg.cmd_path_windows + FFMPEG_COMMAND_ARGS
+    FFMPEG_PATH = config.ffmpeg.cmd_path_windows
+    FFPROBE_PATH = config.ffmpeg.get('ffprobe_path_windows', 'ffprobe.exe')
 else:
-    FFMPEG_COMMAND = config.ffmpeg.cmd_path + FFMPEG_COMMAND_ARGS
+    FFMPEG_PATH = config.ffmpeg.cmd_path
+    FFPROBE_PATH = config.ffmpeg.get('ffprobe_path', 'ffprobe')
+
+# where the video and audio tracks are saved before being merged (eg. a tmpfs directory)
+SCRATCH_DIR = config.ffmpeg.get('scratch_dir', 'downloads')
+
+# downloads the audio tracks while the thread that needs them downloads the video
+audio_executor = ThreadPoolExecutor(max_workers=config.get('resources', {}).get('download_slots', 8) or 8,
+                                    thread_name_prefix='vreddit_audio')
 
 
-class FfmpegTimeoutError(Exception):
+class FfmpegError(Exception):
     pass
 
 
+class FfmpegTimeoutError(FfmpegError):
+    pass
+
+
+def probe_codec(file_path, stream='a:0'):
+    """Return the codec name of the file's stream, or None if ffprobe fails"""
+
+    cmd = [FFPROBE_PATH, '-v', 'error', '-select_streams', stream, '-show_entries', 'stream=codec_name',
+           '-of', 'default=noprint_wrappers=1:nokey=1', file_path]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, timeout=30)
+    except (OSError, subprocess.TimeoutExpired) as e:
+        logger.warning('ffprobe failed on %s: %s', file_path, str(e))
+        return None
+
+    return result.stdout.decode('utf-8', errors='replace').strip() or None
+
+
+class Rendition:
+    __slots__ = ['url', 'height', 'width', 'size']
+
+    def __init__(self, url, height, width, size=0):
+        self.url = url
+        self.height = height
+        self.width = width
+        self.size = size  # estimated size in bytes, 0 if unknown
+
+    def __repr__(self):
+        return '<Rendition {}x{} ({})>'.format(self.width, self.height, u.human_readable_size(self.size))
+
+
+def manifest_renditions(dash_url, duration, aspect_ratio) -> tuple:
+    """Read the DASH manifest: return the video renditions (best first) with the size estimated from their
+    bitrate, and the estimated size of the best audio track (None if there's no audio). aspect_ratio (width/height)
+    is used for the representations that do not have a width"""
+
+    response = download_manager.get(dash_url)
+    response.raise_for_status()
+    root = ElementTree.fromstring(response.content)
+
+    videos, audio_size = list(), None
+    for adaptation_set in root.iter():
+        if not adaptation_set.tag.endswith('AdaptationSet'):
+            continue
+
+        for representation in adaptation_set:
+            if not representation.tag.endswith('Representation'):
+                continue
+
+            base_url = next((e.text for e in representation if e.tag.endswith('BaseURL') and e.text), None)
+            bandwidth = int(representation.get('bandwidth', 0))
+            mime_type = representation.get('mimeType', adaptation_set.get('mimeType', ''))
+            content_type = adaptation_set.get('contentType', mime_type.split('/')[0])
+            if not base_url:
+                continue
+
+            size = int(bandwidth * duration / 8)
+            if content_type == 'audio':
+                audio_size = max(audio_size or 0, size)
+            elif representation.get('height', None):
+                height = int(representation.get('height'))
+                width = int(representation.get('width', 0)) or round(height * aspect_ratio)
+                videos.append(Rendition(urljoin(dash_url, base_url.strip()), height, width, size))
+
+    videos.sort(key=lambda rendition: rendition.height, reverse=True)
+
+    return videos, audio_size
+
+
+def variant_renditions(fallback_url, height, width) -> list:
+    """The usual DASH_<n> variants of the fallback url smaller than it, with both sides scaled like the shorter
+    one. Their size is unknown"""
+
+    renditions = [Rendition(fallback_url, height, width)]
+
+    match = re.search(r'DASH_(\d+)', fallback_url)
+    if not match:
+        return renditions
+
+    current_size = int(match.group(1))
+    for variant_size in DASH_SIZES:
+        if variant_size < current_size:
+            scale = variant_size / current_size
+            variant_url = re.sub(r'DASH_\d+', 'DASH_{}'.format(variant_size), fallback_url)
+            renditions.append(Rendition(variant_url, round(height * scale), round(width * scale)))
+
+    return renditions
+
+
+def choose_rendition(fallback_url, height, width, duration, budget, dash_url=None, has_audio=True, log=None) -> Rendition:
+    """The best rendition whose video + audio estimated size fits the budget (in bytes). The size is estimated
+    from the manifest's bitrates, or probed with HEAD requests when the manifest can't be read. When none of them
+    fits, the smallest one is returned"""
+
+    log = log or logger
+
+    renditions, audio_size = None, None
+    if dash_url:
+        try:
+            renditions, audio_size = manifest_renditions(dash_url, duration, width / height if height else 1.)
+        except (requests.RequestException, ElementTree.ParseError, ValueError) as e:
+            log.warning('unable to read the DASH manifest %s: %s', dash_url, str(e))
+
+    if not renditions:
+        renditions = variant_renditions(fallback_url, height, width)
+
+    if audio_size is None:
+        audio_size = int(DASH_AUDIO_BITRATE * duration / 8) if has_audio else 0
+
+    for rendition in renditions:
+        if rendition.height > height:
+            continue
+
+        if not rendition.size:
+            rendition.size = media_probes.probe(rendition.url).content_length
+            if not rendition.size:
+                continue  # the variant doesn't exist
+
+        if rendition.size * SIZE_ESTIMATE_MARGIN + audio_size <= budget:
+            log.info('chosen rendition: %s (budget: %s)', rendition, u.human_readable_size(budget))
+            return rendition
+
+    smallest = next((r for r in reversed(renditions) if r.size and r.height <= height), None)
+    if smallest is None:
+        return Rendition(fallback_url, height, width)
+
+    log.info('no rendition fits the budget (%s), using the smallest one: %s', u.human_readable_size(budget), smallest)
+    return smallest
+
+
 class VRedditDownloader(Downloader):
     def __init__(self, url, *args, **kwargs):
         Downloader.__init__(self, url, *args, **kwargs)
@@ -29,9 +189,9 @@ class VRedditDownloader(Downloader):
 
         # self._url_audio = re.sub(r'\/DASH_.*$', '/audio', self._url)
         # self._url_audio = re.sub(r'/DASH_.*$', '/DASH_audio.mp4', self._url)
-        self._url_audio = re.sub(r'/DASH_.*$', '/DASH_AUDIO_128.mp4', self._url)  # https://old.reddit.com/r/redditdev/comments/jpdley/praw_to_download_a_video_with_audio/jy1257y/
+        self._url_audio = dash_audio_url(self._url)
         self._audio_size = 0
-        self._audio_path = os.path.normpath(os.path.join('downloads', '{}.mp3'.format(self._identifier)))
+        self._audio_path = os.path.normpath(os.path.join('downloads', '{}_audio.mp4'.format(self._identifier)))
         self._video_path = self._file_path
         self._merged_path = os.path.normpath(self._file_path.replace('.mp4', '_merged.mp4'))
 
@@ -53,18 +213,14 @@ class VRedditDownloader(Downloader):
     def audio_url_forbidden(self):
         """Check whether the audio url is a working url or not.
         Sometimes v.reddit videos might have the is_gif property set to False, but
-        still have no audio (see issue #91). So we have to do this additional check
-
-        Inspired by https://stackoverflow.com/a/21515813
+        still have no audio (see issue #91). So we have to do this additional check, without downloading the audio
         """
 
-        # https://stackoverflow.com/a/21515813
-        try:
-            urllib.request.urlopen(self._url_audio)
+        if media_probes.probe(self._url_audio).ok:
             return False
-        except urllib.error.HTTPError as e:
-            self.subreddit_logger.error('audio url validity check: the url is forbidden (%s)', str(e))
-            return True
+
+        self.subreddit_logger.error('audio url validity check: the url is forbidden (%s)', self._url_audio)
+        return True
 
     def remove(self, keep_thumbnail=False):
         # noinspection PyBroadException
@@ -87,76 +243,119 @@ class VRedditDownloader(Downloader):
                 os.remove(file_path)
                 self.subreddit_logger.info('...%s removed', file_path)
             except FileNotFoundError:
-                self.subreddit_logger.error('...%s not removed: FileNotFoundError', file_path)
+                # the audio and video tracks are removed as soon as they are merged
+                self.subreddit_logger.debug('...%s not removed: FileNotFoundError', file_path)
 
     def download_audio(self):
-        u.download_file_stream(self._url_audio, self._audio_path)
+        download_manager.download(self._url_audio, self._audio_path)
 
         self._audio_size = os.path.getsize(self._audio_path)
 
         return self._audio_path
 
+    def _remove_tracks(self):
+        for file_path in (self._video_path, self._audio_path):
+            u.remove_file_safe(file_path)
+
     def merge(self):
-        cmd = FFMPEG_COMMAND.format(
-            video=self._file_path,
-            audio=self._audio_path,
-            output=self._merged_path
-        )
+        """Copy the video and audio streams in the same mp4 file. The audio is encoded to aac only when its
+        codec can't go in an mp4 container, or when copying fails"""
 
-        dt_filename = u.now(string='%Y%m%d_%H%M')
-        stdout_filepath = os.path.join('logs', 'ffmpeg', '{}_ffmpeg_stdout_{}.log'.format(self._identifier, dt_filename))
-        stderr_filepath = os.path.join('logs', 'ffmpeg', '{}_ffmpeg_stderr_{}.log'.format(self._identifier, dt_filename))
+        audio_codec = probe_codec(self._audio_path)
+        if audio_codec in MP4_AUDIO_CODECS:
+            try:
+                return self._merge(['-c', 'copy'])
+            except FfmpegTimeoutError:
+                raise
+            except FfmpegError as e:
+                self.subreddit_logger.warning('stream copy of video and audio failed (%s), encoding the audio...', str(e))
+        else:
+            self.subreddit_logger.info('audio codec: %s, the audio will be encoded to aac', audio_codec)
+
+        with transcoding.slot():
+            return self._merge(['-c:v', 'copy', '-c:a', 'aac'])
+
+    def _merge(self, codec_args):
+        cmd = [
+            FFMPEG_PATH, '-nostdin', '-hide_banner', '-y',
+            '-i', self._video_path,
+            '-i', self._audio_path,
+            '-map', '0:v:0', '-map', '1:a:0',
+            *codec_args,
+            '-movflags', '+faststart',
+            self._merged_path
+        ]
 
-        stdout_file = open(stdout_filepath, 'wb')
-        stderr_file = open(stderr_filepath, 'wb')
+        ffmpeg_start = u.now()
+        self.subreddit_logger.debug('ffmpeg command execution started: %s', u.now(string=TIME_FORMAT))
 
-        # subprocess.call(cmd, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+        output = deque(maxlen=FFMPEG_OUTPUT_LINES)
+        sp = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        reader = threading.Thread(target=lambda: output.extend(sp.stderr), name='ffmpeg_output', daemon=True)
+        reader.start()
 
-        timeout = 180
-        sp = subprocess.Popen(cmd, shell=True, stdout=stdout_file, stderr=stderr_file)
         try:
-            ffmpeg_start = u.now()
-            self.subreddit_logger.debug('ffmpeg command execution started: %s', u.now(string=TIME_FORMAT))
-
-            sp.communicate(timeout=timeout)
-
-            ffmpeg_end = u.now()
-            ffmpeg_elapsed_seconds = (ffmpeg_end - ffmpeg_start).seconds
-            self.subreddit_logger.debug('ffmpeg command execution ended: %s (elapsed time (seconds): %d)', u.now(string=TIME_FORMAT), ffmpeg_elapsed_seconds)
+            sp.wait(timeout=MERGE_TIMEOUT)
         except subprocess.TimeoutExpired:
-            self.subreddit_logger.error(
-                'subprocess.TimeoutExpired (%d seconds) error during ffmpeg command execution (see %s, %s)',
-                timeout,
-                str(stdout_filepath),
-                str(stderr_filepath)
-            )
-
             # we have to kill the subprocess, otherwise ffmpeg will keep the file open and we will not be able to delete it
-            # https://docs.python.org/3/library/subprocess.html#subprocess.Popen.communicate
             self.subreddit_logger.info('killing subprocess (pid: %d)...', sp.pid)
             sp.kill()
+            sp.wait()
+            reader.join()
 
-            stdout_file.close()
-            stderr_file.close()
-
-            # raise subprocess.TimeoutExpired(cmd=cmd, timeout=timeout)
+            output_path = self._save_ffmpeg_output(cmd, output)
+            self.subreddit_logger.error('ffmpeg timeout (%d seconds) while merging video and audio (see %s)',
+                                        MERGE_TIMEOUT, output_path)
             raise FfmpegTimeoutError
 
-        stdout_file.close()
-        stderr_file.close()
+        reader.join()
+        sp.stderr.close()
+
+        ffmpeg_elapsed_seconds = (u.now() - ffmpeg_start).seconds
+        self.subreddit_logger.debug('ffmpeg command execution ended: %s (elapsed time (seconds): %d)', u.now(string=TIME_FORMAT), ffmpeg_elapsed_seconds)
+
+        if sp.returncode != 0:
+            output_path = self._save_ffmpeg_output(cmd, output)
+            raise FfmpegError('ffmpeg exited with code {} (see {})'.format(sp.returncode, output_path))
 
         return self._merged_path
-    
+
+    def _save_ffmpeg_output(self, cmd, output):
+        dt_filename = u.now(string='%Y%m%d_%H%M')
+        file_path = os.path.join('logs', 'ffmpeg', '{}_ffmpeg_{}.log'.format(self._identifier, dt_filename))
+        with open(file_path, 'wb') as f:
+            f.write(' '.join(cmd).encode('utf-8') + b'\n\n')
+            f.writelines(output)
+
+        return file_path
+
     def download_and_merge(self, skip_audio=False):
-        self.download()
-        if not skip_audio:
+        if skip_audio:
             # some vreddits don't have an audio (they are GIFs basically),
             # so we have to skip the audio download and merge
-            self.download_audio()
+            self.download()
+
+            return self._file_path  # return the downloaded video path if we have skipped the audio
+
+        # the two tracks are only needed until they are merged
+        self._file_path = self._video_path = os.path.join(SCRATCH_DIR, os.path.basename(self._video_path))
+        self._audio_path = os.path.join(SCRATCH_DIR, os.path.basename(self._audio_path))
+
+        audio_future = audio_executor.submit(self.download_audio)
+        try:
+            self.download()
+        finally:
+            # wait for the audio even when the video failed, so remove() can delete it
+            audio_exception = audio_future.exception()
+
+        if audio_exception:
+            raise audio_exception
+
+        try:
             self.merge()
+        finally:
+            self._remove_tracks()
 
-            self._size = os.path.getsize(self._merged_path)  # calculate the size again after audio and video are merged
+        self._size = os.path.getsize(self._merged_path)  # calculate the size again after audio and video are merged
 
-            return self._merged_path  # return the merged video/audio path if we didn't skip the audio
-        else:
-            return self._file_path  # return the downloaded video path if we have skipped the audio
+        return self._merged_path  # return the merged video/audio path if we didn't skip the audio
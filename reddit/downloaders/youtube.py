@@ -7,6 +7,7 @@ import youtube_dl
 
 from .image import ImageDownloader
 from utilities import u
+from utilities.resources import downloads
 from const import MaxSize
 
 logger = logging.getLogger('ytdl')
@@ -131,7 +132,8 @@ class YouTubeDownloader:
                 logger.info('video is too long (%d vs %d): skipping', self.duration, self.max_duration)
                 raise YouTubeTooLong('this video is a streaming')
 
-            ytdl.download([self.url])
+            with downloads.slot():
+                ytdl.download([self.url])
 
             logger.info('download finished, file_name after download: %s', self.file_name)
 
@@ -0,0 +1,113 @@
+import datetime
+import logging
+import time
+
+from database.models import Subreddit
+from utilities import u
+
+logger = logging.getLogger('sp')
+
+
+def flair_normalized(submission):
+    if submission.link_flair_text is None:
+        return ''
+
+    return u.to_ascii(str(submission.link_flair_text), replace_spaces=True, lowercase=True)
+
+
+class FilterPlan:
+    """The subreddit's filters that only need the data returned by the listing (no derived Sender attribute,
+    no request), compiled once so they can be tested against a whole listing before building any Sender.
+
+    Everything that doesn't depend on the submission is resolved when the plan is compiled: the blacklist is
+    parsed into a set, the age limits are turned into created_utc cutoffs, and the disabled filters are dropped.
+    Filters that depend on the submission handler (medias_only) are tested by Sender.test_filters()"""
+
+    def __init__(self, subreddit: Subreddit, now_ts=None):
+        self.now_ts = now_ts or time.time()
+
+        self.ignore_stickied = bool(subreddit.ignore_stickied)
+        self.min_score = subreddit.min_score if subreddit.min_score and isinstance(subreddit.min_score, int) else None
+        self.ignore_nsfw = subreddit.allow_nsfw is not None and subreddit.allow_nsfw == False
+        self.hide_spoilers = bool(subreddit.hide_spoilers)
+        self.ignore_flairless = bool(subreddit.ignore_flairless)
+        self.min_upvote_perc = subreddit.min_upvote_perc or None
+        self.users_blacklist = frozenset(subreddit.get_users_blacklist()) if subreddit.users_blacklist else frozenset()
+
+        # submissions created after newer_cutoff_ts are too new, submissions created before older_cutoff_ts are too old
+        self.ignore_if_newer_than = None
+        self.newer_cutoff_ts = None
+        if subreddit.ignore_if_newer_than and isinstance(subreddit.ignore_if_newer_than, int):
+            self.ignore_if_newer_than = subreddit.ignore_if_newer_than
+            self.newer_cutoff_ts = self.now_ts - subreddit.ignore_if_newer_than * 60
+
+        self.ignore_if_older_than = None
+        self.older_cutoff_ts = None
+        if subreddit.ignore_if_older_than and isinstance(subreddit.ignore_if_older_than, int):
+            self.ignore_if_older_than = subreddit.ignore_if_older_than
+            self.older_cutoff_ts = self.now_ts - subreddit.ignore_if_older_than * 60
+
+    def _log_age(self, log, submission, reason, limit_name, limit):
+        created_utc_dt = datetime.datetime.utcfromtimestamp(submission.created_utc)
+        elapsed_minutes = int(round((self.now_ts - submission.created_utc) / 60))
+        log.info(
+            'tests failed: too %s (submitted: %s, elapsed: %s, %s: %d)',
+            reason,
+            created_utc_dt.strftime('%d/%m/%Y, %H:%M'),
+            u.pretty_minutes(elapsed_minutes),
+            limit_name,
+            limit
+        )
+
+    def passes(self, submission, log=logger) -> bool:
+        if self.ignore_stickied and submission.stickied:
+            log.info('tests failed: sticked submission')
+            return False
+        elif self.min_score and self.min_score > submission.score:
+            log.info('tests failed: not enough upvotes (%d/%d)', submission.score, self.min_score)
+            return False
+        elif self.ignore_nsfw and submission.over_18:
+            log.info('tests failed: submission is NSFW')
+            return False
+        elif self.hide_spoilers and submission.spoiler == True:
+            log.info('tests failed: submission is a spoiler')
+            return False
+        elif self.ignore_flairless and not flair_normalized(submission):
+            log.info('tests failed: submission does not have a flair')
+            return False
+
+        if self.min_upvote_perc:
+            upvote_perc = int(submission.upvote_ratio * 100)
+            if upvote_perc < self.min_upvote_perc:
+                log.info(
+                    'tests failed: submission\'s upvote ratio is not good enough (db: %d, submission: %d)',
+                    self.min_upvote_perc,
+                    upvote_perc
+                )
+                return False
+
+        if self.users_blacklist:
+            author_username_lower = str(submission.author).lower()
+            if author_username_lower in self.users_blacklist:
+                log.info('tests failed: u/%s is blacklisted in this subreddit', author_username_lower)
+                return False
+
+        if self.newer_cutoff_ts is not None and submission.created_utc > self.newer_cutoff_ts:
+            self._log_age(log, submission, 'new', 'ignore_if_newer_than', self.ignore_if_newer_than)
+            return False
+        elif self.older_cutoff_ts is not None and submission.created_utc < self.older_cutoff_ts:
+            self._log_age(log, submission, 'old', 'ignore_if_older_than', self.ignore_if_older_than)
+            return False
+
+        return True
+
+    def surviving_indices(self, submissions, log=logger) -> list:
+        """Test the whole listing at once and return the indexes of the submissions that passed the filters"""
+
+        return [i for i, submission in enumerate(submissions) if self.passes(submission, log)]
+
+
+def passes_filters(subreddit: Subreddit, submission, log=logger) -> bool:
+    """Test a single submission. To test a listing, compile a FilterPlan once and reuse it"""
+
+    return FilterPlan(subreddit).passes(submission, log)
@@ -0,0 +1,135 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse, urlunparse
+
+from config import config
+
+logger = logging.getLogger('sp')
+
+# hosts whose urls' query string only contains signatures/tracking parameters, and not what identifies the media
+NO_QUERY_HOSTS = ('redd.it', 'redditmedia.com', 'imgur.com', 'gfycat.com')
+
+
+def canonical_url(url: str) -> str:
+    parsed = urlparse(url)
+    netloc = parsed.netloc.lower()
+    query = '' if netloc.endswith(NO_QUERY_HOSTS) else parsed.query
+
+    return urlunparse(('https', netloc, parsed.path, '', query, ''))
+
+
+def _message_media(message):
+    """Return (media type, file_id, file size) of the media in the message, or None. Works with both
+    python-telegram-bot and pyrogram messages"""
+
+    if message.video:
+        return 'video', message.video.file_id, message.video.file_size
+    elif message.animation:
+        return 'animation', message.animation.file_id, message.animation.file_size
+    elif message.document:
+        return 'document', message.document.file_id, message.document.file_size
+    elif message.photo:
+        photo = message.photo[-1] if isinstance(message.photo, list) else message.photo
+        return 'photo', photo.file_id, photo.file_size
+
+    return None
+
+
+class CachedMedia:
+    __slots__ = ['medias', 'size', 'expires']
+
+    def __init__(self, medias, size, expires):
+        self.medias = medias  # list of (media type, file_id), more than one for media groups
+        self.size = size
+        self.expires = expires
+
+    @property
+    def is_media_group(self):
+        return len(self.medias) > 1
+
+
+class MediaCache:
+    """Telegram file_ids of the medias we already uploaded, keyed by the canonical url of the media.
+
+    When the same media is posted again (in another channel, or by another subreddit), it can be sent by
+    file_id: no download, no processing and no upload. Entries expire after ttl seconds, and the least
+    recently used entries are evicted when the cache has more than max_entries"""
+
+    def __init__(self, ttl=72 * 3600, max_entries=5000):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key) -> [CachedMedia, None]:
+        with self._lock:
+            entry = self._entries.get(key, None)
+            if entry is not None and entry.expires < time.time():
+                del self._entries[key]
+                entry = None
+
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+
+            return entry
+
+    def store(self, key, sent_messages):
+        if not isinstance(sent_messages, list):
+            sent_messages = [sent_messages]
+
+        medias = list()
+        size = 0
+        for message in sent_messages:
+            media = _message_media(message)
+            if media is None:
+                # not a media (eg. we fell back to a text message): nothing to cache
+                return False
+
+            media_type, file_id, file_size = media
+            medias.append((media_type, file_id))
+            size += file_size or 0
+
+        if not medias or (len(medias) > 1 and any(media_type not in ('photo', 'video') for media_type, _ in medias)):
+            # media groups can only contain photos and videos
+            return False
+
+        with self._lock:
+            self._entries[key] = CachedMedia(medias, size, time.time() + self._ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+        return True
+
+    def __contains__(self, key):
+        """Check whether the key is cached without counting a hit/miss"""
+
+        with self._lock:
+            entry = self._entries.get(key, None)
+            return entry is not None and entry.expires >= time.time()
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(entries=len(self._entries), hits=self.hits, misses=self.misses)
+
+
+media_cache = MediaCache(
+    ttl=config.jobs.get('media_cache_ttl_hours', 72) * 3600,
+    max_entries=config.jobs.get('media_cache_max_entries', 5000)
+)
+
+
+def enabled():
+    return config.jobs.get('media_cache', True)
@@ -0,0 +1,101 @@
+import logging
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+from .reddit import Reddit
+from .quotas import clients_quotas
+
+logger = logging.getLogger(__name__)
+
+
+class RedditPool:
+    """Long-lived praw instances, keyed by (account username, client name).
+
+    Building a Reddit instance means a new requests session (and connection pool) and a new OAuth
+    password grant exchange on the first request. Pooled instances keep both: prawcore refreshes
+    the access token only when it expires.
+    A praw instance is not supposed to be used by more threads at the same time, so acquire() hands out
+    an idle instance (or builds a new one) and release() puts it back in the pool.
+
+    The requests the caller expects to send are reserved in the clients' quotas until the instance is released,
+    and the instance's rate limit status is reported to them (see quotas.py)"""
+
+    def __init__(self, max_idle_per_key=16):
+        self._lock = threading.Lock()
+        self._idle = defaultdict(list)  # key -> list of idle Reddit instances
+        self._max_idle_per_key = max_idle_per_key
+        self._created = defaultdict(int)
+        self._reused = defaultdict(int)
+
+    @staticmethod
+    def _key(account, client):
+        return account.username, client.name
+
+    def acquire(self, account, client, expected_requests=1) -> Reddit:
+        key = self._key(account, client)
+        clients_quotas.reserve(key, expected_requests)
+
+        reddit = None
+        with self._lock:
+            if self._idle[key]:
+                self._reused[key] += 1
+                # last in, first out: the most recently used instance is the one most likely to have a valid token
+                # and an open connection
+                reddit = self._idle[key].pop()
+            else:
+                self._created[key] += 1
+
+        if reddit is None:
+            logger.debug('building new praw instance for %s (instances built so far: %d)', key, self._created[key])
+            reddit = Reddit(**account.creds_dict(), **client.creds_dict())
+            reddit.pool_key = key
+
+        reddit.reserved_requests = expected_requests
+
+        return reddit
+
+    @staticmethod
+    def observe(reddit: Reddit):
+        """Report the instance's rate limit status to the clients' quotas"""
+
+        key = getattr(reddit, 'pool_key', None)
+        if key is None:
+            return
+
+        try:
+            limits = reddit.auth.limits
+        except AssertionError:
+            # no request sent yet
+            return
+
+        clients_quotas.observe(key, limits)
+
+    def release(self, reddit: Reddit):
+        key = getattr(reddit, 'pool_key', None)
+        if key is None:
+            # not built by the pool
+            return
+
+        self.observe(reddit)
+        clients_quotas.release(key, reddit.reserved_requests)
+        reddit.reserved_requests = 0
+
+        with self._lock:
+            if len(self._idle[key]) < self._max_idle_per_key:
+                self._idle[key].append(reddit)
+
+    @contextmanager
+    def instance(self, account, client):
+        reddit = self.acquire(account, client)
+        try:
+            yield reddit
+        finally:
+            self.release(reddit)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                key: dict(created=self._created[key], reused=self._reused[key], idle=len(self._idle[key]))
+                for key in self._created
+            }
@@ -0,0 +1,137 @@
+import logging
+import threading
+import time
+
+from config import reddit as reddit_config
+
+logger = logging.getLogger(__name__)
+
+# Reddit's rate limit window, in seconds
+WINDOW_SECONDS = 600
+
+
+class ClientQuota:
+    __slots__ = ['remaining', 'reset_at', 'window_size', 'in_flight']
+
+    def __init__(self):
+        self.remaining = None  # last remaining requests returned by Reddit
+        self.reset_at = None  # time.time() at which Reddit resets the window
+        self.window_size = None  # remaining + used, the quota of the whole window
+        self.in_flight = 0  # requests we expect the running tasks to still send
+
+
+class ClientsQuotas:
+    """The rate limit status of each (account, client) pair, as returned by Reddit in the responses' headers.
+
+    Every praw instance reports how many requests it has left when it's given back to the pool: subreddits are
+    routed to the pair with most headroom (remaining requests minus the requests the running tasks are expected
+    to send), and when every pair is about to run out of requests, the caller is told to wait for the reset
+    instead of getting a 429"""
+
+    def __init__(self, default_quota=600, min_headroom=10, max_wait=60):
+        self._lock = threading.Lock()
+        self._quotas = dict()  # (account name, client name) -> ClientQuota
+        self._default_quota = default_quota
+        self._min_headroom = min_headroom
+        self.max_wait = max_wait
+
+    def _quota(self, key) -> ClientQuota:
+        if key not in self._quotas:
+            self._quotas[key] = ClientQuota()
+
+        return self._quotas[key]
+
+    def _headroom(self, quota: ClientQuota, now):
+        if quota.remaining is None or (quota.reset_at and quota.reset_at <= now):
+            # never used, or its window has been reset in the meantime
+            remaining = quota.window_size or self._default_quota
+        else:
+            remaining = quota.remaining
+
+        return remaining - quota.in_flight
+
+    def observe(self, key, limits: dict, now=None):
+        """limits: praw's Reddit.auth.limits. Older praw versions also return the reset timestamp, otherwise
+        we assume the window is reset WINDOW_SECONDS after the first request we observe in it"""
+
+        remaining = limits.get('remaining', None)
+        if remaining is None:
+            return
+
+        now = now or time.time()
+        with self._lock:
+            quota = self._quota(key)
+
+            reset_at = limits.get('reset_timestamp', None)
+            if not reset_at:
+                window_expired = not quota.reset_at or quota.reset_at <= now
+                reset_at = now + WINDOW_SECONDS if window_expired else quota.reset_at
+
+            quota.remaining = int(remaining)
+            quota.reset_at = reset_at
+            used = limits.get('used', None)
+            if used is not None:
+                quota.window_size = int(remaining) + int(used)
+
+    def reserve(self, key, requests):
+        with self._lock:
+            self._quota(key).in_flight += requests
+
+    def release(self, key, requests):
+        with self._lock:
+            quota = self._quota(key)
+            quota.in_flight = max(0, quota.in_flight - requests)
+
+    def pick(self, candidates: list, now=None) -> tuple:
+        """candidates: list of (key, item) in order of preference. Return (item, seconds to wait before using it):
+        the item with most headroom or, when all of them are about to run out of requests, the one whose window
+        will be reset first"""
+
+        now = now or time.time()
+        with self._lock:
+            best_key, best_item, best_headroom = None, None, None
+            for key, item in candidates:
+                headroom = self._headroom(self._quota(key), now)
+                if best_headroom is None or headroom > best_headroom:
+                    best_key, best_item, best_headroom = key, item, headroom
+
+            if best_headroom is None or best_headroom >= self._min_headroom:
+                return best_item, 0
+
+            # everybody is running out of requests: wait for the first reset
+            first_reset_key, first_reset_item = min(
+                candidates,
+                key=lambda candidate: self._quotas[candidate[0]].reset_at or now
+            )
+            wait = (self._quotas[first_reset_key].reset_at or now) - now
+
+        logger.warning('all the candidate reddit clients are running out of requests (best headroom: %d, %s), '
+                       'waiting %.1f seconds for %s to reset', best_headroom, best_key, wait, first_reset_key)
+
+        return first_reset_item, max(0., min(wait, self.max_wait))
+
+    def stats(self, now=None) -> dict:
+        now = now or time.time()
+        with self._lock:
+            return {
+                key: dict(
+                    remaining=quota.remaining,
+                    resets_in=round(quota.reset_at - now) if quota.reset_at else None,
+                    in_flight=quota.in_flight,
+                    headroom=self._headroom(quota, now)
+                )
+                for key, quota in self._quotas.items()
+            }
+
+
+quotas_config = reddit_config.general.get('quotas', {})
+
+clients_quotas = ClientsQuotas(
+    default_quota=quotas_config.get('default_quota', 600),
+    min_headroom=quotas_config.get('min_headroom', 10),
+    max_wait=quotas_config.get('max_wait', 60)
+)
+
+
+def enabled():
+    return quotas_config.get('enabled', True)
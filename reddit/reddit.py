@@ -1,12 +1,12 @@
 import datetime
 import os
-import urllib.request
 
 import praw
 from prawcore.exceptions import Redirect
 from prawcore.exceptions import NotFound
 
 from .sortings import Sorting
+from .downloaders.manager import download_manager
 from utilities import u
 from config import config
 
@@ -85,9 +85,7 @@ class Reddit(praw.Reddit):
         if download:
             file_path = os.path.join('downloads', 'icon_{}.png'.format(sub_name))
 
-            with urllib.request.urlopen(icon_url) as response, open(file_path, 'wb') as out_file:
-                data = response.read()
-                out_file.write(data)
+            download_manager.download(icon_url, file_path)
 
             return file_path
         else:
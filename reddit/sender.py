@@ -2,7 +2,6 @@ import json
 import logging
 import datetime
 import os
-from collections import OrderedDict
 from pprint import pformat
 from typing import List, Tuple
 from urllib.parse import urlparse
@@ -22,21 +21,21 @@ from .submissions import GifHandler
 from .submissions import ImgurGalleryHandler, ImgurNonDirectUrlImageHandler, ImgurNonDirectUrlVideoHandler
 from .submissions import RedditGifHandler
 from .submissions import YouTubeHandler
+from . import filters
+from .templates import templates_cache
+from .templates import SubredditValues
+from .templates import PlaceholderValues
 from bot.markups import InlineKeyboard
 from database.models import Post
 from database.models import Subreddit
 from database.queries import flairs
+from database.queries import posts
 from const import DEFAULT_TEMPLATE
 from utilities import u
 from config import config
 
 logger = logging.getLogger('sp')
 
-KEY_MAPPER_DICT = dict(
-    created_utc=lambda timestamp: datetime.datetime.utcfromtimestamp(timestamp),
-    created=lambda timestamp: datetime.datetime.fromtimestamp(timestamp)
-)
-
 HIDDEN_CHAR = u'\u200B'
 
 DEFAULT_FLAIR = "no_flair"
@@ -54,10 +53,10 @@ SUPERSCRIPT = str.maketrans("0123456789", "⁰¹²³⁴⁵⁶⁷⁸⁹")
 
 
 class Sender:
-    __slots__ = ['_bot', '_subreddit', '_submission', '_sent_messages', '_uploaded_bytes', '_chat_id', '_submission_dict', 'log',
+    __slots__ = ['_bot', '_subreddit', '_submission', '_sent_messages', '_uploaded_bytes', '_chat_id', '_placeholder_values', 'log',
                  'submission_handler', 'submission_handler_text', 'debug_text_to_post']
 
-    def __init__(self, bot, subreddit, submission, skip_sender_type_detection=False):
+    def __init__(self, bot, subreddit, submission, skip_sender_type_detection=False, subreddit_values=None):
         self._bot: Bot = bot
         self._submission = submission
         self._subreddit: Subreddit = subreddit
@@ -97,7 +96,6 @@ class Sender:
         self._submission.upvote_perc_superscript = str(self._submission.upvote_perc).translate(SUPERSCRIPT)
         self._submission.author_username_lower = str(self._submission.author).lower()
         self._submission.target_username = self._subreddit.channel_username(default="")
-        self._submission_dict = dict()
 
         # for crossposts: only the reference to the original post contains the 'media' attribute of the submission.
         # We can get the parent submission of the crosspost from `submission.crosspost_parent_list[0]`
@@ -197,7 +195,9 @@ class Sender:
 
         # u.print_submission(self._s)
 
-        self.gen_submission_dict()
+        # placeholders are resolved only when a template uses them. The subreddit's values can be shared by all the
+        # senders of the same subreddit
+        self._placeholder_values = PlaceholderValues(self._submission, subreddit_values or SubredditValues(self._subreddit))
         self.save_flair()
 
     def _detect_sender_type(self, sender_kwargs):
@@ -242,7 +242,7 @@ class Sender:
 
     @property
     def submission_dict(self):
-        return self._submission_dict
+        return self.gen_submission_dict()
 
     @property
     def subreddit(self):
@@ -252,55 +252,36 @@ class Sender:
     def uploaded_bytes(self):
         return self._uploaded_bytes
 
+    @property
+    def send_paths(self) -> list:
+        """How the media has been sent (see BaseSenderType._send_with_strategy)"""
+
+        return self.submission_handler.send_paths if self.submission_handler else []
+
+    @property
+    def media_cache_hit(self):
+        """True if the media has been sent by file_id, False if it was not in the media cache, None if the media
+        can't be cached"""
+
+        return self.submission_handler.media_cache_hit
+
     @property
     def template_keys(self):
         return_list = list()
-        for key in self._submission_dict.keys():
-            if not key.startswith('_') and isinstance(self._submission_dict[key], (datetime.datetime, str, int)):
+        for key, val in self.gen_submission_dict().items():
+            if not key.startswith('_') and isinstance(val, (datetime.datetime, str, int)):
                 return_list.append(key)
 
         return return_list
 
     def __getitem__(self, item):
-        return self._submission_dict[item]
+        return self._placeholder_values[item]
 
     def gen_submission_dict(self):
-        self._submission_dict = dict()
-
-        for key in dir(self._submission):
-            if key.startswith('_'):
-                continue
-
-            val = getattr(self._submission, key)
-            # try to stringify val, otherwise continue
-            try:
-                str(val)
-            except ValueError:
-                continue
+        """Return all the available placeholders and their values. Expensive: templates are filled lazily with
+        only the placeholders they use, this is only needed to list them"""
 
-            self._submission_dict[key] = val
-            if key in KEY_MAPPER_DICT:
-                # replace the key in the dict of the mapping object edits that value
-                self._submission_dict[key] = KEY_MAPPER_DICT[key](val)
-
-        for key in dir(self._subreddit):
-            if key in ('channel', 'style'):
-                continue
-
-            if key.startswith('_') or key in ('DoesNotExist',):
-                continue
-
-            val = getattr(self._subreddit, key)
-            # try to stringify val, otherwise continue
-            try:
-                str(val)  # no need to convert to string, we just have to try to (str.format() will do it later)
-            except ValueError:
-                continue
-
-            self._submission_dict[key] = val
-
-        # noinspection PyTypeChecker
-        self._submission_dict = OrderedDict(sorted(self._submission_dict.items()))
+        return self._placeholder_values.to_dict()
 
     def _get_filled_template(self, base_text: [None, str], accept_none_base_text=True):
         """Fill the passed text with the submission's dict values.
@@ -312,7 +293,7 @@ class Sender:
         elif base_text is None and accept_none_base_text:
             return None
 
-        return base_text.format(**self._submission_dict)
+        return templates_cache.get(base_text).render(self._placeholder_values)
 
     def _generate_reply_markup(self):
         reply_markup = None
@@ -374,6 +355,18 @@ class Sender:
 
         return template
 
+    def prepare(self):
+        """Download/process the media in advance (eg. download and merge a vreddit), so post() only needs to
+        upload it"""
+
+        if not isinstance(self.submission_handler, TextHandler) and not self._subreddit.force_text:
+            self.submission_handler.prepare()
+
+    def discard(self):
+        """Remove the files downloaded by prepare() and not removed by post() (eg. the media has not been posted)"""
+
+        self.submission_handler.discard()
+
     def post(self, chat_id=None):
         if chat_id:
             self.log.info('overriding target chat id (%d) with %d', self.submission_handler.chat_id, chat_id)
@@ -394,7 +387,9 @@ class Sender:
             try:
                 self.debug_text_to_post = caption
                 self._sent_messages = self.submission_handler.post(caption, reply_markup=reply_markup)
-                self._sum_uploaded_bytes(self._sent_messages)
+                if not self.submission_handler.media_cache_hit:
+                    # nothing has been uploaded when we send a media by file_id
+                    self._sum_uploaded_bytes(self._sent_messages)
 
                 return self._sent_messages
             except Exception as e:
@@ -446,63 +441,25 @@ class Sender:
         with db.atomic():
             Post.create(
                 submission_id=self._submission.id,
-                subreddit=self._subreddit,
-                channel=self._subreddit.channel,
+                subreddit=self._subreddit.id,
+                channel=self._subreddit.channel_id,
                 message_id=message_id if self._sent_messages else None,
                 posted_at=u.now() if self._sent_messages else None,
                 uploaded_bytes=self._uploaded_bytes,
                 sent_message=sent_message_json
             )
 
-    def test_filters(self):
-        if self._subreddit.ignore_stickied and self._submission.stickied:
-            self.log.info('tests failed: sticked submission')
+        posts.register_posted(self._subreddit, self._submission.id)
+
+    def test_filters(self, payload_filters=True):
+        """payload_filters=False skips the filters that only depend on the listing data: the stream job tests
+        them with filters.passes_filters() before building the Sender"""
+
+        if payload_filters and not filters.passes_filters(self._subreddit, self._submission, self.log):
             return False
         elif self._subreddit.medias_only and not self._submission.media_type:
             self.log.info('tests failed: submission is a text and we only want media posts')
             return False
-        elif self._subreddit.min_score and isinstance(self._subreddit.min_score, int) and self._subreddit.min_score > self._submission.score:
-            self.log.info('tests failed: not enough upvotes (%d/%d)', self._submission.score, self._subreddit.min_score)
-            return False
-        elif self._subreddit.allow_nsfw is not None and self._subreddit.allow_nsfw == False and self._submission.over_18:
-            self.log.info('tests failed: submission is NSFW')
-            return False
-        elif self._subreddit.hide_spoilers and self._submission.spoiler == True:
-            self.log.info('tests failed: submission is a spoiler')
-            return False
-        elif self._subreddit.ignore_flairless and not self._submission.flair_normalized:
-            self.log.info('tests failed: submission does not have a flair')
-            return False
-        elif self._subreddit.min_upvote_perc and self._submission.upvote_perc < self._subreddit.min_upvote_perc:
-            self.log.info(
-                'tests failed: submission\'s upvote ratio is not good enough (db: %d, submission: %d)',
-                self._subreddit.min_upvote_perc,
-                self._submission.upvote_perc
-            )
-            return False
-        elif self._subreddit.users_blacklist and self._submission.author_username_lower in self._subreddit.get_users_blacklist():
-            self.log.info('tests failed: u/%s is blacklisted in this subreddit', self._submission.author_username_lower)
-            return False
-        elif self._subreddit.ignore_if_newer_than \
-                and isinstance(self._subreddit.ignore_if_newer_than, int) \
-                and self._submission.elapsed_minutes < self._subreddit.ignore_if_newer_than:
-            self.log.info(
-                'tests failed: too new (submitted: %s, elapsed: %s, ignore_if_newer_than: %d)',
-                self._submission.created_utc_formatted,
-                u.pretty_minutes(self._submission.elapsed_minutes),
-                self._subreddit.ignore_if_newer_than
-            )
-            return False
-        elif self._subreddit.ignore_if_older_than \
-                and isinstance(self._subreddit.ignore_if_older_than, int) \
-                and self._submission.elapsed_minutes > self._subreddit.ignore_if_older_than:
-            self.log.info(
-                'tests failed: too old (submitted: %s, elapsed: %s, ignore_if_older_than: %d)',
-                self._submission.created_utc_formatted,
-                u.pretty_minutes(self._submission.elapsed_minutes),
-                self._subreddit.ignore_if_older_than
-            )
-            return False
         else:
             return True
 
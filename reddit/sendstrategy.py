@@ -0,0 +1,168 @@
+import logging
+import random
+import threading
+from urllib.parse import urlparse
+
+from config import config
+from database.queries import send_strategies
+
+logger = logging.getLogger('sp')
+
+URL = 'url'
+UPLOAD = 'upload'
+
+
+def url_domain(url) -> str:
+    return urlparse(url).netloc.lower()
+
+
+class PathStats:
+    __slots__ = ['successes', 'failures', 'success_seconds', 'failure_seconds']
+
+    def __init__(self, successes=0., failures=0., success_seconds=0., failure_seconds=0.):
+        self.successes = successes
+        self.failures = failures
+        self.success_seconds = success_seconds  # average seconds of the successful attempts
+        self.failure_seconds = failure_seconds  # average seconds before an attempt failed
+
+    @property
+    def samples(self):
+        return self.successes + self.failures
+
+    @property
+    def success_rate(self):
+        return self.successes / self.samples if self.samples else 1.
+
+    def add(self, success, seconds, decay):
+        # older outcomes weight less and less, so the stats follow how the host behaves now
+        self.successes *= decay
+        self.failures *= decay
+
+        if success:
+            self.successes += 1
+            self.success_seconds += (seconds - self.success_seconds) / self.successes
+        else:
+            self.failures += 1
+            self.failure_seconds += (seconds - self.failure_seconds) / self.failures
+
+
+class SendStrategies:
+    """Learns, for each media domain and handler type, whether it's faster to send the media by url (and fall back
+    to downloading and uploading it when Telegram can't fetch the url) or to upload it right away.
+
+    The path with the lowest expected latency for each posted media is chosen: sending by url costs its latency
+    when it works, and its failure latency plus an upload when it doesn't; failed uploads count as time spent
+    without posting anything. Until a path has min_samples outcomes, sending by url is tried
+    first (like we always did), and explore_rate of the decisions go to the other path, so a domain that stopped
+    failing (or started to) is noticed. The stats are persisted through the write-behind writer"""
+
+    def __init__(self, explore_rate=0.05, min_samples=5, decay=0.95, upload_seconds=5., enabled=True):
+        self._lock = threading.Lock()
+        self._stats = dict()  # (domain, handler, path) -> PathStats
+        self._explore_rate = explore_rate
+        self._min_samples = min_samples
+        self._decay = decay
+        self._upload_seconds = upload_seconds  # expected upload latency until we have enough samples
+        self.enabled = enabled
+
+    def warm(self):
+        rows = send_strategies.load_all()
+        with self._lock:
+            for row in rows:
+                self._stats[(row.domain, row.handler, row.path)] = PathStats(
+                    row.successes, row.failures, row.success_seconds, row.failure_seconds
+                )
+
+        logger.info('send strategies loaded: %d', len(rows))
+
+    def _path_estimates(self, stats: PathStats) -> tuple:
+        """Return (success rate, seconds of a successful attempt, seconds of a failed attempt). Latencies are only
+        trusted once they have min_samples outcomes, the rate once the path has min_samples attempts"""
+
+        if not stats:
+            return 1., self._upload_seconds, 0.
+
+        rate = stats.success_rate if stats.samples >= self._min_samples else 1.
+        success_seconds = stats.success_seconds if stats.successes >= self._min_samples else self._upload_seconds
+        failure_seconds = stats.failure_seconds if stats.failures else 0.
+
+        return rate, success_seconds, failure_seconds
+
+    def _expected_seconds(self, domain, handler) -> tuple:
+        """Expected seconds spent for each media that actually gets posted, for the two paths. Sending by url is
+        None until it has min_samples attempts"""
+
+        url_stats = self._stats.get((domain, handler, URL), None)
+        upload_stats = self._stats.get((domain, handler, UPLOAD), None)
+
+        upload_rate, upload_success, upload_failure = self._path_estimates(upload_stats)
+        upload_cost = upload_rate * upload_success + (1 - upload_rate) * upload_failure
+        upload_seconds = upload_cost / upload_rate if upload_rate else float('inf')
+
+        if not url_stats or url_stats.samples < self._min_samples:
+            return None, upload_seconds
+
+        # a failed attempt by url is followed by an upload, which might fail too
+        url_rate, url_success, url_failure = self._path_estimates(url_stats)
+        url_cost = url_rate * url_success + (1 - url_rate) * (url_failure + upload_cost)
+        posted_rate = url_rate + (1 - url_rate) * upload_rate
+        url_seconds = url_cost / posted_rate if posted_rate else float('inf')
+
+        return url_seconds, upload_seconds
+
+    def choose(self, domain, handler) -> tuple:
+        """Return (path, whether the path has been chosen to explore it)"""
+
+        if not self.enabled:
+            return URL, False
+
+        with self._lock:
+            url_seconds, upload_seconds = self._expected_seconds(domain, handler)
+
+        best = URL if url_seconds is None or url_seconds <= upload_seconds else UPLOAD
+        if random.random() < self._explore_rate:
+            return (UPLOAD if best == URL else URL), True
+
+        return best, False
+
+    def record(self, domain, handler, path, success, seconds):
+        if not self.enabled:
+            return
+
+        with self._lock:
+            key = (domain, handler, path)
+            if key not in self._stats:
+                self._stats[key] = PathStats()
+
+            stats = self._stats[key]
+            stats.add(success, seconds, self._decay)
+            values = (stats.successes, stats.failures, stats.success_seconds, stats.failure_seconds)
+
+        send_strategies.save(domain, handler, path, *values)
+
+    def stats(self) -> dict:
+        """The currently preferred path of each domain/handler, with the expected seconds of both paths"""
+
+        with self._lock:
+            pairs = {(domain, handler) for domain, handler, _ in self._stats}
+            result = dict()
+            for domain, handler in sorted(pairs):
+                url_seconds, upload_seconds = self._expected_seconds(domain, handler)
+                result['{}/{}'.format(domain, handler)] = dict(
+                    preferred=URL if url_seconds is None or url_seconds <= upload_seconds else UPLOAD,
+                    url_seconds=round(url_seconds, 2) if url_seconds is not None else None,
+                    upload_seconds=round(upload_seconds, 2)
+                )
+
+        return result
+
+
+send_strategies_config = config.jobs.get('send_strategy', {})
+
+send_strategy = SendStrategies(
+    explore_rate=send_strategies_config.get('explore_rate', 0.05),
+    min_samples=send_strategies_config.get('min_samples', 5),
+    decay=send_strategies_config.get('decay', 0.95),
+    upload_seconds=send_strategies_config.get('upload_seconds', 5),
+    enabled=send_strategies_config.get('enabled', True)
+)
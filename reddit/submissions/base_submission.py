@@ -1,25 +1,28 @@
 import logging
+import time
 
 from telegram import Bot
+from telegram import ParseMode
+from telegram import InputMediaPhoto
+from telegram import InputMediaVideo
+from telegram.error import TelegramError
 
 from const import MaxSize
 from utilities import u
-from pyroutils import PyroClient
+from pyroutils import uploader
+from pyroutils import UploadCanceled
+from bot.ratelimiter import rate_limiter
+from utilities.resources import bot_api_uploads
+from utilities import resources
+from .. import mediacache
+from ..mediacache import media_cache
+from .. import sendstrategy
+from ..sendstrategy import send_strategy
 from config import config
 
 logger = logging.getLogger('sp')
 
 
-mtproto = PyroClient(
-    config.pyrogram.session_name,
-    bot_token=config.telegram.token,
-    api_id=config.pyrogram.api_id,
-    api_hash=config.pyrogram.api_hash,
-    workers=config.pyrogram.workers,
-    no_updates=True
-)
-
-
 class BaseSenderType:
     # The EXTERNAL_CONTENT flag signals whether this class is used for url that link to some content which is
     # supposed to be consumed outiside of Reddit. For example, Twitter links and YouTube links are external content,
@@ -35,6 +38,9 @@ class BaseSenderType:
         self._bot: Bot = bot
         self._uploaded_bytes = 0
         self.sent_messages: list = []
+        self.media_cache_hit = None  # None: the media can't be cached (or the cache is disabled)
+        self.send_paths = list()  # how the media has been sent: "url", "url_failed", "upload", "upload_failed", "explored"
+        self._prepare_error = None
 
         if hasattr(subreddit, 'logger'):
             self.log = subreddit.logger
@@ -55,12 +61,133 @@ class BaseSenderType:
     def _entry_point(self, *args, **kwargs):
         raise NotImplementedError('this method must be overridden')
 
-    def post(self, *args, **kwargs):
-        self.sent_messages = self._entry_point(*args, **kwargs)
+    def media_key(self) -> [str, None]:
+        """The key used to look for the media in the media cache (usually the canonical url of the media).
+        None means the media can't be cached"""
+
+        return None
+
+    def _prepare(self):
+        """Override to download/process the media before posting it. Handlers that do not override it do
+        everything in _entry_point()"""
+
+        pass
+
+    def prepare(self):
+        """Download/process the media in advance, so post() only has to upload it. Errors are raised later by post(),
+        so the Sender falls back to a text message as usual"""
+
+        media_key = self.media_key() if mediacache.enabled() else None
+        if media_key and media_key in media_cache:
+            # it will be sent by file_id
+            return
+
+        try:
+            self._prepare()
+        except Exception as e:
+            self._prepare_error = e
+
+    def discard(self):
+        """Override to remove the files downloaded by _prepare(), in case the media will not be posted"""
+
+        pass
+
+    def _send_cached(self, cached, caption, reply_markup=None):
+        if cached.is_media_group:
+            media_group = list()
+            for i, (media_type, file_id) in enumerate(cached.medias):
+                input_media_class = InputMediaPhoto if media_type == 'photo' else InputMediaVideo
+                media_group.append(input_media_class(media=file_id, caption=None if i != 0 else caption, parse_mode=ParseMode.HTML))
+
+            return self._bot.send_media_group(self.chat_id, media=media_group)
+
+        media_type, file_id = cached.medias[0]
+        send_methods = dict(
+            photo=self._bot.send_photo,
+            video=self._bot.send_video,
+            animation=self._bot.send_animation,
+            document=self._bot.send_document
+        )
+
+        return send_methods[media_type](
+            self.chat_id,
+            file_id,
+            caption=caption,
+            parse_mode=ParseMode.HTML,
+            reply_markup=reply_markup
+        )
+
+    def post(self, caption, reply_markup=None):
+        media_key = self.media_key() if mediacache.enabled() else None
+        if media_key:
+            cached = media_cache.get(media_key)
+            self.media_cache_hit = cached is not None
+            if cached:
+                self.log.info('media already uploaded (%s): sending it by file_id', media_key)
+                try:
+                    self.sent_messages = self._send_cached(cached, caption, reply_markup=reply_markup)
+                    self.sent_messages_to_list()
+
+                    return self.sent_messages
+                except TelegramError as e:
+                    self.log.warning('sending by file_id failed (%s), sending the media the usual way...', str(e))
+                    media_cache.invalidate(media_key)
+                    self.media_cache_hit = False
+
+        if self._prepare_error is not None:
+            raise self._prepare_error
+
+        self.sent_messages = self._entry_point(caption, reply_markup=reply_markup)
         self.sent_messages_to_list()
 
+        if media_key:
+            media_cache.store(media_key, self.sent_messages)
+
         return self.sent_messages
 
+    def _send_with_strategy(self, url, send_by_url, send_by_upload, url_failed):
+        """Send the media by url or by uploading it, depending on which one is expected to be faster for the url's
+        domain (see sendstrategy.py). send_by_url and send_by_upload are called without arguments. url_failed(e)
+        tells whether a TelegramError raised by send_by_url means Telegram couldn't fetch the url, and the media
+        has to be uploaded"""
+
+        domain = sendstrategy.url_domain(url)
+        handler = type(self).__name__
+        path, explored = send_strategy.choose(domain, handler)
+        if explored:
+            self.send_paths.append('explored')
+
+        if path == sendstrategy.URL:
+            start = time.perf_counter()
+            try:
+                sent_messages = send_by_url()
+                send_strategy.record(domain, handler, sendstrategy.URL, True, time.perf_counter() - start)
+                self.send_paths.append('url')
+
+                return sent_messages
+            except TelegramError as e:
+                if not url_failed(e):
+                    raise e
+
+                send_strategy.record(domain, handler, sendstrategy.URL, False, time.perf_counter() - start)
+                self.send_paths.append('url_failed')
+                self.log.info('sending by url failed ("%s" error): downloading and uploading the media', str(e))
+        else:
+            self.log.info('%s medias are usually faster to upload than to send by url: uploading the media', domain)
+
+        start = time.perf_counter()
+        try:
+            sent_messages = send_by_upload()
+        except Exception:
+            send_strategy.record(domain, handler, sendstrategy.UPLOAD, False, time.perf_counter() - start)
+            self.send_paths.append('upload_failed')
+            raise
+
+        send_strategy.record(domain, handler, sendstrategy.UPLOAD, True, time.perf_counter() - start)
+        self.send_paths.append('upload')
+
+        return sent_messages
+
     def _sum_uploaded_bytes(self, sent_message):
         uploaded_bytes = u.media_size(sent_message) or 0
         # logger.debug('registering we sent %d bytes (%s)', uploaded_bytes, u.human_readable_size(uploaded_bytes))
@@ -76,7 +203,7 @@ class BaseSenderType:
             kwargs.pop('thumb_path', None)
             kwargs.pop('thumb_bo', None)
 
-            with open(file_path, 'rb') as f:
+            with open(file_path, 'rb') as f, bot_api_uploads.slot():
                 self.log.info('uploading video using the bot API...')
                 return self._bot.send_video(chat_id, f, *args, **kwargs)
         else:
@@ -87,11 +214,24 @@ class BaseSenderType:
 
             self.log.info('uploading video using mtproto (file size: %d (%s), max bot API: %d)...', file_size,
                           u.human_readable_size(file_size), MaxSize.BOT_API)
-            with mtproto:
-                self.log.debug('mtproto upload started at %s', u.now(string='%d/%m/%Y %H:%M:%S'))
-                sent_message = mtproto.upload_video(chat_id, file_path, *args, **kwargs)
-                self.log.debug('mtproto upload ended at %s', u.now(string='%d/%m/%Y %H:%M:%S'))
-
-                # self.log.debug('client.send_video() result: %s', str(sent_message))
-
-                return sent_message
+            # mtproto requests do not go through the bot API, so we have to wait for our turn explicitly
+            rate_limiter.acquire('sendVideo', chat_id)
+            # the upload is run by one of the uploader's workers, using the client that is kept connected
+            upload_job = uploader.submit(chat_id, file_path, *args, **kwargs)
+            upload_timeout = config.pyrogram.get('upload_timeout', 600)
+            try:
+                sent_message = upload_job.wait(timeout=upload_timeout)
+            except TimeoutError:
+                # the worker stops at the next chunk, the caller falls back to a text message as for any other error
+                upload_job.cancel()
+                raise UploadCanceled('mtproto upload not completed in {} seconds'.format(upload_timeout))
+            except BaseException:
+                # interrupted while waiting: don't leave the upload running
+                upload_job.cancel()
+                raise
+            finally:
+                resources.record_wait('mtproto_uploads', upload_job.queued_seconds)
+
+            # self.log.debug('client.send_video() result: %s', str(sent_message))
+
+            return sent_message
@@ -3,10 +3,10 @@ import logging
 from telegram import InputMediaPhoto
 from telegram import ParseMode
 from telegram import TelegramError
-from telegram.error import BadRequest
 
 from .base_submission import BaseSenderType
 from ..downloaders import ImageDownloader
+from utilities.resources import bot_api_uploads
 
 rg_logger = logging.getLogger('reddit_galleries')
 
@@ -35,6 +35,12 @@ class GalleryImagesHandler(BaseSenderType):
 
         return has_valid_medias  # if there is no valid media, fail the test
 
+    def media_key(self):
+        # the album's items, in the same order and with the same limit used by _fetch_urls()
+        media_ids = [item['media_id'] for item in self._submission.gallery_data['items'][:10]]
+
+        return 'reddit_gallery:' + ','.join(media_ids)
+
     @staticmethod
     def _fetch_urls(media_metadata, gallery_data, use_largest_preview=False, limit=10):
         rg_logger.debug('fetching urls (use_largest_preview: %s)', use_largest_preview)
@@ -73,7 +79,7 @@ class GalleryImagesHandler(BaseSenderType):
         return urls
 
     def _send_gallery_images_base(self, media):
-        kwargs = dict(chat_id=self.chat_id, media=media, timeout=360)
+        kwargs = dict(chat_id=self.chat_id, media=media)
         return self._bot.send_media_group(**kwargs)
 
     def send_gallery_images_download(self, caption, reply_markup=None):
@@ -84,7 +90,7 @@ class GalleryImagesHandler(BaseSenderType):
         urls = self._fetch_urls(self._submission.media_metadata)
 
         for url in urls:
-            image = ImageDownloader(url)
+            image = ImageDownloader(url, logger=self.log)
             success = image.download(raise_exception=False)
             if not success:
                 self.log.error('failed to send by url and to download file')
@@ -97,29 +103,32 @@ class GalleryImagesHandler(BaseSenderType):
             # raise an exception if the gallery is empty
             raise ValueError('sending gallery by downloading its images: MediaGroup is empty')
 
-        sent_messages = self._send_gallery_images_base(media=media_group)
+        with bot_api_uploads.slot():
+            sent_messages = self._send_gallery_images_base(media=media_group)
 
         self._sum_uploaded_bytes(sent_messages)
 
         return sent_messages
 
+    @staticmethod
+    def _url_failed(e: TelegramError):
+        # common error (BadRequest): "Group send failed"
+        error_message = str(e).lower()  # works for TelegramError and BadRequest (BadRequest doesn't have .message)
+        return 'failed to get http url content' in error_message or 'wrong file identifier/http url specified' in error_message or 'group send failed' in error_message
+
     def _entry_point(self, caption, reply_markup=None):
-        self.log.info('sending gallery of images by url (gallery url: %s)', self._submission.url)
+        self.log.info('sending gallery of images (gallery url: %s)', self._submission.url)
 
         urls = self._fetch_urls(self._submission.media_metadata, self._submission.gallery_data)
         media_group = [InputMediaPhoto(media=url, caption=None if i != 0 else caption, parse_mode=ParseMode.HTML) for
                        i, url in enumerate(urls)]
 
-        try:
-            sent_messages = self._send_gallery_images_base(media=media_group)
-        except (TelegramError, BadRequest) as e:
-            # if sending by url fails, try to download the images and post them
-            # common error (BadRequest): "Group send failed"
-            error_message = str(e).lower()  # works for TelegramError and BadRequest (BadRequest doesn't have .message)
-            if 'failed to get http url content' not in error_message and 'wrong file identifier/http url specified' not in error_message and 'group send failed' not in error_message:
-                raise e
-
-            self.log.info('sending by url failed ("%s" error): trying to dowload gallery from its urls', error_message)
-            sent_messages = self.send_gallery_images_download(caption=caption, reply_markup=reply_markup)
+        # if sending by url fails, download the images and post them
+        sent_messages = self._send_with_strategy(
+            urls[0] if urls else self._submission.url,
+            send_by_url=lambda: self._send_gallery_images_base(media=media_group),
+            send_by_upload=lambda: self.send_gallery_images_download(caption=caption, reply_markup=reply_markup),
+            url_failed=self._url_failed
+        )
 
         return sent_messages
@@ -2,6 +2,7 @@ from telegram import ParseMode, TelegramError
 
 from ..downloaders import GfycatDownloader
 from .base_submission import BaseSenderType
+from ..mediacache import canonical_url
 
 
 class GfycatHandler(BaseSenderType):
@@ -16,6 +17,9 @@ class GfycatHandler(BaseSenderType):
 
         return False
 
+    def media_key(self):
+        return canonical_url(self._url)
+
     def _send_by_url(self, url, request_kwargs):
         request_kwargs["video"] = url
 
@@ -53,8 +57,7 @@ class GfycatHandler(BaseSenderType):
             height=gfycat.sizes[1],
             thumb=gfycat.get_thumbnail_bo(),
             duration=gfycat.duration,
-            reply_markup=reply_markup,
-            timeout=360
+            reply_markup=reply_markup
         )
 
         try:
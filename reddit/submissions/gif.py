@@ -1,6 +1,7 @@
 from telegram import ParseMode
 
 from .base_submission import BaseSenderType
+from ..mediacache import canonical_url
 
 
 class GifHandler(BaseSenderType):
@@ -21,6 +22,9 @@ class GifHandler(BaseSenderType):
 
         return False
 
+    def media_key(self):
+        return canonical_url(self._url)
+
     def _entry_point(self, caption, reply_markup=None):
         self.log.info('gif url: %s', self._url)
 
@@ -29,6 +33,5 @@ class GifHandler(BaseSenderType):
             self._url,
             caption=caption,
             parse_mode=ParseMode.HTML,
-            reply_markup=reply_markup,
-            timeout=360
+            reply_markup=reply_markup
         )
@@ -7,6 +7,8 @@ from telegram.error import BadRequest
 from utilities import u
 from .base_submission import BaseSenderType
 from ..downloaders import ImageDownloader
+from utilities.resources import bot_api_uploads
+from ..mediacache import canonical_url
 
 
 class ImageHandler(BaseSenderType):
@@ -33,14 +35,16 @@ class ImageHandler(BaseSenderType):
         else:
             return False
 
+    def media_key(self):
+        return canonical_url(self._url)
+
     def _send_image_base(self, image, caption=None, reply_markup=None):
         return self._bot.send_photo(
             self.chat_id,
             photo=image,
             caption=caption,
             parse_mode=ParseMode.HTML,
-            reply_markup=reply_markup,
-            timeout=360
+            reply_markup=reply_markup
         )
 
     def _send_document(self, image, caption=None, reply_markup=None):
@@ -56,26 +60,26 @@ class ImageHandler(BaseSenderType):
             caption=caption,
             filename='large_image' + extension,
             parse_mode=ParseMode.HTML,
-            reply_markup=reply_markup,
-            timeout=360
+            reply_markup=reply_markup
         )
 
     def _send_image_download(self, image_url, caption, reply_markup=None):
         self.log.info('downloading and sending image (image url: %s)', image_url)
 
-        image = ImageDownloader(self._url)
+        image = ImageDownloader(self._url, logger=self.log)
         success = image.download(raise_exception=False)
         if not success:
             # failed to download: raise an exception
             raise BaseException('failed to send by url and to download file')
 
-        try:
-            sent_message = self._send_image_base(image=image.file_bytes, caption=caption, reply_markup=reply_markup)
-        except BadRequest as e:
-            if 'too big for a photo' not in e.message:
-                raise e
+        with bot_api_uploads.slot():
+            try:
+                sent_message = self._send_image_base(image=image.file_bytes, caption=caption, reply_markup=reply_markup)
+            except BadRequest as e:
+                if 'too big for a photo' not in e.message:
+                    raise e
 
-            sent_message = self._send_document(image=image, caption=caption, reply_markup=reply_markup)
+                sent_message = self._send_document(image=image, caption=caption, reply_markup=reply_markup)
 
         image.close()
 
@@ -83,20 +87,22 @@ class ImageHandler(BaseSenderType):
 
         return sent_message
 
+    @staticmethod
+    def _url_failed(e: TelegramError):
+        e_lower = e.message.lower()
+        return 'failed to get http url content' in e_lower or 'wrong file identifier/http url specified' in e_lower or 'wrong type of the web page content' in e_lower
+
     def _entry_point(self, caption, reply_markup=None):
-        self.log.info('sending image by url (image url: %s)', self._url)
+        self.log.info('sending image (image url: %s)', self._url)
 
         start = u.now()
-        try:
-            sent_message = self._send_image_base(image=self._url, caption=caption, reply_markup=reply_markup)
-        except TelegramError as e:
-            # if sending by url fails, try to download the image and post it
-            e_lower = e.message.lower()
-            if 'failed to get http url content' not in e_lower and 'wrong file identifier/http url specified' not in e_lower and 'wrong type of the web page content' not in e_lower:
-                raise e
-
-            self.log.info('sending by url failed: trying to dowload image url')
-            sent_message = self._send_image_download(self._url, caption=caption, reply_markup=reply_markup)
+        # if sending by url fails, download the image and post it
+        sent_message = self._send_with_strategy(
+            self._url,
+            send_by_url=lambda: self._send_image_base(image=self._url, caption=caption, reply_markup=reply_markup),
+            send_by_upload=lambda: self._send_image_download(self._url, caption=caption, reply_markup=reply_markup),
+            url_failed=self._url_failed
+        )
 
         end = u.now()
         self.log.debug('it took %d seconds to send the photo (%s)', (end - start).total_seconds(), self._url)
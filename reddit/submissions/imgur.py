@@ -7,7 +7,9 @@ from imgurpython.helpers.error import ImgurClientError
 
 from ..downloaders import Imgur as ImgurDownloader
 from ..downloaders import FakeImgur as FakeImgurDownloader
+from ..downloaders import media_probes
 from .base_submission import BaseSenderType
+from ..mediacache import canonical_url
 from .image import ImageHandler
 from .gif import GifHandler
 from .video import VideoHandler
@@ -26,7 +28,7 @@ class ImgurGalleryHandler(BaseSenderType):
     def __init__(self, *args, **kwargs):
         BaseSenderType.__init__(self, *args, **kwargs)
 
-        self._urls = imgur.parse_album(self._submission.url)
+        self._urls = media_probes.cached(('imgur_album', self._submission.url), lambda: imgur.parse_album(self._submission.url))
         self._gallery_url = self._submission.url
 
     @staticmethod
@@ -40,8 +42,11 @@ class ImgurGalleryHandler(BaseSenderType):
 
         return False
 
+    def media_key(self):
+        return canonical_url(self._gallery_url)
+
     def _send_album_base(self, media):
-        kwargs = dict(chat_id=self.chat_id, media=media, timeout=360)
+        kwargs = dict(chat_id=self.chat_id, media=media)
         return self._bot.send_media_group(**kwargs)
 
     def _entry_point(self, caption, reply_markup=None):
@@ -86,7 +91,8 @@ class ImgurNonDirectUrl:
     @staticmethod
     def extract_direct_url(url):
         imgur_id = re.search(ImgurNonDirectUrlImageHandler.NON_DIRECT_URL_PATTERN, url, re.I).group(1)
-        direct_url = imgur.get_url(imgur_id)
+        # test() and __init__() both need it: the lookup is cached
+        direct_url = media_probes.cached(('imgur', imgur_id), lambda: imgur.get_url(imgur_id))
 
         return direct_url
 
@@ -23,6 +23,10 @@ class RedditGifHandler(VideoHandler):
 
         return False
 
+    def _prepare(self):
+        # we try to send it by url first: the video is downloaded only if that fails
+        pass
+
     def _entry_point(self, caption, reply_markup=None):
         try:
             return self._bot.send_video(
@@ -30,8 +34,7 @@ class RedditGifHandler(VideoHandler):
                 self._url,
                 caption=caption,
                 parse_mode=ParseMode.HTML,
-                reply_markup=reply_markup,
-                timeout=360
+                reply_markup=reply_markup
             )
         except (BadRequest, TelegramError) as e:
             self.log.info(
@@ -3,12 +3,15 @@ from telegram import ParseMode
 from ..downloaders import Downloader
 from ..downloaders import FileTooBig
 from .base_submission import BaseSenderType
+from utilities.resources import bot_api_uploads
+from ..mediacache import canonical_url
 
 
 class VideoHandler(BaseSenderType):
     def __init__(self, *args, **kwargs):
         BaseSenderType.__init__(self, *args, **kwargs)
         self._url = self._submission.url
+        self._video = None  # set by _prepare()
 
     @staticmethod
     def test(submission):
@@ -18,7 +21,10 @@ class VideoHandler(BaseSenderType):
 
         return False
 
-    def _send_video(self, caption, reply_markup=None):
+    def media_key(self):
+        return canonical_url(self._url)
+
+    def _prepare(self):
         self.log.info('video url: %s', self._url)
 
         video = Downloader(self._url, identifier=self._submission.id)
@@ -35,8 +41,23 @@ class VideoHandler(BaseSenderType):
 
         video.thumbnail_path = 'assets/video_thumb.png'  # generic thumbnail
 
+        self._video = video
+
+    def discard(self):
+        if self._video is not None:
+            self._video.remove(keep_thumbnail=True)
+            # DO NOT DELETE THE GENERIC THUMBNAIL FILE
+            self._video = None
+
+    def _send_video(self, caption, reply_markup=None):
+        if self._video is None:
+            # not prepared in advance
+            self._prepare()
+
+        video = self._video
+
         self.log.debug('opening and sending video...')
-        with open(video.file_path, 'rb') as f:
+        with open(video.file_path, 'rb') as f, bot_api_uploads.slot():
             sent_message = self._bot.send_video(
                 self.chat_id,
                 f,
@@ -47,14 +68,12 @@ class VideoHandler(BaseSenderType):
                 duration=None,
                 parse_mode=ParseMode.HTML,
                 supports_streaming=True,
-                reply_markup=reply_markup,
-                timeout=360
+                reply_markup=reply_markup
             )
         self.log.debug('...upload completed')
 
         self.log.info('removing downloaded files...')
-        video.remove(keep_thumbnail=True)
-        # DO NOT DELETE THE GENERIC THUMBNAIL FILE
+        self.discard()
 
         self._sum_uploaded_bytes(sent_message)
 
@@ -2,9 +2,13 @@ from telegram import ParseMode
 
 from ..downloaders import FileTooBig
 from ..downloaders import VRedditDownloader
+from ..downloaders.vreddit import FfmpegError
+from ..downloaders.vreddit import choose_rendition
 from ..downloaders.vreddit import FfmpegTimeoutError
 from const import MaxSize
+from config import config
 from .base_submission import BaseSenderType
+from ..mediacache import canonical_url
 
 
 class VRedditHandler(BaseSenderType):
@@ -17,6 +21,8 @@ class VRedditHandler(BaseSenderType):
         )
         self._video_duration = self._submission.media['reddit_video']['duration']
         self._submission.is_gif = self._submission.media['reddit_video'].get('is_gif', False)  # some v.reddit might not have audio
+        self._vreddit = None  # set by _prepare()
+        self._file_path = None
 
     @staticmethod
     def test(submission):
@@ -26,11 +32,31 @@ class VRedditHandler(BaseSenderType):
 
         return False
 
-    def _entry_point(self, caption, reply_markup=None):
+    def media_key(self):
+        return canonical_url(self._url)
+
+    def _prepare(self):
         self.log.info('vreddit url: %s', self._url)
 
+        # pick the best rendition that can be uploaded through the bot API, so we can avoid to use pyrogram
+        url = self._url
+        size_budget = config.jobs.get('vreddit_size_budget_mb', MaxSize.BOT_API / 1024 / 1024) * 1024 * 1024
+        if size_budget:
+            rendition = choose_rendition(
+                self._url,
+                height=self._video_size[0],
+                width=self._video_size[1],
+                duration=self._video_duration,
+                budget=size_budget,
+                dash_url=self._submission.media['reddit_video'].get('dash_url', None),
+                has_audio=not self._submission.is_gif,
+                log=self.log
+            )
+            self._video_size = (rendition.height, rendition.width)
+            url = rendition.url
+
         # we set as max_size the max size supported by the bot API, so we can avoid to use pyrogram (see issue #82)
-        vreddit = VRedditDownloader(self._url, thumbnail_url=self._submission.thumbnail, identifier=self._submission.id, max_size=MaxSize.MTPROTO_LIMITED,
+        vreddit = VRedditDownloader(url, thumbnail_url=self._submission.thumbnail, identifier=self._submission.id, max_size=MaxSize.MTPROTO_LIMITED,
                                     logger=self.log)
         self.log.info('vreddit video url: %s', vreddit.url)
         self.log.info('vreddit audio url: %s', vreddit.url_audio)
@@ -62,11 +88,30 @@ class VRedditHandler(BaseSenderType):
             self.log.info('ffmpeg timeout error during the merging of video/audio')
             vreddit.remove()
             raise FfmpegTimeoutError
+        except FfmpegError as e:
+            self.log.info('ffmpeg error during the merging of video/audio: %s', str(e))
+            vreddit.remove()
+            raise
 
         self.log.info('downloading thumbnail from url: %s', vreddit.thumbnail_url)
         vreddit.download_thumbnail()
         self.log.info('thumbnail path: %s', vreddit.thumbnail_path)
 
+        self._vreddit = vreddit
+        self._file_path = file_path
+
+    def discard(self):
+        if self._vreddit is not None:
+            self._vreddit.remove()
+            self._vreddit = None
+
+    def _entry_point(self, caption, reply_markup=None):
+        if self._vreddit is None:
+            # not prepared in advance
+            self._prepare()
+
+        vreddit = self._vreddit
+
         video_args = dict(
             caption=caption,
             parse_mode=ParseMode.HTML,
@@ -76,19 +121,18 @@ class VRedditHandler(BaseSenderType):
             width=self._video_size[1],
             duration=self._video_duration,
             supports_streaming=True,
-            reply_markup=reply_markup,
-            timeout=360
+            reply_markup=reply_markup
         )
 
         sent_message = self._upload_video(
-            self.chat_id, file_path,
+            self.chat_id, self._file_path,
             file_size=vreddit.size,
             force_bot_api=False,  # True is used because of issue #82
             **video_args
         )
 
         self.log.info('removing downloaded files...')
-        vreddit.remove()
+        self.discard()
 
         self._sum_uploaded_bytes(sent_message)
 
@@ -5,6 +5,8 @@ from ..downloaders import YouTubeFileTooBig
 from ..downloaders import YouTubeTooLong
 from ..downloaders import YouTubeIsStreaming
 from .base_submission import BaseSenderType
+from utilities.resources import bot_api_uploads
+from ..mediacache import canonical_url
 
 
 class YouTubeHandler(BaseSenderType):
@@ -13,6 +15,7 @@ class YouTubeHandler(BaseSenderType):
     def __init__(self, *args, **kwargs):
         BaseSenderType.__init__(self, *args, **kwargs)
         self._url = self._submission.url
+        self._ytvideo = None  # set by _prepare()
 
     @staticmethod
     def test(submission, subreddit):
@@ -21,7 +24,10 @@ class YouTubeHandler(BaseSenderType):
 
         return False
 
-    def _entry_point(self, caption, reply_markup=None):
+    def media_key(self):
+        return canonical_url(self._url)
+
+    def _prepare(self):
         self.log.info('youtube video url: %s', self._url)
 
         ytvideo = YouTubeDownloader(self._url, max_duration=self._subreddit.youtube_download_max_duration)
@@ -47,8 +53,22 @@ class YouTubeHandler(BaseSenderType):
 
             raise YouTubeIsStreaming
 
+        self._ytvideo = ytvideo
+
+    def discard(self):
+        if self._ytvideo is not None:
+            self._ytvideo.remove()
+            self._ytvideo = None
+
+    def _entry_point(self, caption, reply_markup=None):
+        if self._ytvideo is None:
+            # not prepared in advance
+            self._prepare()
+
+        ytvideo = self._ytvideo
+
         self.log.debug('opening and sending video...')
-        with open(ytvideo.file_path, 'rb') as f:
+        with open(ytvideo.file_path, 'rb') as f, bot_api_uploads.slot():
             sent_message = self._bot.send_video(
                 self.chat_id,
                 f,
@@ -59,13 +79,12 @@ class YouTubeHandler(BaseSenderType):
                 duration=None,
                 parse_mode=ParseMode.HTML,
                 supports_streaming=True,
-                reply_markup=reply_markup,
-                timeout=360
+                reply_markup=reply_markup
             )
         self.log.debug('...upload completed')
 
         self.log.info('removing downloaded files...')
-        ytvideo.remove()
+        self.discard()
 
         self._sum_uploaded_bytes(sent_message)
 
@@ -0,0 +1,174 @@
+import datetime
+import logging
+import re
+import threading
+from collections import OrderedDict
+from string import Formatter
+
+logger = logging.getLogger('sp')
+
+KEY_MAPPER_DICT = dict(
+    created_utc=lambda timestamp: datetime.datetime.utcfromtimestamp(timestamp),
+    created=lambda timestamp: datetime.datetime.fromtimestamp(timestamp)
+)
+
+# Subreddit attributes that are never used as placeholders (foreign keys would run a query)
+SUBREDDIT_EXCLUDED_KEYS = ('channel', 'style', 'DoesNotExist')
+
+MISSING = object()
+
+
+def _placeholder_keys(text, formatter=Formatter()) -> set:
+    keys = set()
+    for _, field_name, format_spec, _ in formatter.parse(text):
+        if field_name is None:
+            continue
+
+        # "{a.b}" and "{a[0]}" only need "a"
+        root_key = re.split(r'[.\[]', field_name, 1)[0]
+        if root_key and not root_key.isdigit():
+            keys.add(root_key)
+
+        if format_spec:
+            # nested placeholders, eg. "{title:{width}}"
+            keys |= _placeholder_keys(format_spec)
+
+    return keys
+
+
+class CompiledTemplate:
+    """A template parsed once: we know in advance which placeholders it uses, so rendering it only resolves
+    those values"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.keys = frozenset(_placeholder_keys(text))
+
+    def render(self, values) -> str:
+        return self.text.format(**{key: values[key] for key in self.keys if key in values})
+
+
+class TemplatesCache:
+    """Compiled templates keyed by their text, so editing a style (or a template override) doesn't need any
+    explicit invalidation: the new text is simply compiled on its first use"""
+
+    def __init__(self, max_size=512):
+        self._lock = threading.Lock()
+        self._templates = OrderedDict()
+        self._max_size = max_size
+
+    def get(self, text: str) -> CompiledTemplate:
+        with self._lock:
+            compiled = self._templates.get(text, None)
+            if compiled is not None:
+                self._templates.move_to_end(text)
+                return compiled
+
+        compiled = CompiledTemplate(text)  # raises ValueError if the template is malformed
+
+        with self._lock:
+            self._templates[text] = compiled
+            if len(self._templates) > self._max_size:
+                self._templates.popitem(last=False)
+
+        return compiled
+
+
+templates_cache = TemplatesCache()
+
+
+def _stringifiable(val):
+    try:
+        str(val)  # no need to convert to string, we just have to try to (str.format() will do it later)
+        return True
+    except ValueError:
+        return False
+
+
+class SubredditValues:
+    """The placeholders' values taken from the Subreddit. They do not depend on the submission, so all the
+    senders of a subreddit task can share the same instance and resolve each value only once"""
+
+    def __init__(self, subreddit):
+        self._subreddit = subreddit
+        self._values = dict()
+
+    def get(self, key):
+        if key in self._values:
+            return self._values[key]
+
+        val = MISSING
+        if not key.startswith('_') and key not in SUBREDDIT_EXCLUDED_KEYS:
+            val = getattr(self._subreddit, key, MISSING)
+            if val is not MISSING and not _stringifiable(val):
+                val = MISSING
+
+        self._values[key] = val
+
+        return val
+
+    def to_dict(self) -> dict:
+        return_dict = dict()
+        for key in dir(self._subreddit):
+            val = self.get(key)
+            if val is not MISSING:
+                return_dict[key] = val
+
+        return return_dict
+
+
+class PlaceholderValues:
+    """Resolves a template's placeholders lazily from the submission and the subreddit. Subreddit values take
+    precedence over the submission's ones with the same name"""
+
+    def __init__(self, submission, subreddit_values: SubredditValues):
+        self._submission = submission
+        self._subreddit_values = subreddit_values
+        self._values = dict()
+
+    def _submission_value(self, key):
+        if key.startswith('_'):
+            return MISSING
+
+        val = getattr(self._submission, key, MISSING)
+        if val is MISSING or not _stringifiable(val):
+            return MISSING
+
+        if key in KEY_MAPPER_DICT:
+            val = KEY_MAPPER_DICT[key](val)
+
+        return val
+
+    def _resolve(self, key):
+        if key not in self._values:
+            val = self._subreddit_values.get(key)
+            if val is MISSING:
+                val = self._submission_value(key)
+
+            self._values[key] = val
+
+        return self._values[key]
+
+    def __contains__(self, key):
+        return self._resolve(key) is not MISSING
+
+    def __getitem__(self, key):
+        val = self._resolve(key)
+        if val is MISSING:
+            raise KeyError(key)
+
+        return val
+
+    def to_dict(self) -> OrderedDict:
+        """All the available placeholders, sorted by name. Expensive: only meant to list/debug them"""
+
+        return_dict = dict()
+        for key in dir(self._submission):
+            val = self._submission_value(key)
+            if val is not MISSING:
+                return_dict[key] = val
+
+        return_dict.update(self._subreddit_values.to_dict())
+
+        # noinspection PyTypeChecker
+        return OrderedDict(sorted(return_dict.items()))
@@ -1,6 +1,5 @@
 import logging
 import re
-import time
 from functools import wraps
 
 from telegram import Update, Bot
@@ -12,7 +11,7 @@ from database.models import Subreddit
 from database.models import Job
 from database.models import SubredditJob
 from database import db
-from sqlite3 import OperationalError
+from database.writebehind import write_behind
 from utilities import u
 from config import config
 
@@ -121,13 +120,17 @@ def log_start_end_dt(func):
             job_row.save()
 
         Log.job.info(
-            '%s job ended at %s (elapsed seconds: %d (%s), posted messages: %d, uploaded data: %s)',
+            '%s job ended at %s (elapsed seconds: %d (%s), posted messages: %d, uploaded data: %s, media cache hits/misses: %d/%d, resource waits: %s, send paths: %s)',
             context.job.name,
             job_start_dt.strftime(READABLE_TIME_FORMAT),
             elapsed_seconds,
             u.pretty_seconds(elapsed_seconds),
             job_row.posted_messages,
-            u.human_readable_size(job_row.uploaded_bytes)
+            u.human_readable_size(job_row.uploaded_bytes),
+            job_result.media_cache_hits,
+            job_result.media_cache_misses,
+            job_result.resource_waits_string(),
+            job_result.send_paths_string()
         )
 
         if elapsed_seconds > (config.jobs[context.job.name].interval * 60):
@@ -147,74 +150,56 @@ def log_start_end_dt(func):
     return wrapped
 
 
-def time_subreddit_processing(job_name=None):
-    def real_decorator(func):
-        @wraps(func)
-        def wrapped(task, subreddit: Subreddit, bot: Bot, *args, **kwargs):
-            processing_start_dt = u.now(utc=False)
+def subreddit_job_start(subreddit: Subreddit, job_name=None) -> SubredditJob:
+    # the row is inserted in background, and updated by subreddit_job_end() once the same writer inserted it
+    job_row = SubredditJob(subreddit=subreddit.id, subreddit_name=subreddit.name, job_name=job_name, start=u.now(utc=False))
+    write_behind.save(job_row)
 
-            with db.atomic():
-                job_row = SubredditJob(subreddit=subreddit, subreddit_name=subreddit.name, job_name=job_name, start=processing_start_dt)
-                job_row.save()
+    return job_row
 
-            result: JobResult = func(task, subreddit, bot, *args, **kwargs)
 
-            processing_end_dt = u.now(utc=False)
-            job_row.end = processing_end_dt
+def subreddit_job_end(job_row: SubredditJob, subreddit: Subreddit, result: JobResult):
+    processing_end_dt = u.now(utc=False)
+    job_row.end = processing_end_dt
 
-            job_row.posted_messages = result.posted_messages
-            job_row.uploaded_bytes = result.posted_bytes
-            job_row.frontpage_max_depth = result.submissions_max_index if result.submissions_max_index else None
+    job_row.posted_messages = result.posted_messages
+    job_row.uploaded_bytes = result.posted_bytes
+    job_row.frontpage_max_depth = result.submissions_max_index if result.submissions_max_index else None
 
-            elapsed_seconds = (processing_end_dt - processing_start_dt).total_seconds()
-            job_row.duration = elapsed_seconds
+    elapsed_seconds = (processing_end_dt - job_row.start).total_seconds()
+    job_row.duration = elapsed_seconds
 
-            with db.atomic():
-                job_row.save()
+    write_behind.save(job_row)
 
-                subreddit.last_job_datetime = u.now()
-                subreddit.save()
+    # only update the column we changed: the subreddit row is saved by other threads too (and the stream job
+    # passes read-only snapshots)
+    write_behind.execute(
+        Subreddit.update(last_job_datetime=u.now()).where(Subreddit.id == subreddit.id)
+    )
 
-            Log.job.info(
-                'processing time for %s : %d seconds (%s)',
-                subreddit.r_name_with_id,
-                elapsed_seconds,
-                u.pretty_seconds(round(elapsed_seconds, 2))
-            )
+    Log.job.info(
+        'processing time for %s : %d seconds (%s)',
+        subreddit.r_name_with_id,
+        elapsed_seconds,
+        u.pretty_seconds(round(elapsed_seconds, 2))
+    )
 
-            return result
 
-        return wrapped
+def time_subreddit_processing(job_name=None):
+    def real_decorator(func):
+        @wraps(func)
+        def wrapped(task, subreddit: Subreddit, bot: Bot, *args, **kwargs):
+            job_row = subreddit_job_start(subreddit, job_name=job_name)
 
-    return real_decorator
+            result: JobResult = func(task, subreddit, bot, *args, **kwargs)
 
+            subreddit_job_end(job_row, subreddit, result)
 
-def deferred_handle_lock(func):
-    @wraps(func)
-    def wrapped(update, context, *args, **kwargs):
-        while True:
-            try:
-                logger.debug('acquiring DEFERRED lock...')
-                with db.atomic('DEFERRED'):
-                    # http://docs.peewee-orm.com/en/latest/peewee/database.html#set-locking-mode-for-transaction
-
-                    # acquire a peewee deferred lock: a sahred lock is acquired, but as soon as we need to write, it acquires a
-                    # reserved lock. There can only be a reserved lock at time on a database, this means that if a
-                    # function (handler) tries to write while the database is locked, an exception is raised. We
-                    # try to run the handler until the lock is released.
-                    # IMPORTANT: when a job runs, it acquires an 'EXCLUSIVE' lock which locks the database for
-                    # everyone ('except for read uncommitted') so there shouldn't be any issue with jobs being blocked by a lock
-                    # acquired by an handler because the job will acquire a lock when it start
-                    # and will release it only when it ends
-                    return func(update, context, *args, **kwargs)
-            except OperationalError as e:
-                if str(e) == 'database is locked':
-                    logger.info('database is locked, sleeping')
-                    time.sleep(1)
-                else:
-                    raise e
+            return result
 
-    return wrapped
+        return wrapped
+
+    return real_decorator
 
 
 def pass_subreddit_old(answer=False):
@@ -0,0 +1,73 @@
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from config import config
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+def record_wait(name, seconds):
+    waits = getattr(_local, 'waits', None)
+    if waits is not None:
+        waits[name] += seconds
+
+
+@contextmanager
+def recording_waits():
+    """Collect how many seconds the current thread waits for each resource while inside the block"""
+
+    previous = getattr(_local, 'waits', None)
+    _local.waits = defaultdict(float)
+    try:
+        yield _local.waits
+    finally:
+        if previous is not None:
+            for name, seconds in _local.waits.items():
+                previous[name] += seconds
+
+        _local.waits = previous
+
+
+class Resource:
+    """A named pool of slots, to limit how many operations of the same kind (eg. ffmpeg processes) run at
+    the same time across all the threads. slots=0 means unlimited"""
+
+    def __init__(self, name, slots=0):
+        self.name = name
+        self.slots = slots
+        self._semaphore = threading.BoundedSemaphore(slots) if slots else None
+
+    def __repr__(self):
+        return '<Resource {} ({} slots)>'.format(self.name, self.slots or 'unlimited')
+
+    @contextmanager
+    def slot(self):
+        if not self._semaphore:
+            yield
+            return
+
+        start = time.perf_counter()
+        self._semaphore.acquire()
+        waited = time.perf_counter() - start
+
+        record_wait(self.name, waited)
+        if waited > 1:
+            logger.debug('waited %.2f seconds for a %s slot', waited, self.name)
+
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+resources_config = config.get('resources', {})
+
+transcoding = Resource('transcoding', resources_config.get('transcoding_slots', os.cpu_count() or 1))
+bot_api_uploads = Resource('bot_api_uploads', resources_config.get('bot_api_upload_slots', 4))
+downloads = Resource('downloads', resources_config.get('download_slots', 8))
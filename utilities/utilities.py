@@ -2,7 +2,6 @@ import json
 import os
 import re
 from math import floor
-import urllib.request as urllib
 from mimetypes import guess_type
 from typing import Tuple, List
 import pytz
@@ -13,7 +12,6 @@ import datetime
 from html import escape
 from collections import OrderedDict
 
-import requests
 from PIL import Image
 
 from playhouse.shortcuts import model_to_dict
@@ -217,32 +215,6 @@ def human_readable_size(size, precision=2):
     return '%.*f %s' % (precision, size, suffixes[suffix_index])
 
 
-def download_file_stream(url, file_path=None, chunk_size=1024):
-    # https://stackoverflow.com/a/16696317
-
-    r = requests.get(url, stream=True)
-
-    with open(file_path, 'wb') as f:
-        for chunk in r.iter_content(chunk_size=chunk_size):
-            if chunk:  # filter out keep-alive new chunks
-                f.write(chunk)
-                # f.flush() commented by recommendation from J.F.Sebastian
-
-    return file_path
-
-
-def download_file(url, file_path):
-    try:
-        dloaded_file = urllib.urlopen(url)
-        with open(file_path, 'wb') as output:
-            output.write(dloaded_file.read())
-    except Exception as e:
-        logger.info('execption while downloading thumb: %s', str(e), exc_info=True)
-        return None
-
-    return file_path
-
-
 def resize_thumbnail(image_path):
     if not image_path:
         raise FileNotFoundError